@@ -0,0 +1,25 @@
+"""
+ASGI config for callingcards project.
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+The API is served the same by the WSGI and the ASGI applications. Under the
+ASGI application, the async views, eg the downloads in
+:mod:`~callingcards.callingcards.views.AsyncDownloadViews`, wait on the
+storage without holding a worker, so that one worker serves many downloads.
+The streamed responses of the sync views, eg the `?export=` streams and the
+file downloads, are sent a part at a time, as under the WSGI application, see
+:mod:`~callingcards.callingcards.async_streaming`.
+Serve it with an ASGI server, eg with uvicorn workers of gunicorn:
+
+    gunicorn -k uvicorn.workers.UvicornWorker callingcards.asgi:application
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "callingcards.config")
+os.environ.setdefault("DJANGO_CONFIGURATION", "Production")
+
+from configurations.asgi import get_asgi_application  # noqa
+application = get_asgi_application()
@@ -0,0 +1,75 @@
+"""
+.. module:: async_streaming
+   :synopsis: Stream the sync streaming responses of the ASGI application
+
+Under the ASGI application, Django 4.2 reads the content of a streaming
+response whose iterator is sync, eg the `?export=` streams, a `FileResponse`
+or a `Range` download, into memory with `sync_to_async(list)` before it sends
+the first byte. The :class:`AsyncStreamingMiddleware` replaces such an
+iterator with an async one, which reads one part at a time on the thread of
+the request, so that the exports and the downloads are sent in constant
+memory under either application. Under the WSGI application it does nothing.
+
+The middleware is the first of `MIDDLEWARE`, so that it sees the content as
+it is sent, eg after the
+:class:`~callingcards.callingcards.db_router.ReadReplicaMiddleware` wraps it.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-25
+"""
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+
+# returned by next() at the end of an iterator
+_END = object()
+
+
+async def iterate_in_thread(iterator):
+    """Iterate a sync iterator from async code, one part at a time. The parts
+    are read on the thread of the request, since an iterator may read from
+    its database connection, eg a server side cursor.
+
+    :param iterator: a sync iterator, eg the streaming content of a response
+    :type iterator: iterator
+    :return: the parts of the iterator
+    :rtype: async generator
+    """
+    iterator = iter(iterator)
+    read = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            part = await read(iterator, _END)
+            if part is _END:
+                break
+            yield part
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+class AsyncStreamingMiddleware:
+    """
+    Give the sync streaming responses of the ASGI application an async
+    iterator, so that they are not read into memory before they are sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # the WSGI application sends a sync iterator as it is read
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.streaming and not response.is_async:
+            response.streaming_content = \
+                iterate_in_thread(response.streaming_content)
+        return response
@@ -0,0 +1,244 @@
+"""
+.. module:: db_router
+   :synopsis: Send the reads of safe requests to a read replica
+
+If `DATABASES` has a `READ_REPLICA_ALIAS` alias, eg `replica`, the reads of
+`GET` and `HEAD` requests, eg the list, retrieve and export endpoints, of
+views which only read whatever their method, eg `POST /api/v1/batch/`, which
+set `read_replica_safe = True`, and the data loads of
+:func:`~callingcards.callingcards.utils.callingcards_with_metrics.callingcards_with_metrics`,
+are sent to it. Everything else is read from, and every write goes to, the
+primary, `default`:
+
+- a read in a transaction on the primary, eg in an `atomic` block, is read
+  from the primary, so that it reads the writes of the transaction
+- once a request writes, eg when a result is cached, its later reads are
+  read from the primary
+- after a request which writes, or may write, eg a `POST` which is not
+  `read_replica_safe`, the reads of the same client,
+  identified by its token or session, are read from the primary for
+  `READ_REPLICA_PIN_SECONDS`, so that it reads its writes although the
+  replica lags behind the primary
+
+The pins are kept in the `default` cache, which must be shared between the
+processes which serve the requests, eg Redis, since the next request of a
+client is likely served by another process. The `Production` configuration
+fails to start with a replica, `DJANGO_DB_REPLICA_HOST`, and a per process
+cache, ie without `DJANGO_REDIS_URL`.
+
+Reads are sent to the replica in a :func:`read_replica` context, which the
+:class:`ReadReplicaMiddleware` enters for safe requests. Without a replica,
+both do nothing.
+
+.. code-block:: python
+
+    from callingcards.callingcards.db_router import read_replica
+
+    with read_replica():
+        df = pd.DataFrame(Hops.objects.filter(experiment_id=1).values())
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .async_streaming import iterate_in_thread
+
+# the state of the read_replica context, or None outside of one
+_read_replica_state = ContextVar('read_replica_state', default=None)
+
+
+def replica_alias():
+    """
+    :return: the alias of the read replica, or None if it is not configured
+    :rtype: str or None
+    """
+    alias = getattr(settings, 'READ_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_replica(enabled=True):
+    """Send the reads in the context to the read replica, until the context
+    writes. A nested context shares the state of the outer one.
+
+    :param enabled: whether to use the replica, eg False for a client which
+        is pinned to the primary
+    :type enabled: bool
+    """
+    if _read_replica_state.get() is not None:
+        yield
+        return
+    token = _read_replica_state.set({'enabled': enabled, 'wrote': False})
+    try:
+        yield
+    finally:
+        _read_replica_state.reset(token)
+
+
+def read_replica_wrote():
+    """
+    :return: whether the current read_replica context has written
+    :rtype: bool
+    """
+    state = _read_replica_state.get()
+    return bool(state and state['wrote'])
+
+
+class ReadReplicaRouter:
+    """
+    Route the reads of a :func:`read_replica` context to the read replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related records are read from the database of the record
+            return instance._state.db
+        state = _read_replica_state.get()
+        alias = replica_alias()
+        if alias is None or state is None or not state['enabled'] or \
+                state['wrote'] or \
+                connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _read_replica_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is migrated by replication
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReadReplicaMiddleware:
+    """
+    Read safe requests from the read replica, unless the client has written
+    in the last `READ_REPLICA_PIN_SECONDS`. A request of any method to a view
+    with `read_replica_safe = True` is safe. The middleware is async capable,
+    so that it does not move the async views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _pin_key(self, request):
+        """
+        :return: the cache key of the client's pin to the primary, or None
+            if the client is anonymous
+        :rtype: str or None
+        """
+        client = request.META.get('HTTP_AUTHORIZATION') or \
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not client:
+            return None
+        return ('read_replica_pin:' +
+                hashlib.sha256(client.encode('utf-8')).hexdigest())
+
+    def _read_replica_response(self, response):
+        """
+        :return: the response, whose streamed content, eg of an export, which
+            is read as it is sent, is read from the replica
+        :rtype: django.http.HttpResponse
+        """
+        if not response.streaming:
+            return response
+        content = response.streaming_content
+        if response.is_async:
+            async def streaming_content():
+                with read_replica():
+                    async for part in content:
+                        yield part
+        else:
+            def streaming_content():
+                with read_replica():
+                    yield from content
+        response.streaming_content = streaming_content()
+        return response
+
+    def _is_safe(self, request):
+        """
+        :return: whether the request only reads, by its method or its view
+        :rtype: bool
+        """
+        return request.method in self.safe_methods or \
+            getattr(request, 'read_replica_safe', False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Enable the replica for a request whose method is not safe, but
+        whose view only reads, eg the batch endpoint. The view is known once
+        the url is resolved, after the read_replica context is entered."""
+        view = getattr(view_func, 'cls', view_func)
+        if request.method in self.safe_methods or \
+                not getattr(view, 'read_replica_safe', False):
+            return None
+        request.read_replica_safe = True
+        state = _read_replica_state.get()
+        if state is not None and not state['wrote']:
+            pin_key = self._pin_key(request)
+            state['enabled'] = not (pin_key and cache.get(pin_key))
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if replica_alias() is None:
+            return self.get_response(request)
+
+        pin_key = self._pin_key(request)
+        enabled = request.method in self.safe_methods and \
+            not (pin_key and cache.get(pin_key))
+        with read_replica(enabled):
+            response = self.get_response(request)
+            state = _read_replica_state.get()
+        if (state['wrote'] or not self._is_safe(request)) and pin_key:
+            cache.set(pin_key, True, settings.READ_REPLICA_PIN_SECONDS)
+        if state['enabled'] and not state['wrote']:
+            response = self._read_replica_response(response)
+        return response
+
+    async def __acall__(self, request):
+        if replica_alias() is None:
+            return await self.get_response(request)
+
+        pin_key = self._pin_key(request)
+        enabled = request.method in self.safe_methods and \
+            not (pin_key and await cache.aget(pin_key))
+        with read_replica(enabled):
+            response = await self.get_response(request)
+            state = _read_replica_state.get()
+        if (state['wrote'] or not self._is_safe(request)) and pin_key:
+            await cache.aset(pin_key, True,
+                             settings.READ_REPLICA_PIN_SECONDS)
+        if state['enabled'] and not state['wrote']:
+            if response.streaming and not response.is_async:
+                # so that the content is wrapped by the async context, which
+                # runs in one context while it is sent, see async_streaming
+                response.streaming_content = \
+                    iterate_in_thread(response.streaming_content)
+            response = self._read_replica_response(response)
+        return response
@@ -1,11 +1,14 @@
 import django_filters
 from ..models import Background
+from .RegionFilter import RegionFilter
+from .MultiValueFilter import MultiValueCharFilter
 
 
 class BackgroundFilter(django_filters.FilterSet):
-    background_source = django_filters.CharFilter(field_name="source")
+    background_source = MultiValueCharFilter(field_name="source")
+    region = RegionFilter()
 
     class Meta:
         model = Background
         fields = [f.name for f in model._meta.fields if f.name != 'source']
-        fields += ['background_source']
\ No newline at end of file
+        fields += ['background_source', 'region']
\ No newline at end of file
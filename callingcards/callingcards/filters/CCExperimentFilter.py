@@ -1,28 +1,29 @@
 import django_filters
 from ..models import CCExperiment
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class CCExperimentFilter(django_filters.FilterSet):
-    experiment = django_filters.NumberFilter(
+    experiment = MultiValueNumberFilter(
         field_name="id",
         lookup_expr="exact")
-    experiment_id = django_filters.NumberFilter(
+    experiment_id = MultiValueNumberFilter(
         field_name='id',
         lookup_expr='exact'
     )
-    batch = django_filters.CharFilter(
+    batch = MultiValueCharFilter(
         field_name="batch",
         lookup_expr="iexact")
     batch_replicate = django_filters.CharFilter(
         field_name="batch_replicate",
         lookup_expr="iexact")
-    tf_id = django_filters.NumberFilter(
+    tf_id = MultiValueNumberFilter(
         field_name="tf__tf",
         lookup_expr="exact")
-    tf_locus_tag = django_filters.CharFilter(
+    tf_locus_tag = MultiValueCharFilter(
         field_name="tf__tf__locus_tag",
         lookup_expr="iexact")
-    tf_gene = django_filters.CharFilter(
+    tf_gene = MultiValueCharFilter(
         field_name="tf__tf__gene",
         lookup_expr="iexact")
 
@@ -1,12 +1,17 @@
 import django_filters
 from ..models import CallingCardsSig
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class CallingCardsSigFilter(django_filters.FilterSet):
-    tf_id = django_filters.NumberFilter('experiment__tf__tf__id')
-    tf_locus_tag = django_filters.CharFilter('experiment__tf__tf__locus_tag')
-    tf_gene = django_filters.CharFilter('experiment__tf__tf__gene')
-    experiment_id = django_filters.NumberFilter('experiment__id')
+    tf_id = MultiValueNumberFilter('experiment__tf__tf__id')
+    tf_locus_tag = MultiValueCharFilter('experiment__tf__tf__locus_tag')
+    tf_gene = MultiValueCharFilter('experiment__tf__tf__gene')
+    experiment = MultiValueNumberFilter('experiment')
+    experiment_id = MultiValueNumberFilter('experiment__id')
+    hops_source = MultiValueCharFilter('hops_source')
+    background_source = MultiValueCharFilter('background_source')
+    promoter_source = MultiValueCharFilter('promoter_source')
 
     class Meta:
         model = CallingCardsSig
@@ -1,21 +1,22 @@
 import django_filters
 from ..models import ChipExo
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class ChipExoFilter(django_filters.FilterSet):
-    tf_id = django_filters.NumberFilter(
+    tf_id = MultiValueNumberFilter(
         field_name="tf_id",
         lookup_expr="exact")
-    tf_locus_tag = django_filters.CharFilter(
+    tf_locus_tag = MultiValueCharFilter(
         field_name="tf_id__locus_tag",
         lookup_expr="iexact")
-    tf_gene = django_filters.CharFilter(
+    tf_gene = MultiValueCharFilter(
         field_name="tf_id__gene",
         lookup_expr="iexact")
-    target_locus_tag = django_filters.CharFilter(
+    target_locus_tag = MultiValueCharFilter(
         field_name="gene_id__locus_tag",
         lookup_expr="iexact")
-    target_gene = django_filters.CharFilter(
+    target_gene = MultiValueCharFilter(
         field_name="gene_id__gene",
         lookup_expr="iexact")
 
@@ -1,6 +1,8 @@
 import django_filters
 from ..models.mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
 from ..models import Gene
+from .RegionFilter import RegionFilter
+from .MultiValueFilter import MultiValueCharFilter
 
 
 class GeneFilter(django_filters.FilterSet):
@@ -11,15 +13,16 @@ class GeneFilter(django_filters.FilterSet):
         choices=GenonomicCoordinatesMixin.STRAND_CHOICES)
     type = django_filters.CharFilter(lookup_expr='iexact')
     gene_biotype = django_filters.CharFilter(lookup_expr='iexact')
-    locus_tag = django_filters.CharFilter(lookup_expr='iexact')
-    gene = django_filters.CharFilter(lookup_expr='iexact')
+    locus_tag = MultiValueCharFilter(lookup_expr='iexact')
+    gene = MultiValueCharFilter(lookup_expr='iexact')
     source = django_filters.CharFilter(lookup_expr='iexact')
     alias = django_filters.CharFilter(lookup_expr='iexact')
     note = django_filters.CharFilter(lookup_expr='iexact')
+    region = RegionFilter()
 
     class Meta:
         model = Gene
         fields = [
             'chr', 'start', 'end', 'strand', 'type', 'gene_biotype',
-            'locus_tag', 'gene', 'source', 'alias', 'note'
+            'locus_tag', 'gene', 'source', 'alias', 'note', 'region'
         ]
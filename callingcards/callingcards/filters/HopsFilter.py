@@ -1,16 +1,19 @@
 import django_filters
 from ..models import Hops
+from .RegionFilter import RegionFilter
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class HopsFilter(django_filters.FilterSet):
-    tf_id = django_filters.NumberFilter(field_name="experiment__tf__tf__id")
-    tf_locus_tag = django_filters.CharFilter(
+    tf_id = MultiValueNumberFilter(field_name="experiment__tf__tf__id")
+    tf_locus_tag = MultiValueCharFilter(
         field_name="experiment__tf__tf__locus_tag")
-    tf_gene = django_filters.CharFilter(field_name="experiment__tf__tf__gene")
-    experiment = django_filters.CharFilter(field_name="experiment__id")
-    experiment_id = django_filters.CharFilter(field_name="experiment__id")
+    tf_gene = MultiValueCharFilter(field_name="experiment__tf__tf__gene")
+    experiment = MultiValueCharFilter(field_name="experiment__id")
+    experiment_id = MultiValueCharFilter(field_name="experiment__id")
+    region = RegionFilter()
 
     class Meta:
         model = Hops
         fields = ['tf_id', 'tf_locus_tag', 'tf_gene',
-                  'experiment', 'experiment_id']
+                  'experiment', 'experiment_id', 'region']
@@ -1,15 +1,16 @@
 import django_filters
 from ..models import Hops_s3
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class Hops_s3Filter(django_filters.FilterSet):
-    tf_id = django_filters.NumberFilter(field_name="experiment__tf__tf__id")
-    tf_locus_tag = django_filters.CharFilter(
+    tf_id = MultiValueNumberFilter(field_name="experiment__tf__tf__id")
+    tf_locus_tag = MultiValueCharFilter(
         field_name="experiment__tf__tf__locus_tag")
-    tf_gene = django_filters.CharFilter(field_name="experiment__tf__tf__gene")
-    experiment_id = django_filters.CharFilter(field_name="experiment__id")
-    batch = django_filters.CharFilter(field_name="experiment__batch")
-    hops_source = django_filters.CharFilter(field_name="source__source")
+    tf_gene = MultiValueCharFilter(field_name="experiment__tf__tf__gene")
+    experiment_id = MultiValueCharFilter(field_name="experiment__id")
+    batch = MultiValueCharFilter(field_name="experiment__batch")
+    hops_source = MultiValueCharFilter(field_name="source__source")
 
     class Meta:
         model = Hops_s3
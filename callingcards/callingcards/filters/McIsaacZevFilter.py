@@ -1,5 +1,6 @@
 import django_filters
 from ..models import McIsaacZEV
+from .MultiValueFilter import MultiValueCharFilter, MultiValueNumberFilter
 
 
 class McIsaacZevFilter(django_filters.FilterSet):
@@ -17,17 +18,22 @@ class McIsaacZevFilter(django_filters.FilterSet):
     - target_locus_tag: Locus tag of the related gene 
       (case-insensitive partial match)
     - target_gene: Name of the related gene (case-insensitive partial match)
+
+    The id, locus tag and gene filters accept a comma separated list of
+    values, or a repeated param. See MultiValueFilter
     """
-    tf_locus_tag = django_filters.CharFilter(
+    tf_id = MultiValueNumberFilter(field_name="tf_id")
+    gene_id = MultiValueNumberFilter(field_name="gene_id")
+    tf_locus_tag = MultiValueCharFilter(
         field_name="tf_id__locus_tag",
         lookup_expr="iexact")
-    tf_gene = django_filters.CharFilter(
+    tf_gene = MultiValueCharFilter(
         field_name="tf_id__gene",
         lookup_expr="iexact")
-    target_locus_tag = django_filters.CharFilter(
+    target_locus_tag = MultiValueCharFilter(
         field_name="gene_id__locus_tag",
         lookup_expr="iexact")
-    target_gene = django_filters.CharFilter(
+    target_gene = MultiValueCharFilter(
         field_name="gene_id__gene",
         lookup_expr="iexact")
 
@@ -0,0 +1,125 @@
+"""
+.. module:: MultiValueFilter
+   :synopsis: Filters which accept a list of values
+
+The identifier filters of the filtersets, eg `tf_locus_tag`, `experiment_id`
+or `target_gene`, accept a comma separated list of values, or a repeated
+param, or both, so that one request selects a panel of TFs or experiments:
+
+.. code-block:: bash
+
+    curl "https://<host>/api/v1/hops_s3?tf_locus_tag=YJL056C,YBR289W"
+    curl "https://<host>/api/v1/hops_s3?tf_locus_tag=YJL056C&tf_locus_tag=GAL4"
+
+A record matches if it matches any of the values. A single value is filtered
+exactly as before. A list is written as one `IN`, eg `experiment_id IN (1, 2,
+3)`, or `UPPER(locus_tag) IN ('YJL056C', 'YBR289W')` for the case insensitive
+filters, rather than one condition per value. Lists longer than
+`MULTI_VALUE_CHUNK_SIZE` are split into several `IN`, which are ORed, so that
+neither the number of parameters of a statement nor the length of an `IN`
+list which the database planner evaluates grows without bound.
+
+Example usage:
+
+.. code-block:: python
+
+    class HopsFilter(django_filters.FilterSet):
+        tf_locus_tag = MultiValueCharFilter(
+            field_name="experiment__tf__tf__locus_tag",
+            lookup_expr="iexact")
+        experiment_id = MultiValueNumberFilter(field_name="experiment__id")
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import operator
+from functools import reduce
+
+import django_filters
+from django.db.models import CharField, Q
+from django.db.models.functions import Upper
+from django_filters.fields import BaseCSVField
+from django_filters.widgets import BaseCSVWidget
+
+# the maximum number of values in one IN
+MULTI_VALUE_CHUNK_SIZE = 1000
+
+# `<field>__upper__in`, the case insensitive IN
+CharField.register_lookup(Upper)
+
+
+class MultiValueWidget(BaseCSVWidget):
+    """
+    Read the values of every occurrence of a param, each of which may be a
+    comma separated list.
+    """
+
+    def value_from_datadict(self, data, files, name):
+        if hasattr(data, 'getlist'):
+            values = data.getlist(name)
+        else:
+            values = data.get(name)
+            if values is None:
+                values = []
+            elif isinstance(values, (str, int)):
+                values = [values]
+        if not values:
+            return None
+        return [x.strip() for value in values
+                for x in str(value).split(',') if x.strip()]
+
+
+class MultiValueField(BaseCSVField):
+    base_widget_class = MultiValueWidget
+
+
+class MultiValueFilter(django_filters.filters.BaseCSVFilter):
+    """
+    Filter by any of a list of values. `exact` and `iexact` lists are
+    filtered with `IN`, other lookups with one condition per value.
+    """
+    base_field_class = MultiValueField
+    chunk_size = MULTI_VALUE_CHUNK_SIZE
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault(
+            'help_text',
+            'Multiple values may be separated by commas, or the parameter '
+            'repeated.')
+        super().__init__(*args, **kwargs)
+
+    def _chunks(self, values):
+        return [values[i:i + self.chunk_size]
+                for i in range(0, len(values), self.chunk_size)]
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        # remove duplicates, preserving the order
+        value = list(dict.fromkeys(value))
+        if len(value) == 1:
+            query = Q(**{f'{self.field_name}__{self.lookup_expr}': value[0]})
+        elif self.lookup_expr == 'exact':
+            query = reduce(operator.or_,
+                           (Q(**{f'{self.field_name}__in': chunk})
+                            for chunk in self._chunks(value)))
+        elif self.lookup_expr == 'iexact':
+            value = list(dict.fromkeys(str(x).upper() for x in value))
+            query = reduce(operator.or_,
+                           (Q(**{f'{self.field_name}__upper__in': chunk})
+                            for chunk in self._chunks(value)))
+        else:
+            query = reduce(operator.or_,
+                           (Q(**{f'{self.field_name}__{self.lookup_expr}': x})
+                            for x in value))
+        if self.distinct:
+            qs = qs.distinct()
+        return self.get_method(qs)(query)
+
+
+class MultiValueCharFilter(MultiValueFilter, django_filters.CharFilter):
+    pass
+
+
+class MultiValueNumberFilter(MultiValueFilter, django_filters.NumberFilter):
+    pass
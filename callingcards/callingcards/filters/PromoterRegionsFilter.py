@@ -1,5 +1,7 @@
 import django_filters
 from ..models import PromoterRegions
+from .RegionFilter import RegionFilter
+from .MultiValueFilter import MultiValueCharFilter
 
 
 class PromoterRegionsFilter(django_filters.FilterSet):
@@ -15,12 +17,17 @@ class PromoterRegionsFilter(django_filters.FilterSet):
     - target_gene: Associated feature gene name (Foreign key to Gene model)
     - score: Score (0-100)
     - source: Source (either 'not_orf' or 'yiming')
+    - region: regions, eg chrII:100000-200000. See RegionFilter
+
+    The target and promoter_source filters accept a comma separated list of
+    values, or a repeated param. See MultiValueFilter
     """
     chr_ucsc = django_filters.CharFilter('chr__ucsc')
-    target_locus_tag = django_filters.CharFilter(
+    target_locus_tag = MultiValueCharFilter(
         'associated_feature__locus_tag')
-    target_gene = django_filters.CharFilter('associated_feature__gene')
-    promoter_source = django_filters.CharFilter(field_name="source")
+    target_gene = MultiValueCharFilter('associated_feature__gene')
+    promoter_source = MultiValueCharFilter(field_name="source")
+    region = RegionFilter()
 
     class Meta:
         model = PromoterRegions
@@ -34,4 +41,5 @@ class PromoterRegionsFilter(django_filters.FilterSet):
             'score',
             'source',
             'promoter_source',
+            'region',
         ]
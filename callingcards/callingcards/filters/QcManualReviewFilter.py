@@ -1,8 +1,10 @@
 import django_filters
 from ..models import QcManualReview
+from .MultiValueFilter import MultiValueNumberFilter
 
 
 class QcManualReviewFilter(django_filters.FilterSet):
+    experiment = MultiValueNumberFilter()
 
     class Meta:
         model = QcManualReview
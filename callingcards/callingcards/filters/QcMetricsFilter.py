@@ -1,8 +1,10 @@
 import django_filters
 from ..models import QcMetrics
+from .MultiValueFilter import MultiValueNumberFilter
 
 
 class QcMetricsFilter(django_filters.FilterSet):
+    experiment = MultiValueNumberFilter()
 
     class Meta:
         model = QcMetrics
@@ -1,8 +1,10 @@
 import django_filters
 from ..models import QcR1ToR2Tf
+from .MultiValueFilter import MultiValueNumberFilter
 
 
 class QcR1ToR2TfFilter(django_filters.FilterSet):
+    experiment = MultiValueNumberFilter()
 
     class Meta:
         model = QcR1ToR2Tf
@@ -1,9 +1,11 @@
 import django_filters
 from ..models.mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
 from ..models import QcR2ToR1Tf
+from .MultiValueFilter import MultiValueNumberFilter
 
 
 class QcR2ToR1TfFilter(django_filters.FilterSet):
+    experiment = MultiValueNumberFilter()
 
     class Meta:
         model = QcR2ToR1Tf
@@ -1,8 +1,10 @@
 import django_filters
 from ..models import QcTfToTransposon
+from .MultiValueFilter import MultiValueNumberFilter
 
 
 class QcTfToTransposonFilter(django_filters.FilterSet):
+    experiment = MultiValueNumberFilter()
 
     class Meta:
         model = QcTfToTransposon
@@ -0,0 +1,133 @@
+"""
+.. module:: RegionFilter
+   :synopsis: Filter records with genomic coordinates by region
+
+The `RegionFilter` selects the records of a model with genomic coordinates
+(see
+:class:`~callingcards.models.mixins.GenomicCoordinatesMixin.GenonomicCoordinatesMixin`)
+which overlap one or more regions, eg
+
+.. code-block:: bash
+
+    curl "https://<host>/api/v1/background?region=chrII:100000-200000"
+    # several regions, and chromosomes in any ChrMap naming format
+    curl "https://<host>/api/v1/hops?region=chrII:1-5000,NC_001135.5,III:10-20"
+
+A region is `chr:start-end`, with 1-based, inclusive coordinates, or `chr`
+for the whole chromosome. The chromosome may be named in any of the naming
+columns of `ChrMap`, eg ucsc `chrII`, refseq `NC_001134.8` or ensembl `II`.
+
+A record overlaps a region if `start <= region end` and `end >= region
+start`. Since the composite `(chr, start)` index orders records by start
+only, the query also bounds `start` from below by the region start less the
+length of the longest feature in the table. The length is cached per
+:class:`~callingcards.models.TableVersion` of the table, so that a window is
+read with a short range scan of the index.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-22
+"""
+import hashlib
+import json
+import re
+from typing import Optional, Tuple
+
+import django_filters
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, F, Max, Q
+from rest_framework.exceptions import ValidationError
+
+from ..models import ChrMap, TableVersion
+
+REGION_PATTERN = re.compile(
+    r'^(?P<chr>[^:]+?)(?::(?P<start>\d+)-(?P<end>\d+))?$')
+
+
+def parse_region(region: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    :param region: a region, `chr:start-end` or `chr`
+    :type region: str
+    :return: a tuple of (chr, start, end). start and end are None for a
+        whole chromosome
+    :rtype: tuple
+
+    :raises ValidationError: if the region is not valid
+    """
+    match = REGION_PATTERN.match(region.strip())
+    if not match:
+        raise ValidationError(
+            {'region': f'{region} is not a region, eg chrII:100000-200000'})
+    start, end = match.group('start'), match.group('end')
+    if start is not None:
+        start, end = int(start), int(end)
+        if start < 1 or start > end:
+            raise ValidationError(
+                {'region': f'{region}: start must be at least 1 and at '
+                 f'most end'})
+    return match.group('chr'), start, end
+
+
+def chr_ids(name: str) -> list:
+    """
+    :param name: a chromosome name in any ChrMap naming format
+    :type name: str
+    :return: the ids of the matching ChrMap records
+    :rtype: list
+
+    :raises ValidationError: if the chromosome does not exist
+    """
+    query = Q()
+    for field in ChrMap._meta.fields:
+        if isinstance(field, CharField) and not field.choices:
+            query |= Q(**{field.name: name})
+    ids = list(ChrMap.objects.filter(query).values_list('id', flat=True))
+    if not ids:
+        raise ValidationError({'region': f'unknown chromosome {name}'})
+    return ids
+
+
+def max_feature_length(model) -> int:
+    """
+    :param model: a model with genomic coordinates
+    :type model: django.db.models.Model
+    :return: the length, `end - start`, of the longest record in the table.
+        Cached until the table changes
+    :rtype: int
+    """
+    table = model._meta.db_table
+    key_material = json.dumps(TableVersion.objects.stamps([table]),
+                              default=str, sort_keys=True)
+    key = (f'max_feature_length:{table}:'
+           f'{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}')
+    length = cache.get(key)
+    if length is None:
+        length = model.objects.aggregate(
+            length=Max(F('end') - F('start')))['length'] or 0
+        cache.set(key, length, settings.COUNT_CACHE_TIMEOUT)
+    return length
+
+
+class RegionFilter(django_filters.filters.BaseCSVFilter,
+                   django_filters.CharFilter):
+    """
+    Filter records with genomic coordinates to those which overlap any of a
+    comma separated list of regions.
+    """
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        query = Q()
+        length = None
+        for region in value:
+            chr_name, start, end = parse_region(region)
+            region_query = Q(chr_id__in=chr_ids(chr_name))
+            if start is not None:
+                if length is None:
+                    length = max_feature_length(qs.model)
+                region_query &= Q(start__gte=max(start - length, 0),
+                                  start__lte=end,
+                                  end__gte=start)
+            query |= region_query
+        return qs.filter(query)
@@ -0,0 +1,177 @@
+"""
+.. module:: TrigramSearchFilter
+   :synopsis: A SearchFilter which searches related tables through indexes
+
+DRF's `SearchFilter` turns every search field into a case insensitive
+`icontains` lookup, eg `experiment__tf__tf__gene__icontains`, which is
+written with the joins of the path and `UPPER(column::text) LIKE '%term%'`.
+The database reads every row of the joined tables to evaluate it, and
+`icontains` on a number or a date casts the column to text, so that no index
+of it may be used.
+
+The `TrigramSearchFilter` accepts the same `search_fields` and `?search=`
+terms, and writes them differently:
+
+- text fields of related tables are searched in the related table, and the
+  path is followed back with `IN` subqueries of the foreign keys, eg
+  `experiment_id IN (SELECT id FROM cc_experiment WHERE tf_id IN (SELECT id
+  FROM cc_tf WHERE tf_id IN (SELECT id FROM gene WHERE UPPER(gene::text)
+  LIKE UPPER('%GAL4%'))))`. On PostgreSQL, the text columns of `Gene` have a
+  trigram GIN index on `UPPER(column)`, see
+  :data:`~callingcards.models.Gene.TRIGRAM_INDEXED_FIELDS`, so the innermost
+  query is an index scan. On other databases, eg SQLite, the same query is
+  evaluated without the index
+- numbers, ids, uuids and dates are matched exactly, and a term which is not
+  a valid value of the field does not match. A date term, eg `2023-07-21`,
+  matches the date of a datetime field
+
+Fields which go through a many to many or reverse relation, annotations and
+the `@` and `$` prefixes are searched as `SearchFilter` searches them.
+
+Example usage:
+
+.. code-block:: python
+
+    class GeneViewSet(viewsets.ModelViewSet):
+        queryset = Gene.objects.all()
+        filter_backends = [DjangoFilterBackend, TrigramSearchFilter]
+        search_fields = ['locus_tag', 'gene']
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.dateparse import parse_date
+from rest_framework.compat import distinct
+from rest_framework.filters import SearchFilter
+
+# a condition which matches nothing
+NO_MATCH = models.Q(pk__in=[])
+
+
+class TrigramSearchFilter(SearchFilter):
+    """
+    A `SearchFilter` which searches the tables of related text fields
+    through `IN` subqueries, and matches non-text fields exactly.
+    """
+    # the prefixes which the related table search supports
+    indexed_lookups = ('icontains', 'istartswith', 'iexact')
+
+    def search_path(self, queryset, search_field):
+        """Follow the forward foreign keys of a search field.
+
+        :param queryset: the queryset which is searched
+        :type queryset: django.db.models.QuerySet
+        :param search_field: a search field, without a lookup prefix
+        :type search_field: str
+        :return: the list of (model, foreign key) of the path, the model at
+            its end, and the name and field in that model. None if the path
+            may not be searched with subqueries
+        :rtype: tuple or None
+        """
+        if search_field in queryset.query.annotations:
+            return None
+        relations = []
+        opts = queryset.model._meta
+        *path, name = search_field.split(LOOKUP_SEP)
+        for part in path:
+            field = opts.get_field(part)
+            if not (field.many_to_one or field.one_to_one) or \
+                    not field.concrete:
+                return None
+            relations.append((opts.model, field))
+            opts = field.related_model._meta
+        field = opts.get_field(name)
+        if field.is_relation:
+            if not (field.many_to_one or field.one_to_one) or \
+                    not field.concrete:
+                return None
+            # the value of the foreign key column, eg a user id
+            field = field.target_field
+        return relations, opts.model, name, field
+
+    def search_condition(self, name, field, lookup, term):
+        """
+        :param name: the name of the field in its model
+        :type name: str
+        :param field: the field, or the target field of a foreign key
+        :type field: django.db.models.Field
+        :param lookup: the lookup of the search field prefix
+        :type lookup: str
+        :param term: a search term
+        :type term: str
+        :return: the condition of a search term on the field, in its model
+        :rtype: django.db.models.Q
+        """
+        if isinstance(field, (models.CharField, models.TextField)):
+            return models.Q(**{LOOKUP_SEP.join([name, lookup]): term})
+        if isinstance(field, models.DateTimeField):
+            date = parse_date(term)
+            return NO_MATCH if date is None else \
+                models.Q(**{LOOKUP_SEP.join([name, 'date']): date})
+        try:
+            value = field.to_python(term)
+        except ValidationError:
+            return NO_MATCH
+        return NO_MATCH if value is None else models.Q(**{name: value})
+
+    def construct_search_query(self, queryset, search_field, term):
+        """
+        :param queryset: the queryset which is searched
+        :type queryset: django.db.models.QuerySet
+        :param search_field: a search field, eg `^tf__locus_tag`
+        :type search_field: str
+        :param term: a search term
+        :type term: str
+        :return: the condition of the search term on the search field
+        :rtype: django.db.models.Q
+        """
+        lookup = self.lookup_prefixes.get(search_field[0], 'icontains')
+        field_name = search_field[1:] \
+            if search_field[0] in self.lookup_prefixes else search_field
+        path = self.search_path(queryset, field_name) \
+            if lookup in self.indexed_lookups else None
+        if path is None:
+            return models.Q(**{self.construct_search(search_field): term})
+
+        relations, model, name, field = path
+        condition = self.search_condition(name, field, lookup, term)
+        if not relations or condition is NO_MATCH:
+            return condition
+        # the subquery of the last table of the path, followed back to the
+        # first foreign key
+        subquery = model._default_manager.filter(condition)
+        for model, foreign_key in reversed(relations[1:]):
+            subquery = model._default_manager.filter(**{
+                f'{foreign_key.name}__in':
+                subquery.values(foreign_key.target_field.name)})
+        foreign_key = relations[0][1]
+        return models.Q(**{f'{foreign_key.name}__in':
+                           subquery.values(foreign_key.target_field.name)})
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+
+        if not search_fields or not search_terms:
+            return queryset
+
+        base = queryset
+        conditions = []
+        for search_term in search_terms:
+            queries = [
+                self.construct_search_query(queryset, str(search_field),
+                                            search_term)
+                for search_field in search_fields
+            ]
+            conditions.append(reduce(operator.or_, queries))
+        queryset = queryset.filter(reduce(operator.and_, conditions))
+
+        if self.must_call_distinct(queryset, search_fields):
+            queryset = distinct(queryset, base)
+        return queryset
@@ -11,6 +11,8 @@ from .Hops_s3Filter import Hops_s3Filter
 from .HopsFilter import HopsFilter
 from .KemmerenTfkoFilter import KemmerenTfkoFilter
 from .LabFilter import LabFilter
+from .MultiValueFilter import (MultiValueFilter, MultiValueCharFilter,
+                               MultiValueNumberFilter)
 from .McIsaacZevFilter import McIsaacZevFilter
 from .PromoterRegionsFilter import PromoterRegionsFilter
 from .QcManualReviewFilter import QcManualReviewFilter
@@ -18,3 +20,5 @@ from .QcMetricsFilter import QcMetricsFilter
 from .QcR1ToR2TfFilter import QcR1ToR2TfFilter
 from .QcR2ToR1TfFilter import QcR2ToR1TfFilter
 from .QcTfToTransposonFilter import QcTfToTransposonFilter
+from .RegionFilter import RegionFilter
+from .TrigramSearchFilter import TrigramSearchFilter
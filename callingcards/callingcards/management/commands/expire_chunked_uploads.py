@@ -0,0 +1,32 @@
+"""
+.. module:: expire_chunked_uploads
+   :synopsis: Remove the chunked uploads which were abandoned
+
+A pending chunked upload which has not received a chunk for
+`CHUNKED_UPLOAD_EXPIRE_SECONDS` is expired. Run this command periodically,
+eg daily from cron, to delete the expired uploads and their chunks. An
+expired upload is also removed when it is next requested.
+
+Example usage:
+
+.. code-block:: bash
+
+    python manage.py expire_chunked_uploads
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-25
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import ChunkedUpload
+
+
+class Command(BaseCommand):
+    help = ('Delete the pending chunked uploads which have not received a '
+            'chunk for CHUNKED_UPLOAD_EXPIRE_SECONDS, and their chunks.')
+
+    def handle(self, *args, **options):
+        # the chunks are removed by the post_delete signal of each upload
+        deleted, _ = ChunkedUpload.objects.expired().delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'{deleted} expired chunked upload records'))
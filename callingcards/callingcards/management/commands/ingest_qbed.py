@@ -0,0 +1,193 @@
+"""
+.. module:: ingest_qbed
+   :synopsis: Load a directory or manifest of qbed files into Hops_s3
+
+Load a whole sequencing run of qbed files in one command. The files are read,
+validated and counted in a process pool. The TF, experiment and manual review
+records are then resolved, and the files saved to storage, in the main process
+so that concurrent workers do not create duplicate records.
+
+Every attempt is appended to a status file. Files which are already `done` in
+the status file are skipped, so a run may be restarted after a failure. A file
+which fails, whether it is invalid, its records fail to save, or the worker
+which validates it dies, eg killed for its memory, is recorded as `failed` and
+the run continues with the next file.
+
+Example usage:
+
+.. code-block:: bash
+
+    # manifest.tsv has the columns qbed, tf_gene, batch_replicate
+    python manage.py ingest_qbed manifest.tsv --user chasem \\
+        --batch run_1234 --lab mitra --source mitra_lab --chr-format mitra
+
+    # or, a directory of files named like INO2_1.qbed.gz
+    python manage.py ingest_qbed /path/to/run_1234 --user chasem \\
+        --batch run_1234 --lab mitra --source mitra_lab --chr-format mitra
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-12
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...utils.ingest_qbed import (MANIFEST_COLUMNS,
+                                  DEFAULT_FILENAME_PATTERN,
+                                  manifest_from_directory,
+                                  read_manifest,
+                                  read_status,
+                                  append_status,
+                                  validate_qbed_file,
+                                  ingest_qbed_file)
+
+
+def _init_worker():
+    """Set up django in worker processes which are spawned rather than
+        forked"""
+    if not apps.ready:
+        import configurations  # pylint: disable=import-outside-toplevel
+        configurations.setup()
+
+
+class Command(BaseCommand):
+    help = ('Validate and load a directory or manifest of qbed files into '
+            'Hops_s3. Progress is recorded in a status file so that the '
+            'command may be re-run after a failure.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='A manifest (csv or tsv with a `qbed` column, and optionally '
+                 f'any of {MANIFEST_COLUMNS[1:]}) or a directory of qbed '
+                 'files')
+        parser.add_argument(
+            '--user', required=True,
+            help='Username recorded as the uploader')
+        parser.add_argument(
+            '--status-file',
+            help='Path to the status file. Defaults to '
+                 '<manifest>.status.tsv, or ingest_status.tsv in the '
+                 'directory')
+        parser.add_argument(
+            '--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+            help='Number of processes used to validate the qbed files')
+        parser.add_argument(
+            '--pattern', default=DEFAULT_FILENAME_PATTERN,
+            help='Regex with named groups used to get metadata from the '
+                 'filenames when `path` is a directory')
+        # defaults for any metadata not in the manifest
+        for column in MANIFEST_COLUMNS[1:]:
+            parser.add_argument(
+                f'--{column.replace("_", "-")}', dest=column,
+                help=f'{column} for files which do not set it in the manifest')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist as exc:
+            raise CommandError(f'User {options["user"]} does not exist') \
+                from exc
+
+        path = options['path']
+        try:
+            if os.path.isdir(path):
+                manifest = manifest_from_directory(path, options['pattern'])
+                status_file = options['status_file'] or \
+                    os.path.join(path, 'ingest_status.tsv')
+            else:
+                manifest = read_manifest(path)
+                status_file = options['status_file'] or \
+                    f'{os.path.splitext(path)[0]}.status.tsv'
+        except (ValueError, OSError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        for column in MANIFEST_COLUMNS[1:]:
+            if options[column] is not None:
+                manifest[column] = manifest[column].fillna(options[column])
+        missing = [x for x in ['chr_format', 'source']
+                   if manifest[x].isna().any()]
+        if missing:
+            raise CommandError(f'{missing} must be set in the manifest or '
+                               f'on the command line for every file')
+
+        status = read_status(status_file)
+        rows = [
+            {k: v for k, v in row.items() if pd.notna(v)}
+            for row in manifest.to_dict('records')
+            if status.get(row['qbed'], {}).get('status') != 'done']
+
+        self.stdout.write(f'{len(manifest) - len(rows)} of {len(manifest)} '
+                          f'file(s) are already done. Status is recorded '
+                          f'in {status_file}')
+
+        failed = 0
+        for result in self._ingest(rows, user, options['workers']):
+            append_status(status_file, result)
+            if result['status'] == 'done':
+                self.stdout.write(f'{result["qbed"]}: done')
+            else:
+                failed += 1
+                self.stderr.write(self.style.ERROR(
+                    f'{result["qbed"]}: {result["error"]}'))
+
+        if failed:
+            raise CommandError(f'{failed} of {len(rows)} file(s) failed. '
+                               f'Fix the errors and re-run the command to '
+                               f'retry them')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {len(rows)} file(s)'))
+
+    def _ingest(self, rows, user, workers):
+        """Yield a status record for each row. With more than one worker, the
+            files are validated in a process pool and stored as they finish.
+            If a worker dies, the pool is broken, and the files which it had
+            not validated are validated again in a new pool. A file which is
+            being validated when the pool breaks twice is recorded as failed,
+            since it may be the file which kills the workers.
+        """
+        if workers <= 1 or len(rows) <= 1:
+            for row in rows:
+                yield ingest_qbed_file(row, user)
+            return
+
+        broken = {}
+        while rows:
+            retry = []
+            # forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_worker) as executor:
+                futures = {executor.submit(validate_qbed_file,
+                                           row['qbed'],
+                                           row['chr_format']): row
+                           for row in rows}
+                for future in as_completed(futures):
+                    row = futures[future]
+                    try:
+                        hops = future.result()
+                    except BrokenProcessPool as exc:
+                        broken[row['qbed']] = broken.get(row['qbed'], 0) + 1
+                        if broken[row['qbed']] < 2:
+                            retry.append(row)
+                            continue
+                        yield {'qbed': row['qbed'], 'status': 'failed',
+                               'error': f'A worker died while the file was '
+                                        f'validated: {exc}'}
+                        continue
+                    except (ValueError, OSError) as exc:
+                        yield {'qbed': row['qbed'], 'status': 'failed',
+                               'error': str(exc)}
+                        continue
+                    yield ingest_qbed_file(row, user, hops=hops)
+            if retry:
+                self.stderr.write(self.style.WARNING(
+                    f'A worker died. Validating {len(retry)} file(s) again '
+                    f'in a new pool'))
+            rows = retry
@@ -0,0 +1,129 @@
+"""
+.. module:: partition_tables
+   :synopsis: List partition the hops and background tables on PostgreSQL
+
+The `hops` table may be list partitioned by experiment, and the `background`
+table by source, so that reading and deleting the records of an experiment
+touches only its partition. See
+:class:`~callingcards.models.mixins.ListPartitionedMixin.ListPartitionedMixin`.
+
+Partitions of new experiments and sources are created by signals. Run this
+command without arguments to create any which are missing, eg for records
+which were created with raw SQL.
+
+Example usage:
+
+.. code-block:: bash
+
+    # convert the tables. This rewrites and locks the tables
+    python manage.py partition_tables --convert
+
+    # create the missing partitions
+    python manage.py partition_tables
+
+    # drop the hops of experiment 12. The keys of --drop are the ids of the
+    # records of the table's key model, so exactly one --table is required
+    python manage.py partition_tables --table hops --drop 12
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-23
+"""
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, connections
+
+from ...models import (Background, BackgroundSource, CCExperiment, Hops,
+                       TableVersion)
+
+# the partitioned models, by name, and the models of their keys
+PARTITIONED_MODELS = {'hops': (Hops, CCExperiment),
+                      'background': (Background, BackgroundSource)}
+
+
+class Command(BaseCommand):
+    help = ('List partition the hops table by experiment and the background '
+            'table by source, or create the partitions which are missing. '
+            'PostgreSQL only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', nargs='+',
+                            choices=list(PARTITIONED_MODELS),
+                            help='the tables. Defaults to all, except with '
+                            '--drop, which requires exactly one')
+        parser.add_argument('--convert', action='store_true',
+                            help='convert the tables to partitioned tables')
+        parser.add_argument('--drop', nargs='+', metavar='KEY',
+                            help='drop the partitions of these keys, ie the '
+                            'ids of experiments for hops, or of background '
+                            'sources for background, and the records in '
+                            'them')
+
+    def _drop_keys(self, table, keys) -> list:
+        """
+        :return: the keys of --drop, as values of the primary key of the
+            table's key model
+        :rtype: list
+
+        :raises CommandError: if a key is not a valid primary key
+        """
+        pk = PARTITIONED_MODELS[table][1]._meta.pk
+        try:
+            return [pk.to_python(key) for key in keys]
+        except ValidationError as exc:
+            raise CommandError(f'--drop: {exc.messages[0]} The keys of '
+                               f'{table} are ids of '
+                               f'{PARTITIONED_MODELS[table][1].__name__} '
+                               'records') from exc
+
+    def handle(self, *args, **options):
+        tables = options['table'] or list(PARTITIONED_MODELS)
+        drop_keys = None
+        if options['drop']:
+            # the keys of the tables are ids of different models
+            if not options['table'] or len(options['table']) != 1:
+                raise CommandError('--drop requires exactly one --table, '
+                                   'since the keys of each table are ids of '
+                                   'a different model')
+            drop_keys = self._drop_keys(tables[0], options['drop'])
+
+        for table in tables:
+            model, key_model = PARTITIONED_MODELS[table]
+            if connections[router.db_for_write(model)].vendor \
+                    != 'postgresql':
+                raise CommandError('List partitioning requires PostgreSQL')
+
+            if options['convert']:
+                model.convert_to_partitioned()
+            if not model.is_partitioned():
+                raise CommandError(f'{table} is not partitioned. Convert it '
+                                   'with --convert')
+
+            if drop_keys is not None:
+                # every key is checked before any partition is dropped. A
+                # key may be of a deleted record, whose partition was left
+                partitions = model.partitions()
+                existing = set(key_model.objects
+                               .filter(pk__in=drop_keys)
+                               .values_list('pk', flat=True))
+                unknown = [key for key in drop_keys
+                           if key not in existing and
+                           model.partition_name(key) not in partitions]
+                if unknown:
+                    raise CommandError(
+                        f'{table} has neither a {key_model.__name__} record '
+                        f'nor a partition of {unknown}')
+                for key in drop_keys:
+                    if model.drop_partition(key):
+                        self.stdout.write(f'dropped {model.partition_name(key)}')
+                    else:
+                        self.stdout.write(self.style.WARNING(
+                            f'{table} has no partition of {key}'))
+                TableVersion.objects.bump(model)
+                continue
+
+            created = sum(model.create_partition(key) for key in
+                          key_model.objects.values_list('pk', flat=True)
+                          .iterator())
+            self.stdout.write(self.style.SUCCESS(
+                f'{table}: created {created} partitions, '
+                f'{len(model.partitions())} in total'))
@@ -0,0 +1,42 @@
+"""
+.. module:: refresh_qc_summary
+   :synopsis: Rebuild the ExperimentQcSummary table
+
+The summary table is kept up to date by signals. Run this command to build it
+for data which was loaded before the table existed, or which was changed
+outside of the ORM, eg with raw SQL.
+
+Example usage:
+
+.. code-block:: bash
+
+    # rebuild the whole table
+    python manage.py refresh_qc_summary
+
+    # refresh some experiments
+    python manage.py refresh_qc_summary --experiment 1 2 3
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-21
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import ExperimentQcSummary
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the per experiment QC summary which is displayed by the '
+            'QC review dashboard, or refresh the summary of some '
+            'experiments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--experiment', nargs='+', type=int,
+                            help='the ids of the experiments to refresh. '
+                            'Defaults to all, in which case the table is '
+                            'rebuilt')
+
+    def handle(self, *args, **options):
+        ExperimentQcSummary.objects.refresh(options['experiment'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{ExperimentQcSummary.objects.count()} experiment QC summary '
+            'records'))
@@ -14,12 +14,14 @@ who uploaded the data, the date of uploading, and the last modification date
 and user who made the modification, as well as genomic coordinates.
 """
 from django.db import models  # pylint: disable=import-error # noqa # type: ignore
+from django.dispatch import receiver
 
 from .BaseModel import BaseModel
 from .mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
+from .mixins.ListPartitionedMixin import ListPartitionedMixin
 
 
-class Background(GenonomicCoordinatesMixin, BaseModel):
+class Background(ListPartitionedMixin, GenonomicCoordinatesMixin, BaseModel):
     """
     A model for storing background genomic regions.
 
@@ -52,6 +54,9 @@ class Background(GenonomicCoordinatesMixin, BaseModel):
         - modifiedBy: ForeignKey to the user model, representing the user who
           last modified the data.
 
+    On PostgreSQL, the table may be partitioned by source. See
+    :class:`~callingcards.models.mixins.ListPartitionedMixin.ListPartitionedMixin`
+
     Example usage:
 
     .. code-block:: python
@@ -62,6 +67,8 @@ class Background(GenonomicCoordinatesMixin, BaseModel):
         all_backgrounds = Background.objects.all()
 
     """
+    partition_key = 'source_id'
+
     depth = models.PositiveIntegerField()
     source = models.ForeignKey(
         "BackgroundSource",
@@ -71,3 +78,14 @@ class Background(GenonomicCoordinatesMixin, BaseModel):
     class Meta:
         managed = True
         db_table = 'background'
+        indexes = [
+            # range queries, see callingcards.filters.RegionFilter
+            models.Index(fields=['chr', 'start'],
+                         name='background_chr_start_idx'),
+        ]
+
+
+@receiver(models.signals.post_save, sender='callingcards.BackgroundSource')
+def create_background_partition(sender, instance, created=False, raw=False, **kwargs):  # pylint: disable=unused-argument # noqa
+    if created and not raw:
+        Background.create_partition(instance.pk, using=kwargs.get('using'))
@@ -11,12 +11,18 @@ Store information regarding the background data sources in the database, eg
 """
 import logging
 from .BaseModel import BaseModel
+from .mixins.ListPartitionedMixin import PartitionKeyMixin
 from .mixins.ProvidenceMixin import ProvidenceMixin
 
 logger = logging.getLogger(__name__)
 
 
-class BackgroundSource(ProvidenceMixin, BaseModel):
+class BackgroundSource(PartitionKeyMixin, ProvidenceMixin, BaseModel):
+
+    # the background hops of a deleted source are dropped with their
+    # partition
+    partitioned_model = 'Background'
+
     class Meta:
         db_table = 'backgroundsource'
         #ordering = ['source']
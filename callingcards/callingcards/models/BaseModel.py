@@ -11,10 +11,44 @@ used as a base class for other models to inherit from.
 .. date:: 2023-04-17
 """
 from uuid import UUID
-from django.db import models  # pylint: disable=import-error # noqa # type: ignore
+from django.apps import apps  # pylint: disable=import-error # noqa # type: ignore
+from django.db import models, router  # pylint: disable=import-error # noqa # type: ignore
 from django.conf import settings  # pylint: disable=import-error # noqa # type: ignore
 
 
+def bump_deleted_tables(deleted, using) -> None:
+    """Bump the :class:`~callingcards.models.TableVersion` of each BaseModel
+    table which a delete removed rows from, once per table.
+
+    :param deleted: the return of `delete()`, the total and a dictionary of
+        model label -> number of deleted rows, including the cascades
+    :type deleted: tuple
+    :param using: the database alias of the delete
+    :type using: str
+    """
+    tables = [model for model in
+              (apps.get_model(label) for label, count in deleted[1].items()
+               if count)
+              if issubclass(model, BaseModel)]
+    if tables:
+        apps.get_model('callingcards', 'TableVersion')\
+            .objects.bump_on_commit(*tables, using=using)
+
+
+class BaseQuerySet(models.QuerySet):
+    """
+    The QuerySet of BaseModel. Custom QuerySets of BaseModels inherit from
+    it, so that a queryset delete, eg the bulk delete of the admin, bumps the
+    version of each table which it deletes from once, rather than once per
+    row.
+    """
+
+    def delete(self):
+        deleted = super().delete()
+        bump_deleted_tables(deleted, self.db)
+        return deleted
+
+
 class BaseModel(models.Model):
     """
     An abstract base model that includes common fields for tracking the user
@@ -58,5 +92,13 @@ class BaseModel(models.Model):
         on_delete=models.PROTECT,
         related_name='%(class)s_modifiedBy')
 
+    objects = BaseQuerySet.as_manager()
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        deleted = super().delete(using=using, keep_parents=keep_parents)
+        bump_deleted_tables(deleted, using)
+        return deleted
+
     class Meta:
         abstract = True
@@ -11,9 +11,10 @@ were interrogated with calling cards.
 """
 from django.db import models
 from .BaseModel import BaseModel
+from .mixins.ListPartitionedMixin import PartitionKeyMixin
 
 
-class CCExperiment(BaseModel):
+class CCExperiment(PartitionKeyMixin, BaseModel):
     """
     A model for keeping a record of the batches (most likely runs) in which a
     given set of transcription factors were interrogated with calling cards.
@@ -55,6 +56,9 @@ class CCExperiment(BaseModel):
         models.CASCADE,
         db_index=True)
 
+    # the hops of a deleted experiment are dropped with their partition
+    partitioned_model = 'Hops'
+
     def __str__(self):
         return (str(self.batch) + '; '
                 + str(self.tf) + '; '
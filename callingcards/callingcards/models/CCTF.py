@@ -10,10 +10,10 @@ This module defines the `CCTF` model, which is used to store a list of the
 transcription factors interrogated with calling cards.
 """
 from django.db import models
-from .BaseModel import BaseModel
+from .BaseModel import BaseModel, BaseQuerySet
 
 
-class CCTFQuerySet(models.QuerySet):
+class CCTFQuerySet(BaseQuerySet):
     def tf_list(self):
         return self\
             .select_related(
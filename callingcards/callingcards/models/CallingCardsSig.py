@@ -3,20 +3,28 @@
    :synopsis: Model and related functions to store significance data in the 
    form of files in the database.
 
-Store significance data in the form of files in the database.
+Store significance data in the form of files in the database. The files are
+stored by the SHA-256 of their content, and each record is keyed by an
+`input_hash` of the qbed files and sources from which it was calculated, so
+that results for identical inputs are never recalculated. See
+:func:`~callingcards.utils.callingcards_sig_cache.sig_input_hash`.
 
 .. moduleauthor:: Chase Mateusiak
 .. date:: 2023-04-26
 """
 import logging
 from django.db import models
+from django.dispatch import receiver
 from .BaseModel import BaseModel
+from .mixins.ContentAddressedFileMixin import ContentAddressedFileMixin
 from .filepaths.cc_replicate_sig_filepath import cc_replicate_sig_filepath
 
 logger = logging.getLogger(__name__)
 
 
-class CallingCardsSig(BaseModel):
+class CallingCardsSig(ContentAddressedFileMixin, BaseModel):
+    content_addressed_field = 'file'
+
     experiment = models.ForeignKey('CCExperiment',
                                    on_delete=models.CASCADE)
     hops_source = models.ForeignKey('HopsSource',
@@ -27,6 +35,15 @@ class CallingCardsSig(BaseModel):
                                         on_delete=models.CASCADE)
     file = models.FileField(upload_to=cc_replicate_sig_filepath)
     notes = models.CharField(max_length=50, default='none')
+    # SHA-256 of the inputs from which the file was calculated
+    input_hash = models.CharField(max_length=64,
+                                  blank=True,
+                                  default='',
+                                  db_index=True)
+    # the number of rows of the result and the size of the file, so that a
+    # manifest of the results is listed without reading the files
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = 'callingcardssig'
@@ -40,3 +57,9 @@ class CallingCardsSig(BaseModel):
                     'background_source']
         verbose_name = 'CallingCardsSig'
         managed = True
+
+
+@receiver(models.signals.post_delete, sender=CallingCardsSig)
+def remove_file_from_s3(sender, instance, using, **kwargs):
+    # the file is only removed if no other record refers to the same content
+    instance.delete_unreferenced_file(using)
@@ -9,10 +9,10 @@
 """
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator  # pylint: disable=import-error # noqa # type: ignore
-from .BaseModel import BaseModel
+from .BaseModel import BaseModel, BaseQuerySet
 
 
-class ChipExoQuerySet(models.QuerySet):
+class ChipExoQuerySet(BaseQuerySet):
     def with_annotations(self):
         return self\
             .select_related(
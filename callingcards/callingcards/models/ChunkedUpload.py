@@ -0,0 +1,166 @@
+"""
+.. module:: ChunkedUpload
+   :synopsis: Model for tracking files which are uploaded in chunks.
+
+.. moduleauthor:: Chase Mateusiak
+.. date:: 2023-07-14
+
+This module defines the `ChunkedUpload` model. A chunked upload is started
+with the expected size, and optionally the SHA-256, of a file. The chunks are
+written directly to storage under `chunked_uploads/<upload_id>/`, named by
+their byte offset, so that they may be sent in any order, in parallel, and
+re-sent after a dropped connection. See
+:class:`~callingcards.views.mixins.ChunkedUploadMixin.ChunkedUploadMixin`.
+
+Each write of a chunk is saved under a new name, `<offset>.<version>`, and
+the older versions of the offset are then removed, so that parallel writes
+of the same offset do not remove each other's chunk. The latest version of
+an offset is the chunk.
+
+A pending upload which has not received a chunk for
+`CHUNKED_UPLOAD_EXPIRE_SECONDS` is expired. Its chunks are removed with it by
+the `expire_chunked_uploads` command, or when it is next requested.
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .BaseModel import BaseModel, BaseQuerySet
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedUploadQuerySet(BaseQuerySet):
+
+    def expired(self):
+        """
+        :return: the pending uploads which have not been modified for
+            `CHUNKED_UPLOAD_EXPIRE_SECONDS`
+        :rtype: ChunkedUploadQuerySet
+        """
+        return self.filter(
+            status=ChunkedUpload.PENDING,
+            modified__lt=timezone.now() - timedelta(
+                seconds=settings.CHUNKED_UPLOAD_EXPIRE_SECONDS))
+
+
+class ChunkedUpload(BaseModel):
+    """
+    A model for tracking files which are uploaded in chunks.
+
+    Fields:
+        - upload_id: UUIDField, the id used by the client to address the
+          upload
+        - filename: CharField, the name of the file which is being uploaded.
+          This is the name the assembled file is given when it is handed to
+          the upload endpoint
+        - size: BigIntegerField, the size of the complete file in bytes
+        - sha256: CharField, the hex SHA-256 of the complete file. This may
+          be set at initialization or at finalization
+        - status: CharField, one of `pending` or `complete`
+    """
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = ((PENDING, 'pending'),
+                      (COMPLETE, 'complete'))
+
+    upload_id = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False)
+    filename = models.CharField(
+        max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        default='')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING)
+
+    objects = ChunkedUploadQuerySet.as_manager()
+
+    @property
+    def is_expired(self) -> bool:
+        """whether the upload is pending, and has not been modified for
+        `CHUNKED_UPLOAD_EXPIRE_SECONDS`"""
+        return self.status == self.PENDING and \
+            self.modified < timezone.now() - timedelta(
+                seconds=settings.CHUNKED_UPLOAD_EXPIRE_SECONDS)
+
+    @property
+    def chunk_dir(self) -> str:
+        """the storage directory in which the chunks are saved"""
+        return f'chunked_uploads/{self.upload_id}'
+
+    def chunk_path(self, offset: int) -> str:
+        """a new storage path of the chunk which starts at `offset`. The
+        offset is zero padded so that the chunks sort by name, and the
+        version, the time and a random suffix, so that the versions of an
+        offset sort by the time they were written"""
+        return (f'{self.chunk_dir}/{offset:020d}.'
+                f'{time.time_ns():020d}{uuid.uuid4().hex}')
+
+    def _chunk_files(self) -> dict:
+        """
+        :return: a dict of offset to the sorted names of the versions of its
+            chunk in storage
+        :rtype: dict
+        """
+        try:
+            _, files = default_storage.listdir(self.chunk_dir)
+        except FileNotFoundError:
+            return {}
+        versions = {}
+        for name in files:
+            offset = name.split('.', 1)[0]
+            if offset.isdigit():
+                versions.setdefault(int(offset), []).append(name)
+        return {offset: sorted(names) for offset, names in versions.items()}
+
+    def chunks(self) -> list:
+        """
+        :return: a sorted list of (offset, size, storage path) of the latest
+            version of each chunk in storage
+        :rtype: list
+        """
+        chunks = []
+        for offset, names in sorted(self._chunk_files().items()):
+            path = f'{self.chunk_dir}/{names[-1]}'
+            chunks.append((offset, default_storage.size(path), path))
+        return chunks
+
+    def remove_older_chunks(self, offset: int, path: str) -> None:
+        """remove the versions of the chunk at `offset` which are older than
+        the version at `path`. Of parallel writes of an offset, the latest
+        version is kept"""
+        for name in self._chunk_files().get(offset, []):
+            if f'{self.chunk_dir}/{name}' < path:
+                default_storage.delete(f'{self.chunk_dir}/{name}')
+
+    def delete_chunks(self) -> None:
+        """remove all chunks from storage"""
+        for names in self._chunk_files().values():
+            for name in names:
+                default_storage.delete(f'{self.chunk_dir}/{name}')
+
+    def __str__(self):
+        return f'{self.filename}; {self.upload_id}; {self.status}'
+
+    class Meta:
+        managed = True
+        db_table = 'chunked_upload'
+
+
+@receiver(models.signals.post_delete, sender=ChunkedUpload)
+def remove_chunks_from_storage(sender, instance, using, **kwargs):
+    instance.delete_chunks()
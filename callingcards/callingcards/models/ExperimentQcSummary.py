@@ -0,0 +1,297 @@
+"""
+.. module:: ExperimentQcSummary
+   :synopsis: Denormalized, per experiment summary of the QC tables
+
+.. moduleauthor:: Chase Mateusiak
+.. date:: 2023-07-21
+
+This module defines the `ExperimentQcSummary` model, one row per
+`CCExperiment`, which holds the values displayed on the QC review dashboard:
+the TF alias, the hop counts of the experiment's `Hops_s3` record, the
+edit distance with the maximum tally in `QcR1ToR2Tf` and `QcR2ToR1Tf`, the
+mapped/unmapped ratio from `QcMetrics` and the `QcManualReview` fields.
+
+Calculating these when the dashboard is loaded requires five correlated
+subqueries per experiment. Instead, the rows of an experiment are refreshed
+by the signal receivers at the bottom of this module whenever a record
+which they are calculated from is saved, deleted or bulk loaded, and the
+dashboard reads the table with a single join on its primary key.
+
+The rows of experiments which were loaded before the table existed, or
+outside of the ORM, are created when the dashboard is first loaded, see
+:meth:`ExperimentQcSummaryQuerySet.refresh_missing`. To build, or rebuild,
+the whole table for existing data:
+
+.. code-block:: bash
+
+    python manage.py refresh_qc_summary
+
+.. seealso:: :class:`callingcards.views.QcReviewViewSet`,
+    :class:`callingcards.views.QcR1ToR2TfSummaryViewSet`
+"""
+import logging
+from typing import Iterable, Optional
+
+from django.db import models, router, transaction
+from django.db.models import (Case, When, F, Value, CharField, OuterRef,
+                              Subquery)
+from django.db.models.functions import Coalesce, NullIf
+from django.dispatch import receiver
+
+from .CCExperiment import CCExperiment
+from .CCTF import CCTF
+from .Gene import Gene
+from .Hops_s3 import Hops_s3
+from .QcManualReview import QcManualReview
+from .QcMetrics import QcMetrics
+from .QcR1ToR2Tf import QcR1ToR2Tf
+from .QcR2ToR1Tf import QcR2ToR1Tf
+from .TableVersion import TableVersion, bulk_loaded
+
+logger = logging.getLogger(__name__)
+
+# the fields which are calculated from the experiment and its QC records
+SUMMARY_FIELDS = ['tf_alias', 'tf_locus_tag', 'batch', 'batch_replicate',
+                  'genomic_hops', 'mito_hops', 'plasmid_hops',
+                  'r1_r2_max_tally', 'r1_r2_max_tally_edit_dist',
+                  'r2_r1_max_tally', 'r2_r1_max_tally_edit_dist',
+                  'map_unmap_ratio', 'rank_recall', 'chip_better',
+                  'data_usable', 'passing_replicate', 'note']
+
+
+def _first(queryset, field):
+    """The value of `field` on the first record, by id, of an experiment"""
+    return Subquery(queryset.filter(experiment_id=OuterRef('pk'))
+                    .order_by('id').values(field)[:1])
+
+
+def _max_tally_edit_dist(model):
+    return Subquery(model.objects.filter(experiment_id=OuterRef('pk'))
+                    .order_by('-tally').values('edit_dist')[:1])
+
+
+def _max_tally(model):
+    return Subquery(model.objects.filter(experiment_id=OuterRef('pk'))
+                    .order_by('-tally').values('tally')[:1])
+
+
+class ExperimentQcSummaryQuerySet(models.QuerySet):
+    """Custom QuerySet for the ExperimentQcSummary model."""
+
+    def calculate(self, experiment_ids: Optional[Iterable[int]] = None):
+        """Calculate the summary rows from the QC tables.
+
+        :param experiment_ids: the experiments to calculate. Defaults to all
+        :type experiment_ids: iterable, optional
+        :return: a values queryset with `experiment_id` and the
+            `SUMMARY_FIELDS`
+        :rtype: django.db.models.QuerySet
+        """
+        experiments = CCExperiment.objects.all()
+        if experiment_ids is not None:
+            experiments = experiments.filter(pk__in=experiment_ids)
+        metrics = QcMetrics.objects.all()
+        review = QcManualReview.objects.all()
+        return experiments.annotate(
+            experiment_id=F('id'),
+            tf_alias=Case(
+                When(tf__tf__gene__istartswith='unknown',
+                     then=F('tf__tf__locus_tag')),
+                default=F('tf__tf__gene'),
+                output_field=CharField()),
+            tf_locus_tag=F('tf__tf__locus_tag'),
+            genomic_hops=_first(Hops_s3.objects.all(), 'genomic_hops'),
+            mito_hops=_first(Hops_s3.objects.all(), 'mito_hops'),
+            plasmid_hops=_first(Hops_s3.objects.all(), 'plasmid_hops'),
+            r1_r2_max_tally=_max_tally(QcR1ToR2Tf),
+            r1_r2_max_tally_edit_dist=_max_tally_edit_dist(QcR1ToR2Tf),
+            r2_r1_max_tally=_max_tally(QcR2ToR1Tf),
+            r2_r1_max_tally_edit_dist=_max_tally_edit_dist(QcR2ToR1Tf),
+            # 0 when unmapped is 0, to avoid dividing by 0
+            map_unmap_ratio=Coalesce(
+                _first(metrics, 'genome_mapped') /
+                NullIf(_first(metrics, 'unmapped'), 0),
+                Value(0)),
+            rank_recall=_first(review, 'rank_recall'),
+            chip_better=_first(review, 'chip_better'),
+            data_usable=_first(review, 'data_usable'),
+            passing_replicate=_first(review, 'passing_replicate'),
+            note=_first(review, 'note'),
+        ).values('experiment_id', *SUMMARY_FIELDS)
+
+    def refresh(self, experiment_ids: Optional[Iterable[int]] = None,
+                create: bool = True) -> None:
+        """Recalculate the summary rows of some, or all, experiments.
+
+        :param experiment_ids: the experiments to refresh. Defaults to all, in
+            which case the table is rebuilt
+        :type experiment_ids: iterable, optional
+        :param create: whether to create the rows of experiments which do not
+            have one. This is False while records are being deleted, when the
+            experiment may itself be about to be deleted
+        :type create: bool
+        """
+        if experiment_ids is not None:
+            experiment_ids = set(experiment_ids)
+            if not experiment_ids:
+                return
+        rows = {row['experiment_id']: row
+                for row in self.calculate(experiment_ids)}
+
+        with transaction.atomic(using=self.db):
+            if experiment_ids is None:
+                self.all().delete()
+                existing = set()
+            else:
+                existing = set(self.filter(experiment_id__in=experiment_ids)
+                               .values_list('experiment_id', flat=True))
+                self.filter(experiment_id__in=experiment_ids - set(rows))\
+                    .delete()
+            self.bulk_update(
+                [self.model(**row) for pk, row in rows.items()
+                 if pk in existing],
+                SUMMARY_FIELDS)
+            if create:
+                self.bulk_create(
+                    [self.model(**row) for pk, row in rows.items()
+                     if pk not in existing],
+                    batch_size=5000)
+        logger.debug('refreshed the QC summary of %s experiments',
+                     len(rows))
+        TableVersion.objects.bump(self.model)
+
+    def refresh_missing(self) -> int:
+        """Create the rows of the experiments which do not have one, eg which
+        were loaded before the table existed, or with raw SQL, so that the
+        dashboard does not hide them.
+
+        :return: the number of rows which were created
+        :rtype: int
+        """
+        missing = list(CCExperiment.objects
+                       .filter(qc_summary__isnull=True)
+                       .values_list('id', flat=True))
+        if missing:
+            logger.info('creating the missing QC summary of %s experiments',
+                        len(missing))
+            # written to, and in a transaction on, the primary, also when
+            # the experiments are read from a read replica
+            self.using(router.db_for_write(self.model)).refresh(missing)
+        return len(missing)
+
+
+class ExperimentQcSummary(models.Model):
+    """
+    A model which stores the QC summary of a `CCExperiment`. The rows are
+    maintained by signals and should not be edited.
+
+    Fields:
+        - experiment: OneToOneField to CCExperiment, the primary key
+        - tf_alias: the TF gene name, or the locus tag if the gene name is
+          unknown
+        - tf_locus_tag: the TF locus tag
+        - batch, batch_replicate: copied from the experiment
+        - genomic_hops, mito_hops, plasmid_hops: from the experiment's first
+          Hops_s3 record
+        - r1_r2_max_tally, r1_r2_max_tally_edit_dist: the maximum tally in
+          QcR1ToR2Tf, and its edit distance
+        - r2_r1_max_tally, r2_r1_max_tally_edit_dist: the same for QcR2ToR1Tf
+        - map_unmap_ratio: genome_mapped / unmapped from QcMetrics
+        - rank_recall, chip_better, data_usable, passing_replicate, note:
+          from QcManualReview
+    """
+    experiment = models.OneToOneField(
+        CCExperiment,
+        models.CASCADE,
+        primary_key=True,
+        related_name='qc_summary')
+    tf_alias = models.CharField(max_length=20, null=True)
+    tf_locus_tag = models.CharField(max_length=20, null=True)
+    batch = models.CharField(max_length=15)
+    batch_replicate = models.PositiveSmallIntegerField()
+    genomic_hops = models.PositiveIntegerField(null=True)
+    mito_hops = models.PositiveIntegerField(null=True)
+    plasmid_hops = models.PositiveIntegerField(null=True)
+    r1_r2_max_tally = models.IntegerField(null=True)
+    r1_r2_max_tally_edit_dist = models.PositiveSmallIntegerField(null=True)
+    r2_r1_max_tally = models.IntegerField(null=True)
+    r2_r1_max_tally_edit_dist = models.PositiveSmallIntegerField(null=True)
+    map_unmap_ratio = models.FloatField(null=True)
+    rank_recall = models.CharField(max_length=10, null=True)
+    chip_better = models.CharField(max_length=10, null=True)
+    data_usable = models.CharField(max_length=10, null=True)
+    passing_replicate = models.CharField(max_length=10, null=True)
+    note = models.CharField(max_length=100, null=True)
+
+    objects = ExperimentQcSummaryQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.experiment_id}'
+
+    class Meta:
+        db_table = 'experiment_qc_summary'
+        indexes = [
+            # the order of the QC review dashboard
+            models.Index(fields=['tf_alias', 'batch', 'batch_replicate'],
+                         name='qc_summary_dashboard_idx'),
+        ]
+
+
+# models whose records have an `experiment` from which the summary is
+# calculated
+EXPERIMENT_QC_MODELS = (Hops_s3, QcManualReview, QcMetrics,
+                        QcR1ToR2Tf, QcR2ToR1Tf)
+
+
+@receiver(models.signals.post_save, sender=CCExperiment)
+def refresh_experiment_qc_summary(sender, instance, raw=False, **kwargs):  # pylint: disable=unused-argument # noqa
+    if not raw:
+        ExperimentQcSummary.objects.refresh([instance.pk])
+
+
+def refresh_qc_summary_of_record(sender, instance, **kwargs):  # pylint: disable=unused-argument # noqa
+    """Refresh the summary of the experiment of a QC record which has been
+    saved or deleted."""
+    if kwargs.get('raw', False):
+        return
+    ExperimentQcSummary.objects.refresh(
+        [instance.experiment_id],
+        create=kwargs.get('created') is not None)
+
+
+# connected per model, so that the deletes of other models may be fast
+# deletes, see TableVersion
+for qc_model in EXPERIMENT_QC_MODELS:
+    models.signals.post_save.connect(refresh_qc_summary_of_record,
+                                     sender=qc_model)
+    models.signals.post_delete.connect(refresh_qc_summary_of_record,
+                                       sender=qc_model)
+
+
+@receiver(models.signals.post_save, sender=CCTF)
+def refresh_qc_summary_of_cctf(sender, instance, raw=False, **kwargs):  # pylint: disable=unused-argument # noqa
+    if not raw:
+        ExperimentQcSummary.objects.refresh(
+            CCExperiment.objects.filter(tf=instance)
+            .values_list('id', flat=True))
+
+
+@receiver(models.signals.post_save, sender=Gene)
+def refresh_qc_summary_of_gene(sender, instance, raw=False, created=False, **kwargs):  # pylint: disable=unused-argument # noqa
+    # a new gene cannot be the TF of an existing experiment
+    if not raw and not created:
+        ExperimentQcSummary.objects.refresh(
+            CCExperiment.objects.filter(tf__tf=instance)
+            .values_list('id', flat=True))
+
+
+@receiver(bulk_loaded)
+def refresh_qc_summary_of_bulk_load(sender, objs=None, **kwargs):  # pylint: disable=unused-argument # noqa
+    if sender not in EXPERIMENT_QC_MODELS + (CCExperiment,):
+        return
+    if objs is None:
+        ExperimentQcSummary.objects.refresh()
+    else:
+        ExperimentQcSummary.objects.refresh(
+            {obj.pk if sender is CCExperiment else obj.experiment_id
+             for obj in objs})
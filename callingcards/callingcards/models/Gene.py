@@ -10,10 +10,95 @@ annotations for genes, including the `chr`, `start`, `end`, `strand`, `type`,
 .. moduleauthor:: Chase Mateusiak
 .. date:: 2023-04-21
 """
-from django.db import models
-from .BaseModel import BaseModel
+import logging
+
+from django.db import models, connections, transaction, DEFAULT_DB_ALIAS
+from django.db.utils import DatabaseError
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .BaseModel import BaseModel, BaseQuerySet
 from .mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
 
+# fields which receive a `unknown_<n>` placeholder when left at the default
+PLACEHOLDER_FIELDS = ('locus_tag', 'gene', 'alias')
+
+# columns which, on PostgreSQL, have a trigram GIN index on UPPER(column).
+# This is the expression of the case insensitive lookups, eg icontains, so
+# that a search, see callingcards.filters.TrigramSearchFilter, reads the index
+# rather than the table
+TRIGRAM_INDEXED_FIELDS = ('locus_tag', 'gene')
+
+logger = logging.getLogger(__name__)
+
+
+class GeneQuerySet(BaseQuerySet):
+    """
+    A queryset for the Gene model which provides a bulk ingestion path that
+    produces the same `unknown_<n>` placeholders as :meth:`Gene.save`.
+
+    Example usage:
+
+    .. code-block:: python
+
+        from callingcards.models import Gene
+
+        # load a genome's worth of features in a single pass
+        Gene.objects.bulk_create(gene_instance_list, batch_size=5000)
+    """
+
+    def reserve_ids(self, count: int) -> list:
+        """Reserve `count` primary keys for new Gene records in a single
+        query.
+
+        On PostgreSQL, the ids are drawn from the table's sequence, so they
+        are guaranteed to be the ids of the inserted rows. On other backends,
+        the ids are the `count` integers following the current maximum id,
+        which is the same calculation that :meth:`Gene.save` performs for a
+        single record.
+
+        :param count: the number of ids to reserve
+        :type count: int
+        :return: a list of reserved ids, in ascending order
+        :rtype: list
+        """
+        if count < 1:
+            return []
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            table = self.model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                    "FROM generate_series(1, %s)",
+                    [table, count])
+                return sorted(row[0] for row in cursor.fetchall())
+        max_id = self.aggregate(models.Max('id'))['id__max'] or 0
+        return list(range(max_id + 1, max_id + 1 + count))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Overrides the default bulk_create to assign the `unknown_<n>`
+        placeholders for the `locus_tag`, `gene` and `alias` fields in one
+        pass over the objects, rather than running an aggregate per record
+        as :meth:`Gene.save` does. Objects without a primary key are assigned
+        one of the reserved ids, and the placeholder number is that id.
+        """
+        objs = list(objs)
+        new_objs = [obj for obj in objs if obj.pk is None]
+        reserved_ids = self.reserve_ids(len(new_objs))
+        # only the sequence reservation guarantees that the reserved id will
+        # be the id of the inserted row
+        set_pk = connections[self.db].vendor == 'postgresql'
+        for obj, reserved_id in zip(new_objs, reserved_ids):
+            if set_pk:
+                obj.pk = reserved_id
+            for field in PLACEHOLDER_FIELDS:
+                if getattr(obj, field) == 'unknown':
+                    setattr(obj, field, f'unknown_{reserved_id}')
+
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Gene(GenonomicCoordinatesMixin, BaseModel):
     """
@@ -53,6 +138,8 @@ class Gene(GenonomicCoordinatesMixin, BaseModel):
         all_genes = Gene.objects.all()
 
     """
+    objects = GeneQuerySet.as_manager()
+
     type = models.CharField(
         max_length=30,
         default='unknown'
@@ -87,7 +174,9 @@ class Gene(GenonomicCoordinatesMixin, BaseModel):
         """
         Overrides the default save method to automatically generate a unique
         integer to append to the `locus_tag`, `gene`, and `alias` fields if
-        they are left blank on input.
+        they are left blank on input. Note that this runs an aggregate over
+        the table on every save -- use :meth:`GeneQuerySet.bulk_create` to
+        load many records.
         """
         # Get the maximum value of the auto-incremented field in the table
         max_id = Gene.objects.aggregate(models.Max('id'))['id__max'] or 0
@@ -112,3 +201,36 @@ class Gene(GenonomicCoordinatesMixin, BaseModel):
     class Meta:
         managed = True
         db_table = 'gene'
+        indexes = [
+            # range queries, see callingcards.filters.RegionFilter
+            models.Index(fields=['chr', 'start'],
+                         name='gene_chr_start_idx'),
+        ]
+
+
+@receiver(post_migrate)
+def create_trigram_indexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):  # pylint: disable=unused-argument # noqa
+    """Create the trigram indexes of `TRIGRAM_INDEXED_FIELDS` after the
+    callingcards app is migrated. These require the `pg_trgm` extension, and
+    are skipped, with a warning, if it may not be created."""
+    connection = connections[using]
+    if getattr(sender, 'label', None) != 'callingcards' or \
+            connection.vendor != 'postgresql':
+        return
+    table = Gene._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError as exc:
+            logger.warning('the trigram indexes of %s were not created, '
+                           'since the pg_trgm extension is not '
+                           'available: %s', table, exc)
+            return
+        for field in TRIGRAM_INDEXED_FIELDS:
+            column = Gene._meta.get_field(field).column
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                f'ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)')
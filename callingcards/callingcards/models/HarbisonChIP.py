@@ -11,11 +11,11 @@ for the Harbison lab, including the `gene`, `tf`, and `pval` fields.
 """
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator  # pylint: disable=import-error # noqa # type: ignore
-from .BaseModel import BaseModel
+from .BaseModel import BaseModel, BaseQuerySet
 from .constants import P_VAL_DECIMAL_PLACES, P_VAL_MAX_DIGITS
 
 
-class HarbisonChIPQuerySet(models.QuerySet):
+class HarbisonChIPQuerySet(BaseQuerySet):
     def with_annotations(self):
         return self\
             .select_related(
@@ -9,11 +9,13 @@ This module defines the `Hops` model used to store HOPS data, including the
 .. date:: 2023-04-21
 """
 from django.db import models
+from django.dispatch import receiver
 from .BaseModel import BaseModel
 from .mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
+from .mixins.ListPartitionedMixin import ListPartitionedMixin
 
 
-class Hops(GenonomicCoordinatesMixin, BaseModel):
+class Hops(ListPartitionedMixin, GenonomicCoordinatesMixin, BaseModel):
     """
     A model for storing HOPS data.
 
@@ -32,6 +34,9 @@ class Hops(GenonomicCoordinatesMixin, BaseModel):
         - `experiment`: ForeignKey to the `CCExperiment` model, representing
           the experiment associated with the HOPS data.
 
+    On PostgreSQL, the table may be partitioned by experiment. See
+    :class:`~callingcards.models.mixins.ListPartitionedMixin.ListPartitionedMixin`
+
     Example usage:
 
     .. code-block:: python
@@ -42,6 +47,8 @@ class Hops(GenonomicCoordinatesMixin, BaseModel):
         all_hops = Hops.objects.all()
 
     """
+    partition_key = 'experiment_id'
+
     depth = models.PositiveIntegerField()
     experiment = models.ForeignKey(
         'CCExperiment',
@@ -51,3 +58,14 @@ class Hops(GenonomicCoordinatesMixin, BaseModel):
     class Meta:
         managed = True
         db_table = 'hops'
+        indexes = [
+            # range queries, see callingcards.filters.RegionFilter
+            models.Index(fields=['chr', 'start'],
+                         name='hops_chr_start_idx'),
+        ]
+
+
+@receiver(models.signals.post_save, sender='callingcards.CCExperiment')
+def create_hops_partition(sender, instance, created=False, raw=False, **kwargs):  # pylint: disable=unused-argument # noqa
+    if created and not raw:
+        Hops.create_partition(instance.pk, using=kwargs.get('using'))
@@ -13,13 +13,13 @@ fields.
 """
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator  # pylint: disable=import-error # noqa # type: ignore
-from .BaseModel import BaseModel
+from .BaseModel import BaseModel, BaseQuerySet
 from .constants import (P_VAL_DECIMAL_PLACES, P_VAL_MAX_DIGITS,
                       EFFECT_DECIMAL_PLACES, EFFECT_MAX_DIGITS)
 from .Background import Background
 
 
-class HopsReplicateSigQuerySet(models.QuerySet):
+class HopsReplicateSigQuerySet(BaseQuerySet):
     def with_annotations(self):
         return self\
             .select_related(
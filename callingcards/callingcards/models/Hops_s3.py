@@ -3,15 +3,20 @@ from django.db import models  # pylint: disable=import-error # noqa # type: igno
 from django.dispatch import receiver
 from .BaseModel import BaseModel
 from .ChrMap import ChrMap
+from .mixins.ContentAddressedFileMixin import ContentAddressedFileMixin
 from .filepaths.qbed_filepath import qbed_filepath
 
 logger = logging.getLogger(__name__)
 
 
-class Hops_s3(BaseModel):
+class Hops_s3(ContentAddressedFileMixin, BaseModel):
     """
-    Store qbed file by experiment id 
+    Store qbed file by experiment id. The qbed file itself is stored by the
+    SHA-256 of its content, so re-uploading an identical file does not store
+    it again
     """
+    content_addressed_field = 'qbed'
+
     CHR_FORMAT_CHOICES = [
         (x.name, x.name) for x in ChrMap._meta.fields if x.name not in
         {'uploader', 'uploadDate', 'modified', 
@@ -39,7 +44,8 @@ class Hops_s3(BaseModel):
 
 # Signals
 # this is a post_delete signal. Hence, if the delete command is successful,
-# the file will be deleted. If the delete command is successful, and for some
+# the file will be deleted when the transaction commits, unless another
+# record refers to the same content then. If the delete command is successful, and for some
 # reason the delete signal fails, it is possible to end up with files in S3
 # which are not referenced by the database.
 # upon inception, there did not exist any images which were not referenced. So,
@@ -49,4 +55,4 @@ class Hops_s3(BaseModel):
 def remove_file_from_s3(sender, instance, using, **kwargs):
     # note that if the directory (and all subdirectories) are empty, the
     # directory will also be removed
-    instance.qbed.delete(save=False)
+    instance.delete_unreferenced_file(using)
@@ -17,11 +17,13 @@ from django.db import models
 from django.db.models import F, Count
 from django.core.validators import MaxValueValidator
 
-from .BaseModel import BaseModel
-from .mixins.GenomicCoordinatesMixin import GenonomicCoordinatesMixin
+from .BaseModel import BaseModel, BaseQuerySet
+# registers the in_range lookup
+from .mixins.GenomicCoordinatesMixin import (GenonomicCoordinatesMixin,  # noqa
+                                             InRange)
 
 
-class PromoterRegionsQuerySet(models.QuerySet):
+class PromoterRegionsQuerySet(BaseQuerySet):
     """
     A queryset for the PromoterRegions model that provides an optimized method
     for retrieving promoter regions and their associated targets.
@@ -66,8 +68,12 @@ class PromoterRegionsQuerySet(models.QuerySet):
         :class:`PromoterRegions` based on the given ``promoter_source``, 
         ``experiment_id``, and the range of start positions. The queryset can
         also be filtered by strand if ``consider_strand`` is set to True.
-        The result is a queryset that annotates the experiment hops count for
-        each promoter.
+        The result is a queryset with one record, with the experiment hops
+        count, per promoter and experiment, so that many experiments are
+        counted in one query.
+
+        The hops are joined to the promoters by a range join, see
+        :class:`~callingcards.models.mixins.GenomicCoordinatesMixin.InRange`.
 
         :param kwargs: A dictionary of keyword arguments that can be used to
             filter the queryset. The following keyword arguments are supported:
@@ -78,6 +84,7 @@ class PromoterRegionsQuerySet(models.QuerySet):
             - tf_gene: The gene name from the gene table of the transcription
             factor
             - experiment_id: The id from the CCExperiment table
+            - experiment_ids: A list of ids from the CCExperiment table
             - experiment_batch: The batch from the CCExperiment table
             - promoter_source: The source from the PromoterRegions table
             - consider_strand: A boolean that determines whether to require
@@ -85,8 +92,8 @@ class PromoterRegionsQuerySet(models.QuerySet):
               is False, which means reads on either strand in the promoter 
               range are counted
 
-        :return: A queryset of annotated experiment hops counts for each
-        promoter.
+        :return: A values queryset of `promoter_id`, `experiment_id`,
+            `promoter_source` and `experiment_hops`
         :rtype: QuerySet
 
         Example usage:
@@ -105,59 +112,52 @@ class PromoterRegionsQuerySet(models.QuerySet):
         tf_locus_tag = kwargs.get('tf_locus_tag', None)
         tf_gene = kwargs.get('tf_gene', None)
         experiment_id = kwargs.get('experiment_id', None)
+        experiment_ids = kwargs.get('experiment_ids', None)
         experiment_batch = kwargs.get('experiment_batch', None)
         promoter_source = kwargs.get('promoter_source', None)
         consider_strand = kwargs.get('consider_strand', False)
 
-        experiment_hops = self\
-            .filter(
-                chr__hops__chr_id=F('chr'),
-                chr__hops__start__gte=F('start'),
-                chr__hops__start__lte=F('end'))
-
-        if promoter_source:
-            experiment_hops = experiment_hops\
-                .filter(
-                    source=promoter_source)
+        # the conditions on the hops must be in a single filter() so that
+        # they apply to the same join of the hops table
+        hop_filters = {}
 
         # experiment_id will return a single experiment. The rest of these
         # filters will return multiple experiments. These should be viewed
         # as mutually exclusive.
         if experiment_id:
-            experiment_hops = experiment_hops\
-                .filter(
-                    chr__hops__experiment_id=experiment_id)
+            hop_filters['chr__hops__experiment_id'] = experiment_id
+        elif experiment_ids:
+            hop_filters['chr__hops__experiment_id__in'] = experiment_ids
         elif experiment_batch:
-            experiment_hops = experiment_hops\
-                .filter(
-                    chr__hops__experiment__batch=experiment_batch)
+            hop_filters['chr__hops__experiment__batch'] = experiment_batch
         elif tf_id:
-            experiment_hops = experiment_hops\
-                .filter(
-                    chr__hops__experiment__tf_id=tf_id)
+            hop_filters['chr__hops__experiment__tf__tf_id'] = tf_id
         elif tf_locus_tag:
-            experiment_hops = experiment_hops\
-                .filter(
-                    chr__hops__experiment__tf__locus_tag=tf_locus_tag)
+            hop_filters['chr__hops__experiment__tf__tf__locus_tag'] = \
+                tf_locus_tag
         elif tf_gene:
-            experiment_hops = experiment_hops\
-                .filter(
-                    chr__hops__experiment__tf__gene=tf_gene)
+            hop_filters['chr__hops__experiment__tf__tf__gene'] = tf_gene
 
         if consider_strand:
+            hop_filters['chr__hops__strand'] = F('strand')
+
+        experiment_hops = self
+        if promoter_source:
             experiment_hops = experiment_hops\
                 .filter(
-                    chr__hops__strand=F('strand'))
+                    source=promoter_source)
 
         experiment_hops = experiment_hops\
-            .annotate(
-                promoter_id=F('id'))\
+            .filter(
+                chr__hops__start__in_range=(F('start'), F('end')),
+                **hop_filters)\
             .values(
-                'promoter_id')\
-            .annotate(
-                experiment_hops=Count('chr__hops__id'),
+                promoter_id=F('id'),
                 experiment_id=F('chr__hops__experiment_id'),
-                promoter_source=F('source'),)
+                promoter_source=F('source'))\
+            .annotate(
+                experiment_hops=Count('chr__hops__id'))\
+            .order_by('promoter_id', 'experiment_id')
 
         return experiment_hops
 
@@ -168,8 +168,10 @@ class PromoterRegionsQuerySet(models.QuerySet):
         :class:`PromoterRegions` based on the given ``promoter_source``, 
         ``background_source``, and the range of start positions. The queryset
         can also be filtered by strand if ``consider_strand`` is set to True.
-        The result is a queryset that annotates the background hops count for
-        each promoter.
+        The result is a queryset with the background hops count per promoter
+        and background source. The background hops are joined to the
+        promoters by a range join, see
+        :class:`~callingcards.models.mixins.GenomicCoordinatesMixin.InRange`.
 
         :param kwargs: A dictionary of keyword arguments that can be used to
             filter the queryset. The following keyword arguments are supported:
@@ -199,36 +201,33 @@ class PromoterRegionsQuerySet(models.QuerySet):
         background_source = kwargs.get('background_source', None)
         promoter_source = kwargs.get('promoter_source', None)
         consider_strand = kwargs.get('consider_strand', False)
-        background_hops = self\
-            .filter(
-                chr__background__chr_id=F('chr'),
-                chr__background__start__gte=F('start'),
-                chr__background__start__lte=F('end'))
-
-        if promoter_source:
-            background_hops = background_hops\
-                .filter(
-                    source=promoter_source)
 
+        # the conditions on the background hops must be in a single filter()
+        # so that they apply to the same join of the background table
+        background_filters = {}
         if background_source:
-            background_hops = background_hops\
-                .filter(
-                    chr__background__source=background_source)
-
+            background_filters['chr__background__source'] = \
+                background_source
         if consider_strand:
+            background_filters['chr__background__strand'] = F('strand')
+
+        background_hops = self
+        if promoter_source:
             background_hops = background_hops\
                 .filter(
-                    chr__background__strand=F('strand'))
+                    source=promoter_source)
 
         background_hops = background_hops\
-            .annotate(
-                promoter_id=F('id'))\
+            .filter(
+                chr__background__start__in_range=(F('start'), F('end')),
+                **background_filters)\
             .values(
-                'promoter_id')\
-            .annotate(
-                background_hops=Count('chr__background__id'),
+                promoter_id=F('id'),
                 background_source=F('chr__background__source'),
-                promoter_source=F('source'),)
+                promoter_source=F('source'))\
+            .annotate(
+                background_hops=Count('chr__background__id'))\
+            .order_by('promoter_id', 'background_source')
 
         return background_hops
 
@@ -295,3 +294,8 @@ class PromoterRegions(GenonomicCoordinatesMixin,
     class Meta:
         managed = True
         db_table = 'promoter_regions'
+        indexes = [
+            # range queries, see callingcards.filters.RegionFilter
+            models.Index(fields=['chr', 'start'],
+                         name='promoter_regions_chr_start_idx'),
+        ]
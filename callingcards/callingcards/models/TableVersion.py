@@ -0,0 +1,195 @@
+"""
+.. module:: TableVersion
+   :synopsis: Model which stamps each table with a version number
+
+.. moduleauthor:: Chase Mateusiak
+.. date:: 2023-07-20
+
+This module defines the `TableVersion` model. Each row holds a counter, and
+the time of the last change, for one database table. The counter is
+incremented whenever a record of a `BaseModel` table is saved (see the
+`post_save` receiver at the bottom of this module, which is connected to each
+`BaseModel` by :func:`connect_table_version_receivers`) or deleted (see
+:class:`~callingcards.models.BaseModel.BaseQuerySet`), and by the bulk
+loaders, which do not send signals, with :meth:`TableVersionQuerySet.bump`.
+
+Anything calculated from a table, eg a cached count, may then be keyed by the
+versions of the tables it depends on rather than being explicitly
+invalidated. Because the versions are stored in the database, they are the
+same for every worker process.
+
+In a transaction, the versions are bumped once, when it commits, with
+:meth:`TableVersionQuerySet.bump_on_commit`, rather than on every save, so
+that a transaction which saves many records updates the row of each table
+once, and holds its lock only while it commits. A delete, of a record or of a
+queryset, bumps each table which it deleted from, including the cascades,
+once. There is no `post_delete` receiver, so that Django may delete the
+cascades with a single fast `DELETE`. Note that `queryset.update()` and raw
+SQL do not bump the versions. Code which uses them should call
+`TableVersion.objects.bump()`.
+
+Bulk loaders call :func:`notify_bulk_load`, which bumps the version and sends
+the `bulk_loaded` signal so that data derived from the loaded rows, eg
+:class:`~callingcards.models.ExperimentQcSummary`, may be refreshed.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.db import connections, models, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+from .BaseModel import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# sent by bulk loaders, which do not send post_save, with the model as the
+# sender and `objs`, the created objects, or None if they are not known
+bulk_loaded = Signal()
+
+
+class TableVersionQuerySet(models.QuerySet):
+    """Custom QuerySet for the TableVersion model."""
+
+    def bump(self, *tables) -> None:
+        """Increment the version of each table.
+
+        :param tables: db table names, or models
+        :type tables: str or django.db.models.Model
+        """
+        for table in tables:
+            if not isinstance(table, str):
+                table = table._meta.db_table
+            updated = self.filter(table=table)\
+                .update(version=F('version') + 1, modified=now())
+            if not updated:
+                _, created = self.get_or_create(
+                    table=table, defaults={'version': 1})
+                if not created:
+                    self.filter(table=table)\
+                        .update(version=F('version') + 1, modified=now())
+
+    def bump_on_commit(self, *tables, using: Optional[str] = None) -> None:
+        """Increment the version of each table when the transaction on
+        `using` commits, or now if there is no transaction. The tables of
+        all of the calls in a transaction are bumped once, by the callback
+        which runs first.
+
+        :param tables: db table names, or models
+        :type tables: str or django.db.models.Model
+        :param using: the database alias of the transaction. Defaults to the
+            database of the queryset
+        :type using: str
+        """
+        using = using or self.db
+        tables = {table if isinstance(table, str) else table._meta.db_table
+                  for table in tables}
+        connection = connections[using]
+        if not connection.in_atomic_block:
+            self.using(using).bump(*sorted(tables))
+            return
+        # the tables of the transaction are collected on its connection, and
+        # are all bumped by the first of its callbacks which runs. The tables
+        # of a transaction which is rolled back are bumped with the next one
+        # which commits, which only expires some cached results early
+        pending = getattr(connection, 'table_version_pending', None)
+        if pending is None:
+            pending = connection.table_version_pending = set()
+        pending.update(tables)
+
+        def bump_pending():
+            # sorted, so that concurrent transactions lock the rows in the
+            # same order
+            bumped = sorted(pending)
+            pending.clear()
+            if bumped:
+                self.using(using).bump(*bumped)
+        transaction.on_commit(bump_pending, using=using)
+
+    def stamps(self, tables: Iterable[str]
+               ) -> Dict[str, Tuple[int, Optional[datetime]]]:
+        """
+        :param tables: db table names
+        :type tables: iterable
+        :return: a dictionary of table -> (version, modified). Tables which
+            have never been changed are (0, None)
+        :rtype: dict
+        """
+        tables = sorted(set(tables))
+        stamps = {table: (version, modified) for table, version, modified
+                  in self.filter(table__in=tables)
+                  .values_list('table', 'version', 'modified')}
+        return {table: stamps.get(table, (0, None)) for table in tables}
+
+
+class TableVersion(models.Model):
+    """
+    A model which stores the version of a database table.
+
+    Fields:
+        - table: CharField, the db table name
+        - version: BigIntegerField, incremented on every change to the table
+        - modified: DateTimeField, the time of the last change to the table
+    """
+    table = models.CharField(
+        max_length=255,
+        primary_key=True)
+    version = models.BigIntegerField(
+        default=0)
+    modified = models.DateTimeField(
+        default=now)
+
+    objects = TableVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.table}:{self.version}'
+
+    class Meta:
+        db_table = 'table_version'
+
+
+def bump_table_version(sender, instance, **kwargs):  # pylint: disable=unused-argument # noqa
+    """Increment the version of the table of a BaseModel record which has
+    been saved, when the transaction commits."""
+    if not kwargs.get('raw', False):
+        TableVersion.objects.bump_on_commit(sender, using=kwargs.get('using'))
+
+
+def _concrete_base_models(model=BaseModel):
+    """Yield the concrete subclasses of a model, recursively."""
+    for subclass in model.__subclasses__():
+        if not subclass._meta.abstract:
+            yield subclass
+        yield from _concrete_base_models(subclass)
+
+
+def connect_table_version_receivers() -> None:
+    """Connect :func:`bump_table_version` to the `post_save` of each
+    `BaseModel`. The receiver is connected per model, rather than to every
+    model, so that the saves of other models, eg `TableVersion` itself, do
+    not call it. Called once the models are imported, in `models/__init__`.
+    """
+    for model in set(_concrete_base_models()):
+        models.signals.post_save.connect(
+            bump_table_version, sender=model,
+            dispatch_uid=f'bump_table_version_{model._meta.label_lower}')
+
+
+def notify_bulk_load(model, objs=None) -> None:
+    """Bump the version of a table which has been bulk loaded, and send the
+    `bulk_loaded` signal.
+
+    :param model: the model, or its db table name
+    :type model: django.db.models.Model or str
+    :param objs: the created objects, if they are known
+    :type objs: list, optional
+    """
+    if isinstance(model, str):
+        model = next((x for x in apps.get_models()
+                      if x._meta.db_table == model), model)
+    TableVersion.objects.bump(model)
+    if not isinstance(model, str):
+        bulk_loaded.send(sender=model, objs=objs)
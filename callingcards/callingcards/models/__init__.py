@@ -7,6 +7,7 @@ from .CCTF import CCTF
 from .ChipExo import ChipExo
 from .ChrMap import ChrMap
 from .CallingCardsSig import CallingCardsSig
+from .ChunkedUpload import ChunkedUpload
 from .Gene import Gene
 from .HarbisonChIP import HarbisonChIP
 from .Hops import Hops
@@ -22,3 +23,8 @@ from .QcMetrics import QcMetrics
 from .QcR1ToR2Tf import QcR1ToR2Tf
 from .QcR2ToR1Tf import QcR2ToR1Tf
 from .QcTfToTransposon import QcTfToTransposon
+from .TableVersion import TableVersion
+from .ExperimentQcSummary import ExperimentQcSummary
+
+from .TableVersion import connect_table_version_receivers
+connect_table_version_receivers()
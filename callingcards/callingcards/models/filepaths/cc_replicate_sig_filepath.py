@@ -1,14 +1,12 @@
-import os
 import logging
 
+from ..mixins.ContentAddressedFileMixin import content_addressed_path
+
 logger = logging.getLogger(__name__)
 
+
 def cc_replicate_sig_filepath(instance, filename):
-    experiment = instance.experiment
-    promoter_source = instance.promoter_source
-    path = os.path.join(
-        'analysis',
-        experiment.batch,
-        f'ccexperiment_{experiment.id}_{promoter_source.pk}.csv.gz')
+    # significance files are stored by content. See ContentAddressedFileMixin
+    path = content_addressed_path('analysis', instance.sha256, filename)
     logger.debug("CallingCardsSig filepath: %s", path)
-    return path
\ No newline at end of file
+    return path
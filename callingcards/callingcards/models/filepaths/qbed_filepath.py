@@ -1,3 +1,6 @@
+from ..mixins.ContentAddressedFileMixin import content_addressed_path
+
+
 def qbed_filepath(instance, filename):
-    experiment = instance.experiment
-    return f'qbed/{experiment.batch}/ccexperiment_{experiment.id}.qbed'
\ No newline at end of file
+    # qbed files are stored by content. See ContentAddressedFileMixin
+    return content_addressed_path('qbed', instance.sha256, filename)
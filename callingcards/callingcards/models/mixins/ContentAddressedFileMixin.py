@@ -0,0 +1,157 @@
+"""
+.. module:: ContentAddressedFileMixin
+   :synopsis: A mixin which stores a model's file by the SHA-256 of its content
+
+Store a FileField by the SHA-256 of its content, eg
+`qbed/sha256/ab/abcd...ef.qbed`. If a file with the same content is already in
+storage, saving the record only writes the database row. Files are shared by
+every record with the same content, and are removed from storage when the last
+record which references them is deleted, or is given a new file.
+
+A file is removed when the transaction of the delete commits, once the
+references are counted again, so that a rolled back delete keeps its file. A
+record whose save found its file in storage checks again when its transaction
+commits, and stores the file if a concurrent delete removed it.
+
+.. moduleauthor:: Chase Mateusiak
+.. date:: 2023-07-17
+"""
+import hashlib
+import logging
+import os
+from functools import partial
+
+from django.db import models, router, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file) -> str:
+    """
+    :param file: a django File
+    :type file: django.core.files.File
+    :return: the hex SHA-256 of the file's content
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def content_addressed_path(prefix: str, sha256: str, filename: str) -> str:
+    """
+    :param prefix: the top level storage directory, eg `qbed`
+    :type prefix: str
+    :param sha256: the hex SHA-256 of the file's content
+    :type sha256: str
+    :param filename: the original filename. The extension is kept
+    :type filename: str
+    :return: the content addressed storage path
+    :rtype: str
+    """
+    root, extension = os.path.splitext(os.path.basename(filename))
+    # keep the format extension of compressed files, eg .qbed.gz
+    if extension in {'.gz', '.gzip', '.zip'}:
+        extension = os.path.splitext(root)[1] + extension
+    return f'{prefix}/sha256/{sha256[:2]}/{sha256}{extension}'
+
+
+class ContentAddressedFileMixin(models.Model):
+    """
+    Set `content_addressed_field` to the name of the FileField which should
+    be stored by content. The field's `upload_to` should return
+    :func:`content_addressed_path` using `instance.sha256`.
+    """
+    content_addressed_field = 'file'
+
+    sha256 = models.CharField(max_length=64,
+                              blank=True,
+                              default='',
+                              db_index=True)
+
+    def save(self, *args, **kwargs):
+        field_file = getattr(self, self.content_addressed_field)
+        using = kwargs.get('using') or \
+            router.db_for_write(type(self), instance=self)
+        # only a newly assigned file needs to be hashed and stored
+        if field_file and not field_file._committed:  # pylint: disable=protected-access # noqa
+            replaced = type(self).objects.using(using)\
+                .filter(pk=self.pk)\
+                .values_list(self.content_addressed_field, flat=True)\
+                .first() if self.pk else None
+            self.sha256 = file_sha256(field_file.file)
+            name = field_file.field.generate_filename(self, field_file.name)
+            if field_file.storage.exists(name):
+                logger.debug('%s already in storage -- not re-uploading',
+                             name)
+                transaction.on_commit(
+                    partial(self._restore_file, field_file.storage, name,
+                            field_file.file),
+                    using=using)
+                field_file.name = name
+                field_file._committed = True  # pylint: disable=protected-access # noqa
+            else:
+                field_file.save(name, field_file.file, save=False)
+            if replaced and replaced != field_file.name:
+                transaction.on_commit(
+                    partial(type(self).delete_file_if_unreferenced,
+                            field_file.storage, replaced, using),
+                    using=using)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def _restore_file(storage, name: str, content) -> None:
+        """Store the content of a saved record again, if its file was removed
+        by a delete which counted the references before the save committed.
+        """
+        if storage.exists(name):
+            return
+        logger.warning('%s was removed while it was saved -- storing it '
+                       'again', name)
+        try:
+            content.seek(0)
+            storage.save(name, content)
+        except (OSError, ValueError) as exc:
+            logger.error('failed to store %s again: %s', name, exc)
+
+    @classmethod
+    def delete_file_if_unreferenced(cls, storage, name: str,
+                                    using=None) -> bool:
+        """Delete a stored file if no record of this model refers to it.
+
+        :param storage: the storage of the file
+        :type storage: django.core.files.storage.Storage
+        :param name: the name of the file in the storage
+        :type name: str
+        :param using: the database alias of the records
+        :type using: str
+        :return: True if the file was deleted
+        :rtype: bool
+        """
+        if not name or cls.objects.using(using or router.db_for_read(cls))\
+                .filter(**{cls.content_addressed_field: name}).exists():
+            return False
+        storage.delete(name)
+        return True
+
+    def delete_unreferenced_file(self, using=None) -> None:
+        """Delete this record's file from storage, when the transaction of
+        the delete commits, if no record refers to it then. This is intended
+        to be called in a post_delete signal.
+
+        :param using: the database alias of the delete
+        :type using: str
+        """
+        field_file = getattr(self, self.content_addressed_field)
+        if not field_file:
+            return
+        using = using or router.db_for_write(type(self), instance=self)
+        transaction.on_commit(
+            partial(type(self).delete_file_if_unreferenced,
+                    field_file.storage, field_file.name, using),
+            using=using)
+
+    class Meta:
+        abstract = True
@@ -1,7 +1,27 @@
 """Mixins which may be useful for storing genomic data"""
-from django.db import models
+import logging
+
+from django.db import (models, connections, transaction, DatabaseError,
+                       DEFAULT_DB_ALIAS)
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
+# append-only tables which, on PostgreSQL, also have a BRIN index on
+# (chr, start). A BRIN index is a few pages for a table of any size, and is
+# effective since these tables are loaded in coordinate order
+BRIN_INDEXED_TABLES = ('hops', 'background')
+
+# tables of regions which, on PostgreSQL, have a GiST index on the chromosome
+# and the range of their coordinates. The range is the expression written by
+# the `in_range` lookup, see `InRange`, and the range joins, eg in
+# PromoterRegionsQuerySet, are also on the chromosome, so both conditions are
+# answered from the index. The chromosome, an integer, is indexed by GiST with
+# the operators of the `btree_gist` extension
+RANGE_INDEXED_TABLES = ('promoter_regions',)
+
 
 class Strand(Enum):
     """
@@ -67,3 +87,80 @@ class GenonomicCoordinatesMixin(models.Model):
                 name='end_cannot_exceed_chromosome_length',
             )
         ]
+
+
+@models.IntegerField.register_lookup
+class InRange(models.lookups.Range):
+    """
+    The lookup `<field>__in_range=(lower, upper)` is true when the field is in
+    the closed range [lower, upper], eg a hop `start` in the coordinates of a
+    promoter.
+
+    On PostgreSQL this is written as `int4range(lower, upper, '[]') @>
+    field`, which is answered, with the equality of the chromosomes of a
+    range join, from the GiST index of the tables in `RANGE_INDEXED_TABLES`. Elsewhere it is the `BETWEEN` of the `range`
+    lookup, which is answered from the `(chr, start)` index of the table of
+    the field.
+
+    Example usage:
+
+    .. code-block:: python
+
+        PromoterRegions.objects.filter(
+            chr__hops__start__in_range=(F('start'), F('end')))
+    """
+    lookup_name = 'in_range'
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor != 'postgresql':
+            return super().as_sql(compiler, connection)
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        # a list of the sql of lower and upper
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return (f"int4range({rhs_sql[0]}, {rhs_sql[1]}, '[]') @> {lhs_sql}",
+                (*rhs_params, *lhs_params))
+
+
+@receiver(post_migrate)
+def create_postgres_indexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):  # pylint: disable=unused-argument # noqa
+    """Create the BRIN indexes of `BRIN_INDEXED_TABLES` and the GiST indexes
+    of `RANGE_INDEXED_TABLES` after the callingcards app is migrated. These
+    are not declared in the model Meta since the other databases, eg SQLite
+    in development, do not support them. If the `btree_gist` extension may
+    not be created, eg without the privilege, the GiST indexes are on the
+    range alone."""
+    connection = connections[using]
+    if getattr(sender, 'label', None) != 'callingcards' or \
+            connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        existing = connection.introspection.table_names(cursor)
+        for table in BRIN_INDEXED_TABLES:
+            if table in existing:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_chr_start_brin '
+                    f'ON {table} USING brin (chr_id, start)')
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+            btree_gist = True
+        except DatabaseError as exc:
+            logger.warning('The btree_gist extension was not created, so the '
+                           'GiST indexes of %s are on the range alone: %s',
+                           RANGE_INDEXED_TABLES, exc)
+            btree_gist = False
+        for table in RANGE_INDEXED_TABLES:
+            if table not in existing:
+                continue
+            if btree_gist:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_chr_range_gist '
+                    f'ON {table} USING gist '
+                    f'(chr_id, int4range(start, "end", \'[]\'))')
+                # replaced by the index of the chromosome and the range
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_range_gist')
+            else:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_range_gist '
+                    f'ON {table} USING gist '
+                    f'(int4range(start, "end", \'[]\'))')
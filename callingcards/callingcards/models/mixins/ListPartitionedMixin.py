@@ -0,0 +1,322 @@
+"""
+.. module:: ListPartitionedMixin
+   :synopsis: Optional PostgreSQL list partitioning of a model's table
+
+A model with this mixin may have its table list partitioned on PostgreSQL by
+`partition_key`, eg `hops` by `experiment_id`, so that each experiment's rows
+are a table of their own:
+
+- a scan filtered by the key reads one partition
+- the rows of a key are removed with `DETACH PARTITION` and `DROP TABLE`
+  rather than deleted, when the record of the key is deleted, see
+  :class:`PartitionKeyMixin`
+
+Partitioning is optional. Until a table is converted with
+
+.. code-block:: bash
+
+    python manage.py partition_tables --convert
+
+the table is an ordinary table and every method of the mixin falls back to
+what works on any database. Partitions of new keys are created by the signal
+receivers of the models, and `partition_tables` creates any which are
+missing.
+
+Partitions are named `<table>_p<key>`, eg `hops_p12`. Keys which are not
+integers, eg the `source` of a `BackgroundSource`, are written as lower case
+letters, digits and underscores followed by a hash of the key, eg
+`background_padh1_5f1f1c8a`. Rows whose key has no partition are
+stored in `<table>_default`, and are moved to the key's partition when it is
+created.
+
+.. moduleauthor:: Chase Mateusiak
+.. date:: 2023-07-23
+"""
+import hashlib
+import logging
+import re
+
+from django.db import connections, models, router, transaction
+
+from ..BaseModel import BaseQuerySet
+from ..TableVersion import TableVersion
+
+logger = logging.getLogger(__name__)
+
+
+class ListPartitionedMixin(models.Model):
+    """
+    Set `partition_key` to the column which the table is partitioned by.
+    """
+    partition_key = None
+
+    class Meta:  # pylint: disable=C0115
+        abstract = True
+
+    @classmethod
+    def _connection(cls, using=None):
+        return connections[using or router.db_for_write(cls)]
+
+    @classmethod
+    def partition_name(cls, key) -> str:
+        """
+        :param key: a value of the partition key
+        :type key: int or str
+        :return: the name of the partition of the key
+        :rtype: str
+        """
+        key = str(key)
+        if not key.isdigit():
+            # a valid, and unique, identifier
+            key = (f"{re.sub(r'[^a-z0-9]+', '_', key.lower())[:20]}_"
+                   f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}")
+        return f'{cls._meta.db_table}_p{key}'
+
+    @classmethod
+    def is_partitioned(cls, using=None) -> bool:
+        """
+        :return: whether the table is a partitioned PostgreSQL table
+        :rtype: bool
+        """
+        connection = cls._connection(using)
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table p '
+                'JOIN pg_class c ON c.oid = p.partrelid '
+                'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+                [cls._meta.db_table])
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def partitions(cls, using=None) -> set:
+        """
+        :return: the names of the partitions of a partitioned table, including
+            the default partition
+        :rtype: set
+        """
+        connection = cls._connection(using)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT c.relname FROM pg_inherits i '
+                'JOIN pg_class c ON c.oid = i.inhrelid '
+                'JOIN pg_class p ON p.oid = i.inhparent '
+                'WHERE p.relname = %s AND pg_table_is_visible(p.oid)',
+                [cls._meta.db_table])
+            return {name for name, in cursor.fetchall()}
+
+    @classmethod
+    def convert_to_partitioned(cls, using=None) -> None:
+        """Convert the table to a table list partitioned by `partition_key`,
+        with a partition for each key in the table and a default partition.
+
+        The table is copied, so this takes as long as a full table rewrite,
+        and holds an exclusive lock on the table throughout. The indexes and
+        foreign keys are recreated on the partitioned table. The primary key
+        becomes (id, `partition_key`), since a primary key must include the
+        partition key.
+
+        :raises NotImplementedError: if the database is not PostgreSQL
+        """
+        connection = cls._connection(using)
+        if connection.vendor != 'postgresql':
+            raise NotImplementedError(
+                'List partitioning requires PostgreSQL')
+        if cls.is_partitioned(using):
+            return
+        quote = connection.ops.quote_name
+        table = cls._meta.db_table
+        old = f'{table}_unpartitioned'
+        key = quote(cls.partition_key)
+        pk = quote(cls._meta.pk.column)
+        # not the name of the sequence of the old table, which is dropped
+        # with it
+        sequence = f'{table}_partitioned_{cls._meta.pk.column}_seq'
+
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexdef FROM pg_indexes i '
+                'JOIN pg_class c ON c.relname = i.indexname '
+                'JOIN pg_index x ON x.indexrelid = c.oid '
+                'WHERE i.tablename = %s AND NOT x.indisprimary',
+                [table])
+            indexes = [x for x, in cursor.fetchall()]
+            cursor.execute(
+                'SELECT conname, pg_get_constraintdef(oid) '
+                'FROM pg_constraint '
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table])
+            foreign_keys = cursor.fetchall()
+            cursor.execute(f'SELECT DISTINCT {key} FROM {quote(table)}')
+            keys = [x for x, in cursor.fetchall()]
+
+            cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO '
+                           f'{quote(old)}')
+            cursor.execute(
+                f'CREATE TABLE {quote(table)} (LIKE {quote(old)} '
+                f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                f'PARTITION BY LIST ({key})')
+            # the id of the old table may be an identity column, which is
+            # not copied, so it is replaced by a sequence
+            cursor.execute(f'CREATE SEQUENCE {quote(sequence)} '
+                           f'OWNED BY {quote(table)}.{pk}')
+            cursor.execute(f'SELECT setval(%s, COALESCE(MAX({pk}), 0) + 1, '
+                           f'false) FROM {quote(old)}',
+                           [sequence])
+            cursor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN {pk} '
+                           f"SET DEFAULT nextval('{sequence}'::regclass)")
+            cursor.execute(f'ALTER TABLE {quote(table)} '
+                           f'ADD PRIMARY KEY ({pk}, {key})')
+            cursor.execute(f'CREATE TABLE {quote(table + "_default")} '
+                           f'PARTITION OF {quote(table)} DEFAULT')
+            for value in keys:
+                cursor.execute(
+                    f'CREATE TABLE {quote(cls.partition_name(value))} '
+                    f'PARTITION OF {quote(table)} FOR VALUES IN (%s)',
+                    [value])
+            cursor.execute(f'INSERT INTO {quote(table)} '
+                           f'SELECT * FROM {quote(old)}')
+            cursor.execute(f'DROP TABLE {quote(old)}')
+
+            # the names of the old indexes and constraints are now free
+            for indexdef in indexes:
+                cursor.execute(indexdef)
+            for name, definition in foreign_keys:
+                cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT '
+                               f'{quote(name)} {definition}')
+            cursor.execute(f'ANALYZE {quote(table)}')
+        logger.info('partitioned %s into %s partitions', table, len(keys))
+
+    @classmethod
+    def create_partition(cls, key, using=None) -> bool:
+        """Create the partition of a key, if the table is partitioned and
+        the partition does not exist. Rows of the key in the default
+        partition are moved to it.
+
+        :param key: a value of the partition key
+        :type key: int or str
+        :return: whether a partition was created
+        :rtype: bool
+        """
+        if not cls.is_partitioned(using):
+            return False
+        connection = cls._connection(using)
+        quote = connection.ops.quote_name
+        table = cls._meta.db_table
+        name = cls.partition_name(key)
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                return False
+            # the partition is filled before it is attached, since a
+            # partition may not be created for rows in the default partition
+            cursor.execute(
+                f'CREATE TABLE {quote(name)} (LIKE {quote(table)} '
+                f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {quote(table + "_default")} '
+                f'WHERE {quote(cls.partition_key)} = %s RETURNING *) '
+                f'INSERT INTO {quote(name)} SELECT * FROM moved',
+                [key])
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} '
+                f'FOR VALUES IN (%s)',
+                [key])
+        logger.info('created partition %s', name)
+        return True
+
+    @classmethod
+    def drop_partition(cls, key, using=None) -> bool:
+        """Detach and drop the partition of a key.
+
+        :param key: a value of the partition key
+        :type key: int or str
+        :return: whether a partition was dropped
+        :rtype: bool
+        """
+        if not cls.is_partitioned(using):
+            return False
+        connection = cls._connection(using)
+        quote = connection.ops.quote_name
+        name = cls.partition_name(key)
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is None:
+                return False
+            cursor.execute(
+                f'ALTER TABLE {quote(cls._meta.db_table)} '
+                f'DETACH PARTITION {quote(name)}')
+            cursor.execute(f'DROP TABLE {quote(name)}')
+        logger.info('dropped partition %s', name)
+        return True
+
+    @classmethod
+    def drop_partitions(cls, keys, using=None) -> int:
+        """Drop the partitions of keys whose records are being deleted, so
+        that the rows are dropped with their tables rather than deleted. Rows
+        which are not in a partition of their own, eg on a table which is
+        not partitioned, are left to the cascade, which deletes them with a
+        single `DELETE`.
+
+        :param keys: values of the partition key
+        :type keys: iterable
+        :return: the number of partitions which were dropped
+        :rtype: int
+        """
+        using = using or router.db_for_write(cls)
+        if not cls.is_partitioned(using):
+            return 0
+        dropped = sum(cls.drop_partition(key, using) for key in keys)
+        if dropped:
+            # the cascade does not count the rows of a dropped partition
+            TableVersion.objects.bump_on_commit(cls, using=using)
+        return dropped
+
+
+class PartitionKeyQuerySet(BaseQuerySet):
+    """
+    The QuerySet of a :class:`PartitionKeyMixin` model. A queryset delete,
+    eg the bulk delete of the admin, drops the partitions of the deleted
+    records in the same transaction.
+    """
+
+    def delete(self):
+        partitioned_model = self.model._meta.apps.get_model(
+            'callingcards', self.model.partitioned_model)
+        with transaction.atomic(using=self.db):
+            partitioned_model.drop_partitions(
+                self.values_list('pk', flat=True), using=self.db)
+            return super().delete()
+
+
+class PartitionKeyMixin(models.Model):
+    """
+    A model whose records are the partition keys of a
+    :class:`ListPartitionedMixin` model, eg `CCExperiment` of `Hops`. Set
+    `partitioned_model` to the name of the partitioned model. When a record,
+    or a queryset, is deleted, the partitions of the deleted records are
+    dropped, rather than their rows collected and deleted by the cascade.
+
+    A record which is deleted by the cascade of another delete, eg a
+    `CCExperiment` of a deleted `CCTF`, is not deleted with `delete()`. Its
+    rows are deleted by the cascade with a single `DELETE`, and its empty
+    partition is left until it is dropped with `partition_tables --drop`.
+    """
+    partitioned_model = None
+
+    objects = PartitionKeyQuerySet.as_manager()
+
+    class Meta:  # pylint: disable=C0115
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        partitioned_model = self._meta.apps.get_model(
+            'callingcards', self.partitioned_model)
+        with transaction.atomic(using=using):
+            partitioned_model.drop_partitions([self.pk], using=using)
+            return super().delete(using=using, keep_parents=keep_parents)
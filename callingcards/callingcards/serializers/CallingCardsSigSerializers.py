@@ -16,4 +16,6 @@ class CallingCardsSigSerializer(serializers.ModelSerializer):
     class Meta:
         model = CallingCardsSig  # noqa
         fields = '__all__'
+        # set by the server when the file is stored
+        read_only_fields = ['sha256', 'input_hash', 'row_count', 'file_size']
 
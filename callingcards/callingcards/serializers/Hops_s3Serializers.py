@@ -16,4 +16,6 @@ class Hops_s3Serializer(serializers.ModelSerializer):
     class Meta:
         model = Hops_s3  # noqa
         fields = '__all__'
+        # set from the file content on save
+        read_only_fields = ['sha256']
         
\ No newline at end of file
@@ -20,6 +20,7 @@ from .models import (CallingCardsSig,
                      CCExperiment, HopsSource,
                      BackgroundSource,
                      PromoterRegionsSource)
+from .models.TableVersion import notify_bulk_load
 from .utils.callingcards_with_metrics import callingcards_with_metrics
 
 logger = logging.getLogger(__name__)
@@ -110,6 +111,8 @@ def upload_csv_postgres_task(file_data,
             cursor.copy_expert(copy_command, data_file)
 
             db_conn.commit()
+            # COPY does not send signals
+            notify_bulk_load(table_name)
 
         except (errors.UniqueViolation, errors.ForeignKeyViolation) as err:
             db_conn.rollback()
@@ -174,6 +177,9 @@ def process_experiment(experiment_id: int, user_id: int, **kwargs):
             filepath,
             ContentFile(compressed_buffer.read()))
 
+        # the buffer has been read to its end
+        file_size = compressed_buffer.tell()
+
         # Close the buffer
         compressed_buffer.close()
 
@@ -188,4 +194,6 @@ def process_experiment(experiment_id: int, user_id: int, **kwargs):
                 pk=background_source),
             promoter_source=PromoterRegionsSource.objects.get(
                 pk=promoter_source),
+            row_count=len(group),
+            file_size=file_size,
             file=filepath)
\ No newline at end of file
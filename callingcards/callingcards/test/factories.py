@@ -1,9 +1,13 @@
 import os
 import random
+import shutil
+import tempfile
 from math import floor
 import factory
+from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.exceptions import ObjectDoesNotExist
+from django.test import override_settings
 from ..models import HopsSource, Lab
 
 
@@ -42,6 +46,28 @@ def random_file_from_media_directory(dir):
     return os.path.join(dir, random.choice(files))
 
 
+class TemporaryMediaRootMixin:
+    """
+    Store the files which the tests of a TestCase write, eg uploaded qbed
+    files and cached results, in a temporary MEDIA_ROOT, which is removed
+    after the tests, rather than in the media directory of the repo. The
+    test data of the media directory is copied to it.
+    """
+    media_fixture_dirs = ('qbed', 'analysis')
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        for directory in cls.media_fixture_dirs:
+            shutil.copytree(os.path.join(settings.MEDIA_ROOT, directory),
+                            os.path.join(media_root, directory))
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        cls.addClassCleanup(media_override.disable)
+        super().setUpClass()
+
+
 class BaseModelFactoryMixin(factory.django.DjangoModelFactory):
 
     uploader = factory.SubFactory(UserFactory)
@@ -1,8 +1,21 @@
 import pytest
-# import pandas as pd
-# import pandas.testing as pdt
+from asgiref.sync import async_to_sync
+import pandas as pd
+import pandas.testing as pdt
+import gzip
 import os
+import shutil
+import tempfile
+import warnings
+import zipfile
+from unittest.mock import patch
+from django.core.cache import CacheKeyWarning
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.storage import default_storage
+from django.db import IntegrityError, router
+from django.core.management import call_command, CommandError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from .factories import (PromoterRegionsFactory,
@@ -13,17 +26,33 @@ from .factories import (PromoterRegionsFactory,
                         BackgroundFactory,
                         BackgroundSourceFactory,
                         PromoterRegionsSourceFactory,
-                        GeneFactory)
+                        GeneFactory,
+                        TemporaryMediaRootMixin)
 
+from callingcards.config import Local, Production
 from callingcards.users.test.factories import UserFactory
 
+from ..async_streaming import AsyncStreamingMiddleware
+from ..db_router import ReadReplicaMiddleware, read_replica
+from ..filters.RegionFilter import max_feature_length
+from ..models import (Background, Gene, Hops_s3, CCExperiment, CCTF,
+                      QcManualReview)
+from ..management.commands import ingest_qbed as ingest_qbed_command
+from ..utils import ingest_qbed
+from ..utils.ingest_qbed import read_status
+from ..utils.load_genomic_coordinates import read_bed
+from ..utils.callingcards_sig_cache import (sig_input_hash,
+                                            filter_current_sigs,
+                                            reuse_sig,
+                                            store_sig)
 from ..utils.callingcards_with_metrics import (enrichment,
                                                poisson_pval,
                                                hypergeom_pval,
                                                callingcards_with_metrics)
+from ..views import BatchViewSet
 
 
-class TestCallingCardsWithMetrics(APITestCase):
+class TestCallingCardsWithMetrics(TemporaryMediaRootMixin, APITestCase):
     def setUp(self):
         # Create a test dataset using factories
         self.user = UserFactory.create()
@@ -110,6 +139,215 @@ class TestCallingCardsWithMetrics(APITestCase):
         # pdt.assert_frame_equal(actual, expected, check_dtype=False)
 
 
+class TestCallingCardsSigCache(TemporaryMediaRootMixin, APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.user.auth_token}')
+        # the table versions are bumped when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.source_record = HopsSourceFactory.create()
+            self.promoter_source = PromoterRegionsSourceFactory.create()
+            PromoterRegionsFactory.create_batch(
+                10, source=self.promoter_source)
+            self.background_source = BackgroundSourceFactory.create()
+            BackgroundFactory.create_batch(10, source=self.background_source)
+            self.lab_record = LabFactory.create()
+            GeneFactory.create(gene='INO2')
+
+    def upload(self, batch_replicate):
+        upload_file = os.path.join(default_storage.location,
+                                   'qbed/run_6437/INO2_chrI.ccf')
+        with open(upload_file, 'rb') as f, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('hopss3-list'),
+                                        {'chr_format': 'ucsc',
+                                         'tf_gene': 'INO2',
+                                         'batch': 'run_6437',
+                                         'batch_replicate': batch_replicate,
+                                         'lab': self.lab_record.pk,
+                                         'source': self.source_record.pk,
+                                         'qbed': f},
+                                        format='multipart')
+        return response.json()['experiment']
+
+    def test_sig_is_keyed_by_inputs(self):
+        experiment_id = self.upload(1)
+        sources = {'hops_source': self.source_record.pk,
+                   'background_source': self.background_source.pk,
+                   'promoter_source': self.promoter_source.pk}
+        result_df = callingcards_with_metrics(
+            {'experiment_id': experiment_id, **sources})
+        with self.captureOnCommitCallbacks(execute=True):
+            sig = store_sig(result_df, experiment_id, *sources.values(),
+                            self.user)
+        assert sig.input_hash == sig_input_hash(experiment_id,
+                                                *sources.values())
+        assert filter_current_sigs([sig]) == [sig]
+
+        # identical inputs from a different experiment are reused
+        other_experiment_id = self.upload(2)
+        assert other_experiment_id != experiment_id
+        reused_df = reuse_sig(other_experiment_id, **sources)
+        assert set(reused_df['experiment_id']) == {other_experiment_id}
+        assert set(reused_df['experiment_replicate']) == {2}
+        assert reused_df['callingcards_enrichment'].tolist() == \
+            result_df['callingcards_enrichment'].tolist()
+
+        # changing another background set does not
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundFactory.create(
+                source=BackgroundSourceFactory.create(source='sir4'))
+        assert filter_current_sigs([sig]) == [sig]
+
+        # changing the background set invalidates the cached result, once
+        # the table version is bumped on commit. The stale record is kept
+        # until it is replaced
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundFactory.create(source=self.background_source)
+        assert filter_current_sigs([sig]) == []
+        assert reuse_sig(other_experiment_id, **sources) is None
+        with self.captureOnCommitCallbacks(execute=True):
+            replaced = store_sig(result_df, experiment_id, *sources.values(),
+                                 self.user)
+        assert replaced.pk == sig.pk
+        assert filter_current_sigs([replaced]) == [replaced]
+
+
+class TestIngestQbed(TemporaryMediaRootMixin, APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.source_record = HopsSourceFactory.create()
+        self.lab_record = LabFactory.create()
+        GeneFactory.create(gene='INO2')
+        self.tmpdir = tempfile.mkdtemp()
+        qbed_file = os.path.join(default_storage.location,
+                                 'qbed/run_6437/INO2_chrI.ccf')
+        for filename in ['INO2_1.qbed', 'INO2_2.qbed', 'NOTATF_1.qbed']:
+            shutil.copy(qbed_file, os.path.join(self.tmpdir, filename))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ingest_directory_is_resumable(self):
+        options = {'user': self.user.username,
+                   'batch': 'run_6437',
+                   'lab': self.lab_record.pk,
+                   'source': self.source_record.pk,
+                   'chr_format': 'ucsc',
+                   'workers': 1}
+        with pytest.raises(CommandError, match='1 of 3 file'):
+            call_command('ingest_qbed', self.tmpdir, **options)
+
+        assert Hops_s3.objects.count() == 2
+        assert CCTF.objects.count() == 1
+        assert set(CCExperiment.objects
+                   .values_list('batch_replicate', flat=True)) == {1, 2}
+        assert QcManualReview.objects.count() == 2
+        assert Hops_s3.objects.first().genomic_hops == 139
+        # both replicates are the same file, which is stored once
+        assert Hops_s3.objects.values('qbed', 'sha256').distinct().count() \
+            == 1
+
+        status = read_status(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        assert {os.path.basename(k): v['status']
+                for k, v in status.items()} == \
+            {'INO2_1.qbed': 'done', 'INO2_2.qbed': 'done',
+             'NOTATF_1.qbed': 'failed'}
+
+        # only the failed file is retried
+        os.remove(os.path.join(self.tmpdir, 'NOTATF_1.qbed'))
+        with pytest.raises(CommandError):
+            call_command('ingest_qbed',
+                         os.path.join(self.tmpdir, 'manifest.csv'),
+                         **options)
+        with open(os.path.join(self.tmpdir, 'manifest.csv'), 'w') as f:
+            f.write('qbed,batch_replicate\nINO2_1.qbed,1\nINO2_2.qbed,2\n')
+        call_command('ingest_qbed', os.path.join(self.tmpdir, 'manifest.csv'),
+                     status_file=os.path.join(self.tmpdir,
+                                              'ingest_status.tsv'),
+                     **options)
+        assert Hops_s3.objects.count() == 2
+
+        # without a status, eg after a crash before it was written, the
+        # stored files are found by their content rather than duplicated
+        os.remove(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        with open(os.path.join(self.tmpdir, 'manifest.csv'), 'w') as f:
+            f.write('qbed,tf_gene,batch_replicate\n'
+                    'INO2_1.qbed,INO2,1\nINO2_2.qbed,INO2,2\n')
+        call_command('ingest_qbed', os.path.join(self.tmpdir, 'manifest.csv'),
+                     status_file=os.path.join(self.tmpdir,
+                                              'ingest_status.tsv'),
+                     **options)
+        assert Hops_s3.objects.count() == 2
+
+
+    def test_ingest_records_database_errors(self):
+        store_qbed_file = ingest_qbed.store_qbed_file
+
+        def store_or_fail(qbed, *args, **kwargs):
+            if qbed.endswith('INO2_1.qbed'):
+                raise IntegrityError('duplicate key')
+            return store_qbed_file(qbed, *args, **kwargs)
+        with patch.object(ingest_qbed, 'store_qbed_file', store_or_fail), \
+                pytest.raises(CommandError, match='2 of 3 file'):
+            call_command('ingest_qbed', self.tmpdir,
+                         user=self.user.username, batch='run_6437',
+                         lab=self.lab_record.pk,
+                         source=self.source_record.pk, chr_format='ucsc',
+                         workers=1)
+        status = read_status(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        assert status[os.path.join(self.tmpdir, 'INO2_1.qbed')]['error'] \
+            == 'duplicate key'
+        # the records of the failed file are rolled back
+        assert list(CCExperiment.objects
+                    .values_list('batch_replicate', flat=True)) == [2]
+
+    def test_ingest_survives_dead_workers(self):
+        options = {'user': self.user.username,
+                   'batch': 'run_6437',
+                   'lab': self.lab_record.pk,
+                   'source': self.source_record.pk,
+                   'chr_format': 'ucsc',
+                   'workers': 2}
+        marker = os.path.join(self.tmpdir, 'died')
+        with patch.object(ingest_qbed_command, 'validate_qbed_file',
+                          _validate_or_die), \
+                patch.dict(os.environ, {'INGEST_TEST_DIE': marker}), \
+                pytest.raises(CommandError, match='1 of 3 file'):
+            call_command('ingest_qbed', self.tmpdir, **options)
+        # the worker which died was replaced, and the file validated again
+        status = read_status(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        assert {os.path.basename(k): v['status']
+                for k, v in status.items()} == \
+            {'INO2_1.qbed': 'done', 'INO2_2.qbed': 'done',
+             'NOTATF_1.qbed': 'failed'}
+
+        # a file which kills its worker every time is recorded as failed
+        os.remove(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        with patch.object(ingest_qbed_command, 'validate_qbed_file',
+                          _validate_or_die), \
+                patch.dict(os.environ, {'INGEST_TEST_DIE': ''}), \
+                pytest.raises(CommandError):
+            call_command('ingest_qbed', self.tmpdir, **options)
+        status = read_status(os.path.join(self.tmpdir, 'ingest_status.tsv'))
+        assert 'A worker died' in \
+            status[os.path.join(self.tmpdir, 'INO2_1.qbed')]['error']
+
+
+def _validate_or_die(qbed, chr_format):
+    """Kill the worker process which validates INO2_1.qbed, once if
+    INGEST_TEST_DIE is the path of a marker file, or every time if it is
+    empty"""
+    marker = os.environ['INGEST_TEST_DIE']
+    if qbed.endswith('INO2_1.qbed') and \
+            not (marker and os.path.exists(marker)):
+        if marker:
+            open(marker, 'w').close()
+        os._exit(1)
+    return ingest_qbed.validate_qbed_file(qbed, chr_format)
+
+
 def test_enrichment():
     test_1 = {
         'total_background_hops': 10,
@@ -202,3 +440,162 @@ def test_hypergeom_pval():
     expected_2 = 0.983746
     assert actual_2 == pytest.approx(expected_2,
                                      rel=1e-4)
+
+
+def test_read_bed_compressed(tmp_path):
+    content = 'chr\tstart\tend\nchrI\t1\t10\n'
+    expected = pd.DataFrame({'chr': ['chrI'], 'start': [1], 'end': [10]})
+    gz_path = tmp_path / 'regions.bed.gz'
+    with gzip.open(gz_path, 'wt') as f:
+        f.write(content)
+    zip_path = tmp_path / 'regions.bed.zip'
+    with zipfile.ZipFile(zip_path, 'w') as f:
+        f.writestr('regions.bed', content)
+    for path in [gz_path, zip_path]:
+        pdt.assert_frame_equal(read_bed(str(path)), expected)
+        # an upload is decompressed by its name
+        with open(path, 'rb') as f:
+            pdt.assert_frame_equal(read_bed(f), expected)
+
+
+class TestMaxFeatureLength(APITestCase):
+
+    def test_max_feature_length(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            source = BackgroundSourceFactory.create()
+            BackgroundFactory.create(source=source, start=1, end=100)
+        # the cache key is valid for every backend, eg memcached
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            assert max_feature_length(Background) == 99
+            # a longer feature changes the version of the table, and the key
+            with self.captureOnCommitCallbacks(execute=True):
+                BackgroundFactory.create(source=source, start=1, end=500)
+            assert max_feature_length(Background) == 499
+
+
+class TestPartitionTables(SimpleTestCase):
+
+    def test_drop_requires_one_table(self):
+        # the keys of hops and background are ids of different models
+        for tables in ([], ['--table', 'hops', 'background']):
+            with pytest.raises(CommandError, match='exactly one --table'):
+                call_command('partition_tables', *tables, '--drop', '12')
+
+    def test_drop_requires_valid_keys(self):
+        with pytest.raises(CommandError, match='CCExperiment'):
+            call_command('partition_tables', '--table', 'hops',
+                         '--drop', '12', 'abc')
+
+
+class TestAsyncStreamingMiddleware(SimpleTestCase):
+
+    def test_sync_content_is_streamed(self):
+        read = []
+
+        def content():
+            for part in [b'a', b'b', b'c']:
+                read.append(part)
+                yield part
+
+        async def get_response(request):
+            return StreamingHttpResponse(content())
+        middleware = AsyncStreamingMiddleware(get_response)
+
+        async def send():
+            response = await middleware(RequestFactory().get('/'))
+            assert response.is_async
+            sent = []
+            async for part in response:
+                # each part is sent before the next one is read
+                assert read == [b'a', b'b', b'c'][:len(sent) + 1]
+                sent.append(part)
+            return sent
+        assert async_to_sync(send)() == [b'a', b'b', b'c']
+
+
+class TestReadReplicaRouter(SimpleTestCase):
+    # the local settings configure `replica` as a mirror of `default`
+
+    def test_read_replica(self):
+        assert Gene.objects.all().db == 'default'
+        with read_replica():
+            assert Gene.objects.all().db == 'replica'
+            # after a write, the reads are on the primary
+            assert router.db_for_write(Gene) == 'default'
+            assert Gene.objects.all().db == 'default'
+        with read_replica(enabled=False):
+            assert Gene.objects.all().db == 'default'
+
+    def test_middleware(self):
+        reads = []
+
+        def get_response(request):
+            reads.append(Gene.objects.all().db)
+            return HttpResponse()
+        middleware = ReadReplicaMiddleware(get_response)
+        factory = RequestFactory()
+        auth = {'HTTP_AUTHORIZATION': 'Token replica-test'}
+
+        middleware(factory.get('/api/v1/genes/', **auth))
+        # a write pins the client's reads to the primary
+        middleware(factory.post('/api/v1/genes/', **auth))
+        middleware(factory.get('/api/v1/genes/', **auth))
+        middleware(factory.get('/api/v1/genes/'))
+        assert reads == ['replica', 'default', 'default', 'replica']
+
+    def test_async_streaming_reads_replica(self):
+        reads = []
+
+        def content():
+            for part in [b'a', b'b']:
+                reads.append(Gene.objects.all().db)
+                yield part
+
+        async def get_response(request):
+            return StreamingHttpResponse(content())
+        # as in MIDDLEWARE
+        middleware = AsyncStreamingMiddleware(
+            ReadReplicaMiddleware(get_response))
+
+        async def send():
+            response = await middleware(
+                RequestFactory().get('/api/v1/genes/'))
+            return [part async for part in response]
+        assert async_to_sync(send)() == [b'a', b'b']
+        assert reads == ['replica', 'replica']
+
+    def test_production_requires_shared_cache(self):
+        # the pins are not seen by the other processes of a per process cache
+        replica = {**Production.DATABASES['default'], 'HOST': 'replica'}
+        with patch.object(Production, 'DATABASES',
+                          {**Production.DATABASES, 'replica': replica}):
+            with patch.object(Production, 'CACHES', Local.CACHES):
+                with pytest.raises(ImproperlyConfigured, match='REDIS'):
+                    Production.post_setup()
+            redis = {'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': 'redis://localhost:6379/1'}}
+            with patch.object(Production, 'CACHES', redis):
+                Production.post_setup()
+
+    def test_middleware_read_only_view(self):
+        reads = []
+        batch_view = BatchViewSet.as_view({'post': 'create'})
+
+        def get_response(request):
+            view = batch_view if request.path == '/api/v1/batch/' \
+                else lambda request: None
+            middleware.process_view(request, view, (), {})
+            reads.append(Gene.objects.all().db)
+            return HttpResponse()
+        middleware = ReadReplicaMiddleware(get_response)
+        factory = RequestFactory()
+        auth = {'HTTP_AUTHORIZATION': 'Token replica-batch-test'}
+
+        # the batch endpoint only reads, so it does not pin the client
+        middleware(factory.post('/api/v1/batch/', **auth))
+        middleware(factory.get('/api/v1/genes/', **auth))
+        middleware(factory.post('/api/v1/genes/', **auth))
+        middleware(factory.post('/api/v1/batch/', **auth))
+        assert reads == ['replica', 'replica', 'default', 'default']
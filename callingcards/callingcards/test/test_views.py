@@ -4,15 +4,27 @@ import json
 from unittest import mock
 import io
 import csv
+import gzip
 import os
+import hashlib
+from datetime import timedelta
 from decimal import Decimal
 
+import numpy as np
+import pyarrow as pa
+import pytest
+
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.storage import default_storage
 from django.forms.models import model_to_dict
+from django.db import connection, transaction
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.settings import api_settings
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
@@ -31,7 +43,8 @@ from callingcards.callingcards.models import (ChrMap, Gene, PromoterRegions,
                                               CCExperiment, Hops, Hops_s3,
                                               QcMetrics,
                                               QcR1ToR2Tf, QcR2ToR1Tf,
-                                              QcTfToTransposon)
+                                              QcTfToTransposon, ChunkedUpload,
+                                              ExperimentQcSummary, TableVersion)
 
 from callingcards.callingcards.serializers import (HarbisonChIPSerializer,
                                                    HarbisonChIPAnnotatedSerializer)  # noqa
@@ -43,18 +56,19 @@ from .factories import (ChrMapFactory, GeneFactory, PromoterRegionsFactory,
                         BackgroundSourceFactory, CCTFFactory,
                         CCExperimentFactory,
                         LabFactory,
-                        HopsSourceFactory, HopsFactory,
+                        HopsSourceFactory, HopsFactory, Hops_s3Factory,
                         QcMetricsFactory,
                         QcManualReviewFactory,
                         QcR1ToR2TfFactory, QcR2ToR1TfFactory,
                         QcTfToTransposonFactory,
                         CallingCardsSigFactory,
                         PromoterRegionsSourceFactory,
-                        random_file_from_media_directory)
+                        random_file_from_media_directory,
+                        TemporaryMediaRootMixin)
 
 from ..views import ExpressionViewSet
 
-from ..filters import HarbisonChIPFilter
+from ..filters import HarbisonChIPFilter, MultiValueFilter
 
 fake = Faker()
 
@@ -85,6 +99,58 @@ class TestChrMapViewSet(APITestCase):
         response = self.client.get(self.url)
         assert response.status_code == status.HTTP_200_OK
 
+    def test_conditional_get(self):
+        # the table versions are bumped when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            ChrMapFactory.create()
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+        response = self.client.get(self.url,
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        # the query params, including the export format, are part of the etag
+        response = self.client.get(f'{self.url}?export=tsv',
+                                   HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        export_etag = response['ETag']
+        assert export_etag != etag
+        response = self.client.get(f'{self.url}?export=tsv',
+                                   HTTP_IF_NONE_MATCH=export_etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        # a change to the table changes the etag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.chr_data)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_response_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ChrMapFactory.create()
+        response = self.client.get(self.url)
+        assert response.json()['count'] == 1
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url)
+        assert cached.content == response.content
+        assert cached['ETag'] == response['ETag']
+        assert not any('"chr_map"' in query['sql']
+                       for query in queries.captured_queries)
+
+        # a change to the table drops the cached response
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.chr_data)
+        response = self.client.get(self.url)
+        assert response.json()['count'] == 2
+
     def test_put_single(self):
         response = self.client.post(self.url, self.chr_data)
         assert response.status_code == status.HTTP_201_CREATED
@@ -145,6 +211,32 @@ class TestGeneViewSet(APITestCase):
             content_type='application/json')
         assert response.status_code == status.HTTP_201_CREATED
 
+    def test_upload_csv_unknown_placeholders(self):
+        header = ['chr', 'start', 'end', 'strand', 'source']
+        data = [[self.chr_record.pk, 100 * i + 1, 100 * i + 50, '+', 'test']
+                for i in range(3)]
+        with io.StringIO() as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(data)
+            f.seek(0)
+            csv_file = SimpleUploadedFile("test_gene.csv",
+                                          f.read().encode('utf-8'),
+                                          content_type="text/csv")
+
+        response = self.client.post(reverse('gene-upload-csv'),
+                                    {'csv_file': csv_file},
+                                    format='multipart')
+        assert response.status_code == status.HTTP_201_CREATED
+
+        genes = Gene.objects.filter(source='test').order_by('id')
+        assert genes.count() == 3
+        # each record receives a distinct placeholder, as with Gene.save()
+        for gene in genes:
+            assert gene.locus_tag == f'unknown_{gene.id}'
+            assert gene.gene == f'unknown_{gene.id}'
+            assert gene.alias == f'unknown_{gene.id}'
+
     def test_get_fields(self):
         response = self.client.get(reverse('gene-fields'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -224,7 +316,7 @@ class TestGeneViewSet(APITestCase):
         #      'serializer_class_path': 'myapp.serializers.GeneSerializer'})
 
 
-class TestPromoterRegionsViewSet(APITestCase):
+class TestPromoterRegionsViewSet(TemporaryMediaRootMixin, APITestCase):
     """
     Tests /promoter_regions detail operations.
     """
@@ -249,6 +341,41 @@ class TestPromoterRegionsViewSet(APITestCase):
         self.url = reverse('promoterregions-list')
         settings.DEBUG = True
 
+    def test_calling_cards_range_join(self):
+        promoter = PromoterRegionsFactory.create(
+            chr=self.chr_record, start=100, end=200, strand='+',
+            associated_feature=self.gene_record,
+            source=self.promoterregionssource)
+        lab = LabFactory.create()
+        experiments = [CCExperimentFactory.create(lab=lab) for _ in range(2)]
+        # hops at the boundaries of the promoter are in it
+        for experiment, starts in zip(experiments, [[99, 100, 200],
+                                                    [150, 201]]):
+            for start in starts:
+                HopsFactory.create(chr=self.chr_record, start=start,
+                                   end=start + 1, experiment=experiment,
+                                   strand='+')
+        background_source = BackgroundSourceFactory.create()
+        for start in [50, 120, 180]:
+            BackgroundFactory.create(chr=self.chr_record, start=start,
+                                     end=start + 1,
+                                     source=background_source)
+
+        counts = {(x['promoter_id'], x['experiment_id']): x['experiment_hops']
+                  for x in PromoterRegions.objects.calling_cards_experiment(
+                      experiment_ids=[x.pk for x in experiments])}
+        assert counts == {(promoter.pk, experiments[0].pk): 2,
+                          (promoter.pk, experiments[1].pk): 1}
+        assert list(PromoterRegions.objects.calling_cards_experiment(
+            experiment_id=experiments[1].pk,
+            consider_strand=True).values_list('experiment_hops', flat=True))\
+            == [1]
+
+        background = list(PromoterRegions.objects.calling_cards_background(
+            background_source=background_source.pk))
+        assert [(x['promoter_id'], x['background_hops'])
+                for x in background] == [(promoter.pk, 2)]
+
     def test_post_fail(self):
         response = self.client.post(self.url, {})
         assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -344,6 +471,32 @@ class TestPromoterRegionsViewSet(APITestCase):
         assert response['Content-Disposition'] == \
             'attachment; filename="data.csv.gz"'
 
+        # the async endpoint streams the same result
+        async_response = self.client.get(
+            reverse('async-promoterregions-callingcards'))
+        assert async_response.status_code == status.HTTP_200_OK
+        assert async_response['Content-Type'] == 'application/gzip'
+        assert gzip.decompress(b''.join(async_response)) == \
+            gzip.decompress(response.content)
+
+        # the manifest lists the result files rather than sending them
+        response = self.client.get(callingcards_url, {'manifest': 'true'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 1
+        entry = response.data['files'][0]
+        assert entry['experiment_id'] == experiment.pk
+        download_url = reverse('callingcardssig-download',
+                               kwargs={'pk': callingcards_sig.pk})
+        assert entry['url'].endswith(download_url)
+        content = b''.join(self.client.get(download_url).streaming_content)
+        assert entry['size'] == len(content)
+        assert entry['sha256'] == hashlib.sha256(content).hexdigest()
+        assert entry['row_count'] == \
+            len(gzip.decompress(content).splitlines()) - 1
+        # the row count and size are recorded
+        callingcards_sig.refresh_from_db()
+        assert callingcards_sig.row_count == entry['row_count']
+
 
 class TestHarbisonChIP(APITestCase):
     """
@@ -368,10 +521,70 @@ class TestHarbisonChIP(APITestCase):
         response = self.client.post(self.url, {})
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_matrix(self):
+        target = GeneFactory.create(chr=self.gene_record.chr)
+        HarbisonChIPFactory.create(uploader=self.user,
+                                   gene=target,
+                                   tf=self.gene_record,
+                                   pval=Decimal('0.5'))
+        url = reverse('harbisonchip-matrix')
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        matrix = np.load(io.BytesIO(response.content))
+        assert list(matrix['row_id']) == [self.gene_record.pk]
+        assert set(matrix['col_id']) == {self.gene_record.pk, target.pk}
+        assert matrix['pval'].shape == (1, 2)
+
+        # the matrix is cached, and sliced by locus tag, gene or id
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, {'tfs': self.gene_record.locus_tag,
+                      'targets': str(target.pk)})
+        assert not any('"harbison_chip"' in query['sql']
+                       for query in queries.captured_queries)
+        matrix = np.load(io.BytesIO(response.content))
+        assert matrix['pval'].shape == (1, 1)
+        assert matrix['pval'][0, 0] == pytest.approx(0.5)
+
+        # a 304 does not load the matrix
+        etag = response['ETag']
+        with mock.patch('callingcards.callingcards.views.mixins.MatrixMixin'
+                        '.npz_to_matrix') as mock_npz_to_matrix:
+            response = self.client.get(
+                url, {'tfs': self.gene_record.locus_tag,
+                      'targets': str(target.pk)},
+                HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        mock_npz_to_matrix.assert_not_called()
+
+        response = self.client.get(url, {'targets': 'not_a_gene'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_get_url(self):
         response = self.client.get(self.url)
         assert response.status_code == status.HTTP_200_OK
 
+    def test_fast_list_matches_serializer(self):
+        HarbisonChIPFactory.create(uploader=self.user,
+                                   gene=self.gene_record,
+                                   tf=self.gene_record)
+        response = self.client.get(self.url)
+        expected = HarbisonChIPSerializer(
+            HarbisonChIP.objects.order_by('pk'), many=True).data
+        assert response.json()['results'] == \
+            json.loads(JSONRenderer().render(expected))
+
+        # the users are joined rather than looked up per row, so the number
+        # of queries does not depend on the number of rows
+        query_counts = []
+        for _ in range(2):
+            HarbisonChIPFactory.create(gene=self.gene_record,
+                                       tf=self.gene_record)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url)
+            query_counts.append(len(queries.captured_queries))
+        assert query_counts[0] == query_counts[1]
+
     def test_put_single(self):
         harbison_chip_data = factory.build(
             dict,
@@ -646,12 +859,37 @@ class TestBackground(APITestCase):
 
     def setUp(self):
         self.user = UserFactory.create()
-        self.chr_record = ChrMapFactory.create()
-        self.backgroundsource = BackgroundSourceFactory.create()
+        # the table versions are bumped when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chr_record = ChrMapFactory.create()
+            self.backgroundsource = BackgroundSourceFactory.create()
         self.client.credentials(
             HTTP_AUTHORIZATION=f'Token {self.user.auth_token}')
         self.url = reverse('background-list')
 
+    def test_region_filter(self):
+        for start, end in [(1, 100), (1000, 1200), (5000, 5001)]:
+            BackgroundFactory.create(chr=self.chr_record,
+                                     source=self.backgroundsource,
+                                     start=start, end=end)
+
+        def starts(region):
+            response = self.client.get(self.url, {'region': region})
+            assert response.status_code == status.HTTP_200_OK
+            return sorted(x['start'] for x in response.json()['results'])
+
+        # overlapping records, in any chromosome naming format
+        assert starts('chrI:1100-1150') == [1000]
+        assert starts('NC_001133.9:90-1000') == [1, 1000]
+        assert starts('I:1201-4999') == []
+        # several regions, and a whole chromosome
+        assert starts('chrI:50-60,chrI:5001-6000') == [1, 5000]
+        assert starts('chrI') == [1, 1000, 5000]
+
+        for region in ['chrI:200-100', 'chrUnknown:1-2', 'chrI:a-b']:
+            response = self.client.get(self.url, {'region': region})
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_post_fail(self):
         response = self.client.post(self.url, {})
         assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -660,6 +898,168 @@ class TestBackground(APITestCase):
         response = self.client.get(self.url)
         assert response.status_code == status.HTTP_200_OK
 
+    def test_cursor_pagination(self):
+        other_chr = ChrMapFactory.create(ucsc='chrII')
+        for chr_record, start in [(other_chr, 5), (self.chr_record, 30),
+                                  (self.chr_record, 10), (other_chr, 1),
+                                  (self.chr_record, 10), (self.chr_record, 20),
+                                  (other_chr, 5)]:
+            BackgroundFactory.create(chr=chr_record, start=start,
+                                     end=start + 1,
+                                     source=self.backgroundsource)
+        expected = list(Background.objects
+                        .order_by('chr_id', 'start', 'id')
+                        .values_list('id', flat=True))
+
+        pages = []
+        url = f'{self.url}?pagination=cursor&cursor_ordering=genomic&limit=3'
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data
+            pages.append(response.data)
+            url = response.data['next']
+        assert [len(page['results']) for page in pages] == [3, 3, 1]
+        assert [record['id'] for page in pages
+                for record in page['results']] == expected
+        assert pages[0]['previous'] is None
+
+        # previous from the last page is the middle page
+        response = self.client.get(pages[-1]['previous'])
+        assert response.data['results'] == pages[1]['results']
+        response = self.client.get(response.data['previous'])
+        assert response.data['results'] == pages[0]['results']
+        assert response.data['previous'] is None
+
+        response = self.client.get(f'{self.url}?cursor=notacursor')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_count_is_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundFactory.create(chr=self.chr_record,
+                                     source=self.backgroundsource)
+        url = reverse('background-count')
+        response = self.client.get(url)
+        assert response.data == {'count': 1}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.json() == {'count': 1}
+        assert not any('COUNT(' in query['sql'].upper()
+                       for query in queries.captured_queries)
+
+        # a save bumps the table version, which invalidates the count
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundFactory.create(chr=self.chr_record,
+                                     source=self.backgroundsource)
+        response = self.client.get(url)
+        assert response.json() == {'count': 2}
+
+        # no planner statistics on sqlite, so the count is exact
+        response = self.client.get(f'{url}?approximate=true')
+        assert response.json() == {'count': 2, 'approximate': False}
+
+    def test_delete_bumps_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundFactory.create_batch(5, chr=self.chr_record,
+                                           source=self.backgroundsource)
+        table = Background._meta.db_table
+        version = TableVersion.objects.stamps([table])[table][0]
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, \
+                CaptureQueriesContext(connection) as queries:
+            Background.objects.all().delete()
+        # a fast delete, with one statement, and one bump on commit
+        assert len([x for x in queries.captured_queries
+                    if x['sql'].startswith('DELETE')]) == 1
+        assert len(callbacks) == 1
+        assert TableVersion.objects.stamps([table])[table][0] == version + 1
+
+    def test_sparse_fieldsets(self):
+        for start in [30, 10, 20]:
+            BackgroundFactory.create(chr=self.chr_record, start=start,
+                                     end=start + 1, strand='+',
+                                     source=self.backgroundsource)
+        fields = ['chr', 'start', 'end', 'strand']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f'{self.url}?fields={",".join(fields)}')
+        assert response.status_code == status.HTTP_200_OK
+        assert [set(x) for x in response.json()['results']] == \
+            [set(fields)] * 3
+        # the join to the user table for uploader is dropped
+        assert not any('"background" INNER JOIN "users_user"' in query['sql']
+                       for query in queries.captured_queries)
+
+        response = self.client.get(
+            f'{self.url}?fields=start&pagination=cursor'
+            f'&cursor_ordering=genomic&limit=2')
+        assert response.json()['results'] == [{'start': 10}, {'start': 20}]
+        response = self.client.get(response.json()['next'])
+        assert response.json()['results'] == [{'start': 30}]
+
+        response = self.client.get(f'{self.url}?omit=uploader,modifiedBy')
+        assert 'uploader' not in response.json()['results'][0]
+        assert 'start' in response.json()['results'][0]
+
+        response = self.client.get(f'{self.url}?fields=start&export=tsv')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        assert content.decode('utf-8').splitlines()[0] == 'start'
+
+        # a kept uploader is exported as it is serialized, by username
+        usernames = set(Background.objects.values_list('uploader__username',
+                                                       flat=True))
+        response = self.client.get(
+            f'{self.url}?fields=start,uploader&export=tsv')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        rows = [x.split('\t') for x in
+                content.decode('utf-8').splitlines()]
+        # in the order of the serializer fields
+        assert rows[0] == ['uploader', 'start']
+        assert {x[0] for x in rows[1:]} == usernames
+
+        response = self.client.get(f'{self.url}?fields=notafield')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export(self):
+        for start in [30, 10, 20]:
+            BackgroundFactory.create(chr=self.chr_record, start=start,
+                                     end=start + 1, strand='+',
+                                     source=self.backgroundsource)
+        expected = list(Background.objects.order_by('pk')
+                        .values_list('id', 'start'))
+
+        response = self.client.get(f'{self.url}?export=tsv&limit=1')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Disposition'] == \
+            'attachment; filename="background.tsv.gz"'
+        content = gzip.decompress(b''.join(response.streaming_content))
+        rows = list(csv.DictReader(io.StringIO(content.decode('utf-8')),
+                                   delimiter='\t'))
+        # pagination does not apply to an export
+        assert [(int(x['id']), int(x['start'])) for x in rows] == expected
+        assert rows[0]['chr'] == str(self.chr_record.pk)
+        assert rows[0]['source'] == self.backgroundsource.pk
+
+        response = self.client.get(f'{self.url}?export=xlsx')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export_arrow(self):
+        for start in [30, 10, 20]:
+            BackgroundFactory.create(chr=self.chr_record, start=start,
+                                     end=start + 1, strand='+',
+                                     source=self.backgroundsource)
+        response = self.client.get(f'{self.url}?export=arrow')
+        assert response.status_code == status.HTTP_200_OK
+        table = pa.ipc.open_stream(
+            b''.join(response.streaming_content)).read_all()
+        assert table.num_rows == 3
+        assert table.schema.field('start').type == pa.int64()
+        assert table.column('start').to_pylist() == \
+            list(Background.objects.order_by('pk')
+                 .values_list('start', flat=True))
+
     def test_put_single(self):
         background_data = factory.build(
             dict, FACTORY_CLASS=BackgroundFactory)
@@ -674,6 +1074,57 @@ class TestBackground(APITestCase):
         assert background.chr.pk == background_data.get('chr')
         assert background.uploader.username == self.user.username
 
+    def _bed_file(self, rows):
+        content = 'chr\tstart\tend\tdepth\tstrand\n' + \
+            ''.join('\t'.join(map(str, row)) + '\n' for row in rows)
+        return SimpleUploadedFile('background.qbed',
+                                  content.encode('utf-8'),
+                                  content_type='text/plain')
+
+    def test_upload_bed(self):
+        bed_file = self._bed_file([['chrI', 10, 11, 3, '+'],
+                                   ['chrI', 200, 201, 1, '-'],
+                                   ['chrI', 300, 301, 2, '*']])
+        response = self.client.post(reverse('background-upload-bed'),
+                                    {'bed_file': bed_file,
+                                     'chr_format': 'ucsc',
+                                     'source': self.backgroundsource.pk},
+                                    format='multipart')
+        assert response.status_code == status.HTTP_201_CREATED
+
+        records = Background.objects.filter(source=self.backgroundsource)
+        assert records.count() == 3
+        assert set(records.values_list('chr_id', flat=True)) == \
+            {self.chr_record.pk}
+        assert records.get(start=200).strand == '-'
+        assert records.first().uploader.username == self.user.username
+
+    def test_upload_bed_invalid_coordinates(self):
+        seqlength = self.chr_record.seqlength
+        bed_file = self._bed_file([['chrI', 0, 1, 3, '+'],
+                                   ['chrI', 10, seqlength + 1, 1, '-'],
+                                   ['chrII', 10, 11, 1, '-']])
+        response = self.client.post(reverse('background-upload-bed'),
+                                    {'bed_file': bed_file,
+                                     'chr_format': 'ucsc',
+                                     'source': self.backgroundsource.pk},
+                                    format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'chrII' in response.data['error']
+        assert Background.objects.count() == 0
+
+        bed_file = self._bed_file([['chrI', 0, 1, 3, '+'],
+                                   ['chrI', 10, seqlength + 1, 1, '-']])
+        response = self.client.post(reverse('background-upload-bed'),
+                                    {'bed_file': bed_file,
+                                     'chr_format': 'ucsc',
+                                     'source': self.backgroundsource.pk},
+                                    format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'start must be greater than 0' in response.data['error']
+        assert 'chromosome length' in response.data['error']
+        assert Background.objects.count() == 0
+
 
 class TestCCTF(APITestCase):
     """
@@ -720,7 +1171,7 @@ class TestCCTF(APITestCase):
             response.data['results'][0].get('tf_gene')
 
 
-class TestCCExperiment(APITestCase):
+class TestCCExperiment(TemporaryMediaRootMixin, APITestCase):
     """
     Tests /ccexperiment detail operations.
     """
@@ -757,8 +1208,63 @@ class TestCCExperiment(APITestCase):
         assert ccexperiment.tf.pk == self.ccexperiment_data.get('tf')
         assert ccexperiment.uploader.username == self.user.username
 
-
-class TestHops_s3(APITestCase):
+    def test_multi_value_filter(self):
+        experiments = [CCExperimentFactory.create(lab=self.lab_record)
+                       for _ in range(3)]
+
+        def ids(params):
+            response = self.client.get(self.url, params)
+            assert response.status_code == status.HTTP_200_OK
+            return sorted(x['id'] for x in response.json()['results'])
+
+        locus_tags = [x.tf.tf.locus_tag for x in experiments]
+        expected = sorted(x.pk for x in experiments[:2])
+        # comma separated, repeated or both, in any case
+        assert ids({'tf_locus_tag': ','.join(locus_tags[:2])}) == expected
+        assert ids({'tf_locus_tag': [locus_tags[0].lower(),
+                                     locus_tags[1]]}) == expected
+        assert ids({'experiment_id': [f'{experiments[0].pk},',
+                                      experiments[2].pk]}) == \
+            sorted(x.pk for x in [experiments[0], experiments[2]])
+        # a single value, as before
+        assert ids({'tf_locus_tag': locus_tags[2]}) == [experiments[2].pk]
+        # long lists are split into several IN
+        with mock.patch.object(MultiValueFilter, 'chunk_size', 2):
+            assert ids({'experiment_id': ','.join(
+                str(x.pk) for x in experiments)}) == \
+                sorted(x.pk for x in experiments)
+
+    def test_delete_hops(self):
+        chr_record = ChrMapFactory.create()
+        experiments = [CCExperimentFactory.create(lab=self.lab_record)
+                       for _ in range(2)]
+        for experiment in experiments:
+            for start in [100, 200]:
+                HopsFactory.create(chr=chr_record, start=start,
+                                   end=start + 1, experiment=experiment)
+        version = TableVersion.objects.stamps(['hops'])['hops']
+
+        # the hops are deleted with one statement, not one per hop
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(
+                reverse('ccexperiment-detail', args=[experiments[0].pk]))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert len([x for x in queries.captured_queries
+                    if x['sql'].startswith('DELETE FROM "hops"')]) == 1
+        assert list(Hops.objects.values_list('experiment_id', flat=True)
+                    .distinct()) == [experiments[1].pk]
+        assert TableVersion.objects.stamps(['hops'])['hops'] != version
+
+        # so are the hops of a queryset delete, eg a bulk delete in the admin
+        with CaptureQueriesContext(connection) as queries:
+            CCExperiment.objects.filter(pk=experiments[1].pk).delete()
+        assert len([x for x in queries.captured_queries
+                    if x['sql'].startswith('DELETE FROM "hops"')]) == 1
+        assert not Hops.objects.exists()
+
+
+class TestHops_s3(TemporaryMediaRootMixin, APITestCase):
     """
     Tests /hops_s3 detail operations.
     """
@@ -780,6 +1286,81 @@ class TestHops_s3(APITestCase):
         response = self.client.post(self.url, {})
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_sparse_fieldsets_join_users(self):
+        for _ in range(3):
+            Hops_s3Factory.create(source=self.source_record,
+                                  experiment=self.experiment_record)
+        # the list is serialized, since the file field is not projected.
+        # The users are joined, rather than read once per row
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url,
+                                       {'fields': 'id,qbed,uploader'})
+        assert {x['uploader'] for x in response.json()['results']} == \
+            set(Hops_s3.objects.values_list('uploader__username', flat=True))
+        assert not any(query['sql'].startswith('SELECT "users_user"')
+                       for query in queries.captured_queries)
+
+    def test_async_qbed(self):
+        record = Hops_s3Factory.create(uploader=self.user,
+                                       source=self.source_record,
+                                       experiment=self.experiment_record)
+        url = reverse('async-hopss3-qbed', kwargs={'pk': record.pk})
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        with default_storage.open(record.qbed.name, 'rb') as f:
+            assert b''.join(response) == f.read()
+
+        self.client.credentials()
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_download(self):
+        record = Hops_s3Factory.create(uploader=self.user,
+                                       source=self.source_record,
+                                       experiment=self.experiment_record)
+        url = reverse('hopss3-download', kwargs={'pk': record.pk})
+        with default_storage.open(record.qbed.name, 'rb') as f:
+            content = f.read()
+
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Accept-Ranges'] == 'bytes'
+        assert b''.join(response.streaming_content) == content
+
+        # a download may be resumed, or fetched in parts
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == f'bytes 10-19/{len(content)}'
+        assert b''.join(response.streaming_content) == content[10:20]
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        assert b''.join(response.streaming_content) == content[-5:]
+        response = self.client.get(url,
+                                   HTTP_RANGE=f'bytes={len(content)}-')
+        assert response.status_code == \
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        # a range of a changed file is not served
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19',
+                                   HTTP_IF_RANGE='"stale"')
+        assert response.status_code == status.HTTP_200_OK
+
+        # the transfer is handed to the front end server
+        with override_settings(FILE_SERVING_BACKEND='x-accel-redirect'):
+            response = self.client.get(url)
+        assert response['X-Accel-Redirect'] == \
+            settings.FILE_SERVING_ACCEL_PREFIX + record.qbed.name
+        assert response.content == b''
+
+        # the media urls are served to authenticated users
+        media_url = reverse('media', kwargs={'path': record.qbed.name})
+        response = self.client.get(media_url)
+        assert b''.join(response.streaming_content) == content
+        response = self.client.get(reverse('media',
+                                           kwargs={'path': '../pyproject.toml'}))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        self.client.credentials()
+        response = self.client.get(media_url)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
     def test_create_hops_s3_with_ccexpr(self):
         media_directory = default_storage.location
         qbed_file = random_file_from_media_directory('qbed')
@@ -867,6 +1448,179 @@ class TestHops_s3(APITestCase):
         assert hops_s3.experiment.pk != post_data.get('experiment')
         assert hops_s3.notes == post_data.get('notes')
 
+    def test_reupload_is_deduplicated(self):
+        media_directory = default_storage.location
+        qbed_file = random_file_from_media_directory('qbed')
+        upload_file = os.path.join(media_directory, qbed_file)
+        with open(upload_file, 'rb') as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+
+        records = []
+        for _ in range(2):
+            with open(upload_file, 'rb') as f:
+                response = self.client.post(
+                    self.url,
+                    {'chr_format': 'mitra',
+                     'source': self.source_record.pk,
+                     'experiment': self.experiment_record.pk,
+                     'qbed': f},
+                    format='multipart')
+            assert response.status_code == status.HTTP_201_CREATED
+            records.append(Hops_s3.objects.get(pk=response.data.get('id')))
+
+        assert records[0].sha256 == records[1].sha256 == sha256
+        assert records[0].qbed.name == records[1].qbed.name
+        assert sha256 in records[0].qbed.name
+
+        # a rolled back delete keeps the file
+        name = records[0].qbed.name
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Hops_s3.objects.get(pk=records[0].pk).delete()
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+        assert default_storage.exists(name)
+        # the file is only removed, on commit, with the last record which
+        # refers to it
+        with self.captureOnCommitCallbacks(execute=True):
+            records[0].delete()
+        assert default_storage.exists(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            records[1].delete()
+        assert not default_storage.exists(name)
+
+    def test_search(self):
+        gal4 = CCExperimentFactory.create(
+            lab=self.lab_record, tf=CCTFFactory.create(tf=self.tf_gene))
+        records = [Hops_s3Factory.create(experiment=x, source=self.source_record)
+                   for x in [gal4, self.experiment_record]]
+
+        def search(term):
+            response = self.client.get(self.url, {'search': term})
+            assert response.status_code == status.HTTP_200_OK
+            return sorted(x['id'] for x in response.json()['results'])
+
+        # related text fields, in any case, through the experiment and tf
+        assert search('tfge') == [records[0].pk]
+        assert search(gal4.batch.upper()) == [records[0].pk]
+        # ids, uuids and dates are matched exactly, and other terms do not
+        # match them
+        assert records[1].pk in search(str(self.experiment_record.pk))
+        assert search(str(self.user.pk)) == []
+        # users by their username
+        assert records[0].pk in search(records[0].uploader.username.upper())
+        assert records[1].pk in search(records[1].modifiedBy.username)
+        assert search(records[0].uploadDate.isoformat()) == \
+            sorted(x.pk for x in records)
+        assert search('not_a_tf') == []
+        # all terms must match
+        assert search(f'tfgene {self.experiment_record.batch}') == []
+
+    def test_chunked_upload(self):
+        media_directory = default_storage.location
+        qbed_file = random_file_from_media_directory('qbed')
+        with open(os.path.join(media_directory, qbed_file), 'rb') as f:
+            content = f.read()
+        chunk_size = len(content) // 3 + 1
+        chunks = {offset: content[offset:offset + chunk_size]
+                  for offset in range(0, len(content), chunk_size)}
+
+        response = self.client.post(reverse('hopss3-chunked-upload'),
+                                    {'filename': 'sample.qbed',
+                                     'size': len(content)})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['targets'] == ['create']
+        upload_id = response.data['upload_id']
+        chunk_url = reverse('hopss3-chunked-upload-chunk',
+                            kwargs={'upload_id': upload_id})
+        finalize_url = reverse('hopss3-chunked-upload-finalize',
+                               kwargs={'upload_id': upload_id})
+
+        # send the chunks out of order, leaving out the first
+        for offset in sorted(chunks, reverse=True)[:-1]:
+            response = self.client.put(
+                f'{chunk_url}?offset={offset}', chunks[offset],
+                content_type='application/octet-stream')
+            assert response.status_code == status.HTTP_200_OK
+        response = self.client.get(chunk_url)
+        assert response.data['missing'] == [[0, chunk_size]]
+
+        post_data = {'chr_format': 'mitra',
+                     'source': self.source_record.pk,
+                     'experiment': self.experiment_record.pk}
+        response = self.client.post(finalize_url, post_data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        response = self.client.put(f'{chunk_url}?offset=0', chunks[0],
+                                   content_type='application/octet-stream')
+        assert response.data['missing'] == []
+        # a re-sent chunk replaces the previous one
+        response = self.client.put(f'{chunk_url}?offset=0', chunks[0],
+                                   content_type='application/octet-stream')
+        assert response.data['missing'] == []
+        upload = ChunkedUpload.objects.get(upload_id=upload_id)
+        assert [x[:2] for x in upload.chunks()] == \
+            [(offset, len(chunk)) for offset, chunk in chunks.items()]
+
+        # the checksum is required, since it was not sent at initialization
+        response = self.client.post(finalize_url, post_data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'sha256 is required' in response.data['error']
+
+        response = self.client.post(finalize_url,
+                                    {**post_data, 'sha256': '0' * 64})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'Checksum mismatch' in response.data['error']
+        assert Hops_s3.objects.count() == 0
+
+        response = self.client.post(
+            finalize_url,
+            {**post_data, 'sha256': hashlib.sha256(content).hexdigest()})
+        assert response.status_code == status.HTTP_201_CREATED
+        hops_s3 = Hops_s3.objects.get(pk=response.data.get('id'))
+        assert hops_s3.experiment.pk == self.experiment_record.pk
+        with hops_s3.qbed.open('rb') as f:
+            assert f.read() == content
+
+        upload = ChunkedUpload.objects.get(upload_id=upload_id)
+        assert upload.status == ChunkedUpload.COMPLETE
+        assert upload.chunks() == []
+        response = self.client.put(f'{chunk_url}?offset=0', chunks[0],
+                                   content_type='application/octet-stream')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_chunked_upload_expires(self):
+        uploads = []
+        for _ in range(2):
+            response = self.client.post(reverse('hopss3-chunked-upload'),
+                                        {'filename': 'sample.qbed',
+                                         'size': 10})
+            chunk_url = reverse(
+                'hopss3-chunked-upload-chunk',
+                kwargs={'upload_id': response.data['upload_id']})
+            self.client.put(f'{chunk_url}?offset=0', b'01234',
+                            content_type='application/octet-stream')
+            uploads.append((ChunkedUpload.objects.get(
+                upload_id=response.data['upload_id']), chunk_url))
+        ChunkedUpload.objects.update(
+            modified=timezone.now() - timedelta(
+                seconds=settings.CHUNKED_UPLOAD_EXPIRE_SECONDS + 1))
+
+        # an expired upload is removed when it is requested
+        upload, chunk_url = uploads[0]
+        response = self.client.get(chunk_url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert 'expired' in response.data['error']
+        assert upload.chunks() == []
+
+        # or by the command
+        upload, chunk_url = uploads[1]
+        call_command('expire_chunked_uploads', stdout=io.StringIO())
+        assert not ChunkedUpload.objects.exists()
+        assert upload.chunks() == []
+
 
 class TestQcTfToTransposon(APITestCase):
     """
@@ -1121,6 +1875,59 @@ class TestQcManualReviewViewSet(APITestCase):
         assert self.qc_manual_review.uploadDate != \
             self.qc_manual_review.modified
 
+    def test_bulk_update(self):
+        second_review = QcManualReviewFactory.create(
+            experiment__lab=self.qc_manual_review.experiment.lab)
+        update_data = [
+            {'id': self.qc_manual_review.pk, 'note': 'updated_value'},
+            # unchanged, so not in the response
+            {'id': second_review.pk, 'note': second_review.note}]
+        response = self.client.patch(self.url, update_data, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert [x['id'] for x in response.json()] == \
+            [self.qc_manual_review.pk]
+
+        self.qc_manual_review.refresh_from_db()
+        assert self.qc_manual_review.note == 'updated_value'
+        assert self.qc_manual_review.modifiedBy.username == \
+            self.second_user.username
+        second_review.refresh_from_db()
+        assert second_review.modifiedBy.username != \
+            self.second_user.username
+
+        # nothing is written if any record is invalid
+        response = self.client.patch(
+            self.url,
+            [{'id': self.qc_manual_review.pk, 'note': 'again'},
+             {'id': second_review.pk, 'rank_recall': 'x' * 50}],
+            format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()['errors'][0] == {}
+        self.qc_manual_review.refresh_from_db()
+        assert self.qc_manual_review.note == 'updated_value'
+
+        response = self.client.patch(self.url, [{'id': -1, 'note': 'x'}],
+                                     format='json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        # the ids are validated before they are queried
+        for invalid_id in ['abc', {'gt': 1}, [1, 2], None]:
+            response = self.client.patch(
+                self.url, [{'id': invalid_id, 'note': 'x'}], format='json')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+        # a numeric string is the same record as the number
+        response = self.client.patch(
+            self.url,
+            [{'id': str(self.qc_manual_review.pk), 'note': 'as a string'}],
+            format='json')
+        assert response.status_code == status.HTTP_200_OK
+        response = self.client.patch(
+            self.url,
+            [{'id': self.qc_manual_review.pk, 'note': 'x'},
+             {'id': str(self.qc_manual_review.pk), 'note': 'y'}],
+            format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 
 class TestQcReviewViewSet(APITestCase):
     """
@@ -1154,6 +1961,63 @@ class TestQcReviewViewSet(APITestCase):
         response = self.client.get(self.url)
         assert response.status_code == status.HTTP_200_OK
 
+    def test_summary_is_maintained(self):
+        # the summary is created with the experiment and updated by the
+        # records it is calculated from
+        summary = ExperimentQcSummary.objects.get(
+            experiment=self.experiment_record)
+        assert summary.r1_r2_max_tally == self.qcr1tor2tf_record.tally
+        assert summary.rank_recall is None
+
+        QcManualReviewFactory.create(experiment=self.experiment_record,
+                                     uploader=self.user,
+                                     rank_recall='pass')
+        self.qcr1tor2tf_record.edit_dist = 3
+        self.qcr1tor2tf_record.save()
+
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        row = next(x for x in response.json()['results']
+                   if x['experiment_id'] == self.experiment_record.pk)
+        assert row['rank_recall'] == 'pass'
+        assert int(row['r1_r2_max_tally_edit_dist']) == 3
+
+        response = self.client.get(reverse('qcr1tor2summary-list'))
+        assert response.status_code == status.HTTP_200_OK
+        row = next(x for x in response.json()
+                   if x['experiment_id'] == self.experiment_record.pk)
+        assert row['r1_r2_status'] == 'fail'
+        assert row['r2_r1_status'] == \
+            ('pass' if self.qcr2tor1tf_record.edit_dist == 0 else 'fail')
+
+        # a bulk update of the reviews, by experiment, refreshes the summary
+        response = self.client.patch(
+            self.url,
+            [{'experiment_id': self.experiment_record.pk,
+              'rank_recall': 'fail'}],
+            format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0]['rank_recall'] == 'fail'
+        assert ExperimentQcSummary.objects.get(
+            experiment=self.experiment_record).rank_recall == 'fail'
+
+        # the summary is deleted with the experiment
+        self.experiment_record.delete()
+        assert not ExperimentQcSummary.objects.filter(
+            experiment_id=self.experiment_record.pk).exists()
+
+    def test_missing_summary_is_created(self):
+        # eg an experiment which was loaded before the summary table existed
+        ExperimentQcSummary.objects\
+            .filter(experiment=self.experiment_record).delete()
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert self.experiment_record.pk in \
+            [x['experiment_id'] for x in response.json()['results']]
+        assert ExperimentQcSummary.objects.get(
+            experiment=self.experiment_record).r1_r2_max_tally == \
+            self.qcr1tor2tf_record.tally
+
     # def test_put_single(self):
     #     # Prepare update data
     #     update_data = {
@@ -1213,3 +2077,62 @@ class TestExpressionViewSet(APITestCase):
         url = reverse('expression-fields')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestBatchViewSet(TemporaryMediaRootMixin, APITestCase):
+    """
+    Tests /batch operations.
+    """
+
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.user.auth_token}')
+        self.url = reverse('batch-list')
+        self.genes = [GeneFactory.create() for _ in range(3)]
+
+    def test_batch(self):
+        locus_tags = ','.join(x.locus_tag for x in self.genes[:2])
+        response = self.client.post(self.url, {'requests': [
+            'genes/',
+            {'id': 'some', 'path': '/api/v1/genes/',
+             'params': {'locus_tag': locus_tags}},
+            'genes/fields',
+            'not_an_endpoint/',
+            '/admin/',
+        ]}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        responses = response.json()['responses']
+
+        assert [x['status'] for x in responses] == [200, 200, 200, 404, 404]
+        assert responses[0]['data'] == \
+            self.client.get(reverse('gene-list')).json()
+        assert responses[1]['id'] == 'some'
+        assert responses[1]['path'] == \
+            f'/api/v1/genes/?locus_tag={locus_tags.replace(",", "%2C")}'
+        assert sorted(x['id'] for x in responses[1]['data']['results']) == \
+            sorted(x.pk for x in self.genes[:2])
+        assert 'readable' in responses[2]['data']
+
+        # the body of a list of requests, and the errors of a request
+        response = self.client.post(
+            self.url, ['genes/?locus_tag=a,b&start=not_a_number'],
+            format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['responses'][0]['status'] == \
+            status.HTTP_400_BAD_REQUEST
+
+    def test_invalid(self):
+        for body in [{}, [], {'requests': 'genes/'}, [{'params': {}}],
+                     ['batch/'] * 2, ['genes/'] * 51]:
+            response = self.client.post(self.url, body, format='json')
+            if body == ['batch/'] * 2:
+                # a batch may not contain a batch
+                assert [x['status'] for x in
+                        response.json()['responses']] == [404, 404]
+            else:
+                assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        self.client.credentials()
+        response = self.client.post(self.url, ['genes/'], format='json')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,152 @@
+"""
+.. module:: cached_count
+   :synopsis: Cached and estimated counts of querysets
+
+Functions used by
+:class:`~callingcards.views.mixins.CountModelMixin.CountModelMixin` to avoid
+a `COUNT(*)` over a large table on every request.
+
+- :func:`cached_count` stores an exact count in the Django cache. The key is
+  the SQL of the query together with the
+  :class:`~callingcards.models.TableVersion` of every table the query reads,
+  so a count is recalculated after any change to those tables, and never
+  otherwise.
+- :func:`estimate_count` returns the PostgreSQL planner's estimate: the
+  `pg_class.reltuples` of the table for an unfiltered query, or the row
+  estimate of `EXPLAIN` for a filtered one. These are only as current as the
+  last `ANALYZE` of the table.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-20
+"""
+import hashlib
+import json
+import logging
+from typing import Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models.sql import Query
+
+from ..models import TableVersion
+
+logger = logging.getLogger(__name__)
+
+
+def _expression_tables(expression, tables: Set[str]) -> None:
+    if isinstance(expression, Query):
+        _query_tables(expression, tables)
+        return
+    # eg Subquery and Exists
+    inner_query = getattr(expression, 'query', None)
+    if isinstance(inner_query, Query):
+        _query_tables(inner_query, tables)
+    # a WhereNode has children rather than source expressions
+    children = getattr(expression, 'children', None)
+    if children is None and hasattr(expression, 'get_source_expressions'):
+        children = expression.get_source_expressions()
+    for child in children or []:
+        if child is not None:
+            _expression_tables(child, tables)
+
+
+def _query_tables(query: Query, tables: Set[str]) -> None:
+    tables.add(query.get_meta().db_table)
+    tables.update(join.table_name for join in query.alias_map.values())
+    for combined_query in query.combined_queries:
+        _query_tables(combined_query, tables)
+    for annotation in query.annotations.values():
+        _expression_tables(annotation, tables)
+    _expression_tables(query.where, tables)
+
+
+def query_tables(queryset) -> Set[str]:
+    """Get the tables which a queryset reads, including the tables of joins,
+    unions and subqueries.
+
+    :param queryset: a queryset
+    :type queryset: django.db.models.QuerySet
+    :return: the db table names
+    :rtype: set
+    """
+    tables = set()
+    _query_tables(queryset.query, tables)
+    return tables
+
+
+def cached_count(queryset, timeout: Optional[int] = None) -> int:
+    """Count a queryset, using the cached count if the tables which the
+    queryset reads have not changed since it was cached.
+
+    :param queryset: the queryset to count
+    :type queryset: django.db.models.QuerySet
+    :param timeout: the cache timeout, in seconds. Defaults to
+        `settings.COUNT_CACHE_TIMEOUT`
+    :type timeout: int, optional
+    :return: the number of records in the queryset
+    :rtype: int
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    stamps = TableVersion.objects.stamps(query_tables(queryset))
+    key_material = json.dumps([queryset.db, sql, params, stamps],
+                              default=str, sort_keys=True)
+    key = (f'count:{queryset.model._meta.label_lower}:'
+           f'{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}')
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count,
+                  settings.COUNT_CACHE_TIMEOUT if timeout is None
+                  else timeout)
+    return count
+
+
+def estimate_count(queryset) -> Optional[int]:
+    """Estimate the number of records in a queryset from the PostgreSQL
+    planner statistics, without reading the rows.
+
+    :param queryset: the queryset to count
+    :type queryset: django.db.models.QuerySet
+    :return: the estimate, or None if the database is not PostgreSQL or
+        there is no estimate
+    :rtype: int or None
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    query = queryset.query
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    with connection.cursor() as cursor:
+        unfiltered = not query.where.children and \
+            len(query.alias_map) <= 1 and \
+            not query.combined_queries and \
+            not query.distinct and \
+            query.group_by is None
+        if unfiltered:
+            cursor.execute('SELECT reltuples FROM pg_class '
+                           'WHERE oid = %s::regclass',
+                           [query.get_meta().db_table])
+            row = cursor.fetchone()
+            # reltuples is -1 for a table which has never been analyzed
+            if row and row[0] >= 0:
+                return int(row[0])
+
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        try:
+            return int(plan[0]['Plan']['Plan Rows'])
+        except (IndexError, KeyError, TypeError):
+            logger.debug('no row estimate in plan: %s', plan)
+            return None
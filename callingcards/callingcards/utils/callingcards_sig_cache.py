@@ -0,0 +1,365 @@
+"""
+.. module:: callingcards_sig_cache
+   :synopsis: Functions which key cached CallingCardsSig results by their inputs
+
+A `CallingCardsSig` record stores the result of `callingcards_with_metrics`
+for one experiment, hops source, background source and promoter source. The
+`input_hash` of a record is the SHA-256 of everything the result depends on:
+the content hashes of the experiment's qbed files, and a stamp of the rows of
+its background source and of its promoter source. This is used to:
+
+- keep a cached result when a qbed file is re-uploaded with identical content
+- recalculate a cached result when its qbed, background or promoter set
+  changes, but not when another source changes. The stale record is kept
+  until it is replaced by the new result
+- reuse, rather than recalculate, a result with identical inputs which was
+  calculated for a different experiment
+
+:func:`find_cached_sigs` and :func:`calculate_sig` are the steps of the
+`promoterregions/callingcards` endpoints, which read the cached results of a
+set of experiments and calculate the rest. :func:`fill_sig_stats` records the
+row count, size and checksum of the results listed by its manifest.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-17
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models import Count, Max
+
+from ..filters import CallingCardsSigFilter, CCExperimentFilter
+from ..models import (CallingCardsSig, CCExperiment, Hops_s3, Background,
+                      PromoterRegions, TableVersion)
+from .callingcards_with_metrics import callingcards_with_metrics
+
+logger = logging.getLogger(__name__)
+
+# increment when a change to callingcards_with_metrics changes the results,
+# so that results calculated by the previous version are discarded
+SIG_VERSION = 1
+
+# columns of the callingcards_with_metrics result which describe the
+# experiment rather than being calculated from the inputs
+EXPERIMENT_COLUMNS = ['experiment_id', 'tf_id', 'experiment_batch',
+                      'experiment_replicate']
+
+
+def source_stamp(model, source) -> str:
+    """A stamp of the rows of one source of the background or the promoter
+    regions, which changes when a row of the source is added, deleted or
+    saved. It is calculated from the count and the latest `modified` of the
+    rows, and is cached per :class:`~callingcards.models.TableVersion` of the
+    table, so that the rows are only read again after the table changes.
+
+    :param model: `Background` or `PromoterRegions`
+    :type model: django.db.models.Model
+    :param source: the id of the source
+    :type source: str or int
+    :return: the stamp
+    :rtype: str
+    """
+    table = model._meta.db_table
+    key_material = json.dumps([source, TableVersion.objects.stamps([table])],
+                              default=str, sort_keys=True)
+    key = (f'source_stamp:{table}:'
+           f'{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}')
+    stamp = cache.get(key)
+    if stamp is None:
+        rows = model.objects.filter(source_id=source)\
+            .aggregate(count=Count('pk'), modified=Max('modified'))
+        stamp = f'{rows["count"]}:{rows["modified"]}'
+        cache.set(key, stamp, settings.COUNT_CACHE_TIMEOUT)
+    return stamp
+
+
+def experiment_qbed_hashes(experiment_ids: Iterable[int],
+                           hops_sources: Iterable[str]
+                           ) -> Dict[Tuple[int, str], List[str]]:
+    """
+    :param experiment_ids: CCExperiment ids
+    :type experiment_ids: iterable
+    :param hops_sources: HopsSource ids
+    :type hops_sources: iterable
+    :return: the sorted content hashes of the qbed files of each
+        (experiment, hops source), read with one query
+    :rtype: dict
+    """
+    qbed_hashes = {}
+    for experiment_id, source_id, sha256 in Hops_s3.objects\
+            .filter(experiment_id__in=set(experiment_ids),
+                    source_id__in=set(hops_sources))\
+            .values_list('experiment_id', 'source_id', 'sha256'):
+        qbed_hashes.setdefault((experiment_id, source_id), []).append(sha256)
+    return {key: sorted(value) for key, value in qbed_hashes.items()}
+
+
+def sig_input_hash(experiment_id: int,
+                   hops_source: str,
+                   background_source: str,
+                   promoter_source: str,
+                   qbed_hashes: Optional[List[str]] = None,
+                   source_stamps: Optional[dict] = None) -> str:
+    """Calculate the input hash of a CallingCardsSig result. The background
+    and promoter sets are represented by their :func:`source_stamp`, so a
+    change to another source does not change the hash.
+
+    :param experiment_id: the CCExperiment id
+    :type experiment_id: int
+    :param hops_source: the HopsSource id
+    :type hops_source: str
+    :param background_source: the BackgroundSource id
+    :type background_source: str
+    :param promoter_source: the PromoterRegionsSource id
+    :type promoter_source: str
+    :param qbed_hashes: the sorted content hashes of the experiment's qbed
+        files in the hops source, see :func:`experiment_qbed_hashes`. Read
+        if not passed
+    :type qbed_hashes: list
+    :param source_stamps: a dict in which the source stamps are kept, so
+        that a caller which hashes many results reads each of them once
+    :type source_stamps: dict
+    :return: the hex SHA-256 of the inputs, or an empty string if any of the
+        experiment's qbed files were stored before content hashing, in which
+        case the result cannot be keyed by its inputs
+    :rtype: str
+    """
+    if qbed_hashes is None:
+        qbed_hashes = experiment_qbed_hashes([experiment_id], [hops_source])\
+            .get((experiment_id, hops_source), [])
+    if not qbed_hashes or '' in qbed_hashes:
+        return ''
+
+    source_stamps = {} if source_stamps is None else source_stamps
+    for model, source in [(Background, background_source),
+                          (PromoterRegions, promoter_source)]:
+        if (model, source) not in source_stamps:
+            source_stamps[(model, source)] = source_stamp(model, source)
+    inputs = [
+        f'version:{SIG_VERSION}',
+        f'hops_source:{hops_source}',
+        *[f'qbed:{x}' for x in qbed_hashes],
+        f'background:{background_source}:'
+        f'{source_stamps[(Background, background_source)]}',
+        f'promoter:{promoter_source}:'
+        f'{source_stamps[(PromoterRegions, promoter_source)]}',
+    ]
+    return hashlib.sha256('\n'.join(inputs).encode('utf-8')).hexdigest()
+
+
+def filter_current_sigs(sigs: Iterable[CallingCardsSig]
+                        ) -> List[CallingCardsSig]:
+    """Skip the cached results whose inputs have changed since they were
+    calculated. The stale records are kept, and are replaced when their
+    results are calculated again, see :func:`store_sig`.
+
+    :param sigs: CallingCardsSig records
+    :type sigs: iterable
+    :return: the records which are still current. Records without an
+        input_hash are kept, as before input hashing
+    :rtype: list
+    """
+    sigs = list(sigs)
+    qbed_hashes = experiment_qbed_hashes(
+        [sig.experiment_id for sig in sigs],
+        [sig.hops_source_id for sig in sigs])
+    source_stamps = {}
+    current = []
+    for sig in sigs:
+        if sig.input_hash and sig.input_hash != sig_input_hash(
+                sig.experiment_id, sig.hops_source_id,
+                sig.background_source_id, sig.promoter_source_id,
+                qbed_hashes.get((sig.experiment_id, sig.hops_source_id), []),
+                source_stamps):
+            logger.info('inputs of CallingCardsSig %s have changed -- '
+                        'recalculating', sig.pk)
+        else:
+            current.append(sig)
+    return current
+
+
+def read_sig(sig: CallingCardsSig) -> pd.DataFrame:
+    """
+    :param sig: a CallingCardsSig record
+    :type sig: CallingCardsSig
+    :return: the stored result
+    :rtype: pd.DataFrame
+    """
+    with sig.file.storage.open(sig.file.name, 'rb') as f:
+        return pd.read_csv(io.BytesIO(f.read()), compression='gzip')
+
+
+def reuse_sig(experiment_id: int,
+              hops_source: str,
+              background_source: str,
+              promoter_source: str) -> Optional[pd.DataFrame]:
+    """Find a result with identical inputs which was calculated for another
+    experiment, and relabel it for this experiment.
+
+    :return: the result, or None if there is no result with identical inputs
+    :rtype: pd.DataFrame or None
+    """
+    if not all([hops_source, background_source, promoter_source]):
+        return None
+    input_hash = sig_input_hash(experiment_id, hops_source,
+                                background_source, promoter_source)
+    if not input_hash:
+        return None
+    sig = CallingCardsSig.objects.filter(input_hash=input_hash).first()
+    if sig is None:
+        return None
+
+    logger.info('reusing CallingCardsSig %s for experiment %s',
+                sig.pk, experiment_id)
+    df = read_sig(sig)
+    experiment = CCExperiment.objects.get(pk=experiment_id)
+    relabel = {'experiment_id': experiment.pk,
+               'tf_id': experiment.tf.tf_id,
+               'experiment_batch': experiment.batch,
+               'experiment_replicate': experiment.batch_replicate}
+    for column in EXPERIMENT_COLUMNS:
+        if column in df.columns:
+            df[column] = relabel[column]
+    return df
+
+
+def store_sig(df: pd.DataFrame,
+              experiment_id: int,
+              hops_source: str,
+              background_source: str,
+              promoter_source: str,
+              user) -> CallingCardsSig:
+    """Store a result as a CallingCardsSig record, keyed by its input hash.
+    A stale record of the same experiment and sources is replaced.
+
+    :param df: the callingcards_with_metrics result for one experiment and
+        set of sources
+    :type df: pd.DataFrame
+    :return: the new, or the replaced, record
+    :rtype: CallingCardsSig
+    """
+    compressed_buffer = io.BytesIO()
+    # mtime=0 so that identical results are byte identical, and so are
+    # stored once
+    with gzip.GzipFile(fileobj=compressed_buffer, mode='wb', mtime=0) as gz:
+        df.to_csv(gz, index=False, encoding='utf-8')
+
+    sources = {'experiment_id': experiment_id,
+               'hops_source_id': hops_source,
+               'background_source_id': background_source,
+               'promoter_source_id': promoter_source}
+    sig = CallingCardsSig.objects.filter(**sources).first() or \
+        CallingCardsSig(uploader=user, **sources)
+    sig.modifiedBy = user
+    sig.input_hash = sig_input_hash(experiment_id, hops_source,
+                                    background_source, promoter_source)
+    sig.row_count = len(df)
+    sig.file_size = len(compressed_buffer.getvalue())
+    sig.file = ContentFile(compressed_buffer.getvalue(),
+                           name=f'{hops_source}_{background_source}'
+                                f'_{promoter_source}.csv.gz')
+    sig.save()
+    return sig
+
+
+def find_cached_sigs(query_params) -> Tuple[List[int], dict, dict]:
+    """Find the experiments selected by a request, and their cached results.
+    Cached results whose inputs have changed are skipped, so that they are
+    calculated again.
+
+    :param query_params: the CCExperiment filter params and the
+        `hops_source`, `background_source` and `promoter_source`
+    :type query_params: dict or QueryDict
+    :return: the experiment ids, the sources, and a dict of experiment id
+        to the list of its current CallingCardsSig records
+    :rtype: tuple
+    """
+    experiment_ids = list(CCExperimentFilter(
+        query_params, queryset=CCExperiment.objects.all())
+        .qs
+        .values_list('id', flat=True)
+        .distinct())
+    sources = {key: query_params.get(key, None)
+               for key in ['hops_source', 'background_source',
+                           'promoter_source']}
+    # the cached results of all of the experiments, with one query
+    sigs = {}
+    if experiment_ids:
+        for sig in filter_current_sigs(CallingCardsSigFilter(
+                {'experiment_id': experiment_ids, **sources},
+                queryset=CallingCardsSig.objects.all()).qs):
+            sigs.setdefault(sig.experiment_id, []).append(sig)
+    return experiment_ids, sources, sigs
+
+
+def calculate_sig(experiment_id: int,
+                  sources: dict,
+                  user) -> Optional[pd.DataFrame]:
+    """Reuse a result with identical inputs, or calculate the result of an
+    experiment, and cache it.
+
+    :param experiment_id: the CCExperiment id
+    :type experiment_id: int
+    :param sources: the `hops_source`, `background_source` and
+        `promoter_source`
+    :type sources: dict
+    :param user: the user who is recorded as the uploader of the result
+    :type user: User
+    :return: the result, or None if it may not be calculated, eg because
+        the experiment has no hops in the source
+    :rtype: pd.DataFrame or None
+    """
+    result_df = reuse_sig(experiment_id, **sources)
+    if result_df is None:
+        try:
+            result_df = callingcards_with_metrics(
+                {'experiment_id': experiment_id, **sources})
+        except ValueError as err:
+            logger.error('callingcards_with_metrics failed: %s', err)
+            return None
+    # cache the result in the database
+    grouped = result_df.groupby(['experiment_id',
+                                 'hops_source',
+                                 'background_source',
+                                 'promoter_source'])
+    for name, group in grouped:
+        logger.debug('processing group: %s', name)
+        store_sig(group, *name, user)
+    return result_df
+
+
+def fill_sig_stats(sigs: Iterable[CallingCardsSig]) -> None:
+    """Set the `row_count`, `file_size` and `sha256` of results which were
+    stored before they were recorded. The file of each such result is read
+    once.
+
+    :param sigs: CallingCardsSig records, which are updated in place
+    :type sigs: iterable
+    """
+    filled = False
+    for sig in sigs:
+        if sig.row_count is not None and sig.file_size is not None and \
+                sig.sha256:
+            continue
+        logger.info('recording the row count, size and checksum of '
+                    'CallingCardsSig %s', sig.pk)
+        with sig.file.storage.open(sig.file.name, 'rb') as f:
+            content = f.read()
+        sig.row_count = len(pd.read_csv(io.BytesIO(content),
+                                        compression='gzip'))
+        sig.file_size = len(content)
+        sig.sha256 = hashlib.sha256(content).hexdigest()
+        CallingCardsSig.objects.filter(pk=sig.pk).update(
+            row_count=sig.row_count, file_size=sig.file_size,
+            sha256=sig.sha256)
+        filled = True
+    if filled:
+        TableVersion.objects.bump(CallingCardsSig)
@@ -29,6 +29,7 @@ from django.db.utils import NotSupportedError
 import scipy.stats as scistat
 import pandas as pd
 
+from ..db_router import read_replica
 from ..models import (ChrMap, PromoterRegions, Background, Hops_s3)
 from ..filters import PromoterRegionsFilter, Hops_s3Filter, BackgroundFilter
 
@@ -36,16 +37,18 @@ logger = logging.getLogger(__name__)
 
 
 def callingcards_with_metrics(query_params_dict: dict) -> pd.DataFrame:
-    # read experiment data into memory
-    experiment_counts_df, filtered_experiment_df = \
-        experiment_data(query_params_dict)
-
-    # read promoter regions data into memory
-    filtered_promoters_df = promoter_data(query_params_dict)
-
-    # read background data into memory
-    background_counts_df, filtered_background_df = \
-        background_data(query_params_dict)
+    # the data is only read, so it is read from the read replica, if any
+    with read_replica():
+        # read experiment data into memory
+        experiment_counts_df, filtered_experiment_df = \
+            experiment_data(query_params_dict)
+
+        # read promoter regions data into memory
+        filtered_promoters_df = promoter_data(query_params_dict)
+
+        # read background data into memory
+        background_counts_df, filtered_background_df = \
+            background_data(query_params_dict)
 
     # by default, False
     consider_strand = bool(query_params_dict.get('consider_strand', False))
@@ -0,0 +1,278 @@
+"""
+.. module:: export
+   :synopsis: Stream a queryset into a compressed tabular file
+
+Functions which iterate over a queryset with `.iterator(chunk_size=...)`,
+which uses a server side cursor on PostgreSQL, and stream the rows into a
+file format without instantiating model objects or serializers. Memory use is
+bounded by the chunk size rather than the size of the table.
+
+Formats:
+
+- `tsv`: gzip compressed, tab delimited text with a header
+- `arrow`: an Arrow IPC stream of typed record batches, written with
+  `pyarrow`
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-19
+"""
+import csv
+import io
+import logging
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pyarrow as pa
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 10000
+
+EXPORT_FORMATS = {
+    'tsv': {'content_type': 'application/gzip',
+            'extension': 'tsv.gz'},
+    'arrow': {'content_type': 'application/vnd.apache.arrow.stream',
+              'extension': 'arrows'},
+}
+
+
+def lookup_field(model, lookup: str):
+    """
+    :param model: the model of the lookup
+    :type model: django.db.models.Model
+    :param lookup: a field name, or a lookup across relations, eg
+        `uploader__username`
+    :type lookup: str
+    :return: the model field of the lookup
+    :rtype: django.db.models.Field
+
+    :raises FieldDoesNotExist: if the lookup is not a field of the model
+    """
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        field = model._meta.get_field(relation)
+        if not field.is_relation:
+            raise FieldDoesNotExist(f'{lookup} is not a field of {model}')
+        model = field.related_model
+    return model._meta.get_field(name)
+
+
+def export_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE,
+                fields: Optional[Union[List[str], Dict[str, str]]] = None
+                ) -> Tuple[List[str], Iterator[tuple]]:
+    """Get the column names and a row iterator for a queryset.
+
+    Model querysets are exported with the concrete fields of the model, with
+    foreign keys as their primary key. Querysets which are already `.values()`
+    querysets, eg with annotations, are exported with their selected columns.
+
+    :param queryset: the queryset to export
+    :type queryset: django.db.models.QuerySet
+    :param chunk_size: the number of rows fetched from the database at once
+    :type chunk_size: int
+    :param fields: the names of the model fields to export, or a dict of the
+        column names to their lookups, eg `{'uploader':
+        'uploader__username'}`. Defaults to all concrete fields. This does
+        not apply to `.values()` querysets
+    :type fields: list or dict, optional
+    :return: a tuple of (column names, iterator of row tuples)
+    :rtype: tuple
+    """
+    if issubclass(queryset._iterable_class, models.query.ModelIterable):  # pylint: disable=protected-access # noqa
+        if isinstance(fields, dict):
+            names, lookups = list(fields), list(fields.values())
+        else:
+            concrete_fields = [
+                field for field in queryset.model._meta.concrete_fields
+                if fields is None or field.name in fields]
+            names = [field.name for field in concrete_fields]
+            lookups = [field.attname for field in concrete_fields]
+        rows = queryset\
+            .values_list(*lookups)\
+            .iterator(chunk_size=chunk_size)
+        return names, rows
+
+    iterator = queryset.iterator(chunk_size=chunk_size)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return list(queryset._fields), iter(())  # pylint: disable=protected-access # noqa
+    if isinstance(first, dict):
+        names = list(first)
+
+        def dict_rows():
+            yield tuple(first.values())
+            for row in iterator:
+                yield tuple(row.values())
+        return names, dict_rows()
+
+    names = list(queryset._fields)  # pylint: disable=protected-access
+
+    def tuple_rows():
+        yield first
+        yield from iterator
+    return names, tuple_rows()
+
+
+def _batches(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_tsv_gz(names: List[str],
+                  rows: Iterator[tuple],
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream rows as gzip compressed TSV. NULL is written as an empty field.
+
+    :param names: the column names
+    :type names: list
+    :param rows: an iterator of row tuples
+    :type rows: iterator
+    :param chunk_size: the number of rows compressed at a time
+    :type chunk_size: int
+    :return: an iterator of compressed bytes
+    :rtype: iterator
+    """
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter='\t', lineterminator='\n')
+    writer.writerow(names)
+    for batch in _batches(rows, chunk_size):
+        writer.writerows(batch)
+        data = compressor.compress(buffer.getvalue().encode('utf-8'))
+        buffer.seek(0)
+        buffer.truncate(0)
+        if data:
+            yield data
+    yield compressor.compress(buffer.getvalue().encode('utf-8')) + \
+        compressor.flush()
+
+
+def arrow_type(field):
+    """Map a django model field, or an expression's output field, to an
+    Arrow type.
+
+    :return: the Arrow type, or None if it should be inferred
+    """
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    internal_type = field.get_internal_type()
+    if internal_type in {'AutoField', 'BigAutoField', 'SmallAutoField',
+                         'IntegerField', 'BigIntegerField',
+                         'SmallIntegerField', 'PositiveIntegerField',
+                         'PositiveBigIntegerField',
+                         'PositiveSmallIntegerField'}:
+        return pa.int64()
+    if internal_type in {'FloatField', 'DecimalField'}:
+        return pa.float64()
+    if internal_type == 'BooleanField':
+        return pa.bool_()
+    if internal_type == 'DateField':
+        return pa.date32()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    if internal_type in {'CharField', 'TextField', 'FileField',
+                         'UUIDField', 'SlugField', 'EmailField'}:
+        return pa.string()
+    return None
+
+
+def arrow_schema(queryset, names: List[str],
+                 lookups: Optional[Dict[str, str]] = None):
+    """Get the Arrow types of the export columns from the model fields and
+    annotations of the queryset. Types which cannot be determined are None,
+    and are inferred from the first batch.
+
+    :param lookups: the lookups of the columns which are not named after
+        their field, eg `{'uploader': 'uploader__username'}`
+    :type lookups: dict, optional
+    """
+    annotations = queryset.query.annotations
+    lookups = lookups or {}
+    types = []
+    for name in names:
+        if name in annotations:
+            try:
+                types.append(arrow_type(annotations[name].output_field))
+            except Exception:  # pylint: disable=broad-except
+                types.append(None)
+            continue
+        try:
+            types.append(arrow_type(
+                lookup_field(queryset.model, lookups.get(name, name))))
+        except FieldDoesNotExist:
+            types.append(None)
+    return types
+
+
+def _arrow_array(column: tuple, type_):
+    """Build an Arrow array of a column. Values which Arrow does not convert
+    to the type of the field, eg a UUID to a string or a Decimal to a double,
+    are converted first."""
+    if type_ is not None and (pa.types.is_string(type_) or
+                              pa.types.is_floating(type_)):
+        convert = str if pa.types.is_string(type_) else float
+        column = [value if value is None else convert(value)
+                  for value in column]
+    return pa.array(column, type=type_)
+
+
+def stream_arrow(queryset,
+                 names: List[str],
+                 rows: Iterator[tuple],
+                 chunk_size: int = EXPORT_CHUNK_SIZE,
+                 lookups: Optional[Dict[str, str]] = None
+                 ) -> Iterator[bytes]:
+    """Stream rows as an Arrow IPC stream with one record batch per chunk.
+
+    :param queryset: the exported queryset, used to type the columns
+    :type queryset: django.db.models.QuerySet
+    :param names: the column names
+    :type names: list
+    :param rows: an iterator of row tuples
+    :type rows: iterator
+    :param chunk_size: the number of rows per record batch
+    :type chunk_size: int
+    :param lookups: the lookups of the columns, see :func:`arrow_schema`
+    :type lookups: dict, optional
+    :return: an iterator of bytes
+    :rtype: iterator
+    """
+    types = arrow_schema(queryset, names, lookups)
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for batch in _batches(rows, chunk_size):
+        columns = list(zip(*batch))
+        if schema is None:
+            arrays = [_arrow_array(column, type_)
+                      for column, type_ in zip(columns, types)]
+            # an all null column with an unknown type is written as string
+            arrays = [array.cast(pa.string())
+                      if pa.types.is_null(array.type) else array
+                      for array in arrays]
+            schema = pa.schema([pa.field(name, array.type)
+                                for name, array in zip(names, arrays)])
+            writer = pa.ipc.new_stream(sink, schema)
+        else:
+            arrays = [_arrow_array(column, field.type)
+                      for column, field in zip(columns, schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+    if writer is None:
+        schema = pa.schema([pa.field(name, type_ or pa.string())
+                            for name, type_ in zip(names, types)])
+        writer = pa.ipc.new_stream(sink, schema)
+    writer.close()
+    yield sink.getvalue()
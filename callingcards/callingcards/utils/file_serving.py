@@ -0,0 +1,260 @@
+"""
+.. module:: file_serving
+   :synopsis: Serve stored files, after Django has checked the permissions
+
+The views which serve a stored file, eg a qbed, a `CallingCardsSig` result,
+or any file under `MEDIA_URL`, check the permissions and then call
+:func:`serve_file`, which hands the transfer to whatever is best placed to
+send it, as configured by `FILE_SERVING_BACKEND`:
+
+- `presigned`: a redirect to a pre-signed url of the S3 storage, which is
+  valid for `FILE_SERVING_URL_EXPIRE` seconds. The file is sent by S3
+- `x-accel-redirect`: an empty response with the `X-Accel-Redirect` header,
+  the location of the file under `FILE_SERVING_ACCEL_PREFIX`, which nginx
+  serves from `MEDIA_ROOT` with an `internal` location, eg
+
+  .. code-block:: nginx
+
+      location /protected-media/ {
+          internal;
+          alias /app/media/;
+      }
+
+- `x-sendfile`: an empty response with the `X-Sendfile` header, the path of
+  the file, for apache with mod_xsendfile, or lighttpd
+- `django`: the file is sent by Django
+
+A backend which does not apply to the storage, eg `presigned` with a file
+system storage, falls back to `django`. Django honors a single `Range`
+request, eg `Range: bytes=1048576-`, with a `206 Partial Content`, so that a
+download may be resumed, or fetched in parts in parallel. `If-Range` is
+honored if the view passes the ETag of the file.
+
+Example usage:
+
+.. code-block:: python
+
+    def download(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return serve_file(request, instance.qbed.storage, instance.qbed.name)
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect, StreamingHttpResponse)
+from django.utils.http import content_disposition_header
+
+# the number of bytes of a range which are read from storage at a time
+RANGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^\s*bytes=(\d*)-(\d*)\s*$')
+
+
+def is_s3_storage(storage) -> bool:
+    """
+    :return: whether the storage is an S3 storage of django-storages
+    :rtype: bool
+    """
+    return hasattr(storage, 'bucket') and hasattr(storage, 'bucket_name')
+
+
+def presigned_url(storage, name: str,
+                  filename: Optional[str] = None) -> str:
+    """
+    :param storage: an S3 storage
+    :type storage: storages.backends.s3boto3.S3Boto3Storage
+    :param name: the name of the file in the storage
+    :type name: str
+    :param filename: the name of the file which is downloaded, if any
+    :type filename: str
+    :return: a url from which the file may be downloaded, without
+        credentials, for `FILE_SERVING_URL_EXPIRE` seconds. It is signed
+        whether or not the storage signs its urls
+    :rtype: str
+    """
+    params = {
+        'Bucket': storage.bucket_name,
+        # the key of the name under the location of the storage
+        'Key': storage._normalize_name(name)}  # pylint: disable=protected-access # noqa
+    if filename:
+        params['ResponseContentDisposition'] = \
+            content_disposition_header(True, filename)
+    return storage.bucket.meta.client.generate_presigned_url(
+        'get_object', Params=params,
+        ExpiresIn=settings.FILE_SERVING_URL_EXPIRE)
+
+
+def file_url(request, storage, name: str, download_url: str,
+             filename: Optional[str] = None) -> str:
+    """
+    :param request: the request
+    :type request: django.http.HttpRequest
+    :param storage: the storage of the file
+    :type storage: django.core.files.storage.Storage
+    :param name: the name of the file in the storage
+    :type name: str
+    :param download_url: the path of the endpoint which serves the file,
+        eg the `download` action of its record
+    :type download_url: str
+    :param filename: the name of the file which is downloaded, if any
+    :type filename: str
+    :return: the url from which a client downloads the file. With the
+        `presigned` backend, this is a pre-signed url of the storage, so
+        that the client downloads the file straight from S3. Otherwise, it
+        is the absolute url of the download endpoint
+    :rtype: str
+    """
+    if settings.FILE_SERVING_BACKEND == 'presigned' and \
+            is_s3_storage(storage):
+        return presigned_url(storage, name, filename)
+    return request.build_absolute_uri(download_url)
+
+
+def parse_range(header: Optional[str],
+                size: int) -> Optional[Tuple[int, int]]:
+    """
+    :param header: the `Range` header of a request
+    :type header: str or None
+    :param size: the size of the file
+    :type size: int
+    :return: the first and the last byte of the range, or None if the whole
+        file is sent, eg without a `Range` header, or with a header which is
+        not a single byte range
+    :rtype: tuple or None
+
+    :raises ValueError: if the range is not satisfiable, eg it starts after
+        the end of the file
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # the last bytes of the file, eg bytes=-500
+        if int(last) == 0:
+            raise ValueError(f'range {header} is empty')
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = size - 1 if not last else min(int(last), size - 1)
+    if first >= size or first > last:
+        raise ValueError(f'range {header} is not in a file of {size} bytes')
+    return first, last
+
+
+def _read_range(file, first: int, length: int):
+    """Read `length` bytes of a file from `first`, and close it."""
+    try:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def file_response(request, storage, name: str, filename: str,
+                  etag: Optional[str] = None) -> HttpResponse:
+    """Send a file from Django, honoring a `Range` request.
+
+    :return: the whole file, a `206` with the range, or a `416` if the range
+        is not satisfiable
+    :rtype: django.http.HttpResponse
+    """
+    size = storage.size(name)
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or (etag and if_range == etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=filename)
+    else:
+        first, last = byte_range
+        content_type, encoding = mimetypes.guess_type(filename)
+        response = StreamingHttpResponse(
+            _read_range(file, first, last - first + 1),
+            status=206,
+            content_type='application/gzip' if encoding == 'gzip'
+            else content_type or 'application/octet-stream')
+        response['Content-Length'] = str(last - first + 1)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Disposition'] = \
+            content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def serve_file(request, storage, name: str,
+               filename: Optional[str] = None,
+               etag: Optional[str] = None) -> HttpResponse:
+    """Serve a stored file with the `FILE_SERVING_BACKEND`. The caller
+    checks the permissions.
+
+    :param request: the request
+    :type request: django.http.HttpRequest
+    :param storage: the storage of the file
+    :type storage: django.core.files.storage.Storage
+    :param name: the name of the file in the storage
+    :type name: str
+    :param filename: the name of the file which is downloaded. Defaults to
+        the basename of `name`
+    :type filename: str
+    :param etag: the quoted ETag of the file, eg of its checksum, for
+        `If-Range`
+    :type etag: str
+    :return: the response
+    :rtype: django.http.HttpResponse
+
+    :raises Http404: if the file does not exist
+    """
+    filename = filename or os.path.basename(name)
+    backend = settings.FILE_SERVING_BACKEND
+
+    if backend == 'presigned' and is_s3_storage(storage):
+        return HttpResponseRedirect(presigned_url(storage, name, filename))
+
+    try:
+        if not name or not storage.exists(name):
+            raise Http404(f'{name} does not exist')
+    except SuspiciousFileOperation as exc:
+        raise Http404(f'{name} does not exist') from exc
+
+    if backend in ('x-accel-redirect', 'x-sendfile') and \
+            isinstance(storage, FileSystemStorage):
+        content_type, encoding = mimetypes.guess_type(filename)
+        response = HttpResponse(
+            content_type='application/gzip' if encoding == 'gzip'
+            else content_type or 'application/octet-stream')
+        if backend == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = \
+                settings.FILE_SERVING_ACCEL_PREFIX + quote(name)
+        else:
+            response['X-Sendfile'] = storage.path(name)
+        response['Content-Disposition'] = \
+            content_disposition_header(True, filename)
+        if etag:
+            response['ETag'] = etag
+        return response
+
+    return file_response(request, storage, name, filename, etag)
@@ -0,0 +1,191 @@
+"""
+.. module:: hops_s3_records
+   :synopsis: Resolve the records which a qbed upload belongs to
+
+A qbed file is uploaded with either the id of its `CCExperiment`, or the
+metadata from which the experiment is found or created: the TF, by
+`tf_gene` or `tf_locus_tag`, the `batch`, `batch_replicate` and `lab`. These
+functions are used by both `Hops_s3ViewSet.create` and the `ingest_qbed`
+management command, so that an upload through either creates the same
+records. New records are validated by the same serializers as the API.
+
+Example usage:
+
+.. code-block:: python
+
+    experiment_id = resolve_experiment({'tf_gene': 'INO2',
+                                        'batch': 'run_1234',
+                                        'batch_replicate': 1,
+                                        'lab': 1}, user)
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import logging
+
+from ..models import CCTF, CCExperiment, Gene, Lab, QcManualReview
+from ..serializers import (CCTFSerializer, CCExperimentSerializer,
+                           QcManualReviewSerializer)
+
+logger = logging.getLogger(__name__)
+
+
+def _create(serializer_class, data: dict, user) -> int:
+    """Validate and create a record with a serializer of the API.
+
+    :return: the id of the new record
+    :rtype: int
+
+    :raises ValueError: if the data is not valid
+    """
+    serializer = serializer_class(data={k: v for k, v in data.items()
+                                        if v is not None})
+    if not serializer.is_valid():
+        raise ValueError(f'Failed to create '
+                         f'{serializer_class.Meta.model.__name__}: '
+                         f'{serializer.errors}')
+    return serializer.save(uploader=user, modifiedBy=user).pk
+
+
+def get_cctf_id(metadata: dict, user) -> int:
+    """Get the id of the CCTF of the `tf_gene` or `tf_locus_tag` in the
+    metadata. If the gene does not have a CCTF record, one is created, with
+    the `tf_strain` if it is set.
+
+    :param metadata: the upload's metadata, eg the request data
+    :type metadata: dict
+    :param user: the user recorded as the uploader of a new record
+    :type user: User
+    :return: id of the CCTF record
+    :rtype: int
+
+    :raises ValueError: if neither tf_gene nor tf_locus_tag is set, if the
+        gene does not exist, or if the new record is not valid
+    """
+    if metadata.get('tf_gene'):
+        gene_filter = {'gene': metadata['tf_gene']}
+    elif metadata.get('tf_locus_tag'):
+        gene_filter = {'locus_tag': metadata['tf_locus_tag']}
+    else:
+        raise ValueError('A valid tf_gene or tf_locus_tag must be provided')
+
+    try:
+        return CCTF.objects.get(
+            **{f'tf__{k}': v for k, v in gene_filter.items()}).id
+    except CCTF.DoesNotExist:
+        logger.info('No CCTF record exists for %s', gene_filter)
+    try:
+        gene_id = Gene.objects.get(**gene_filter).id
+    except Gene.DoesNotExist as exc:
+        raise ValueError(f'Gene {list(gene_filter.values())[0]} does not '
+                         f'exist in database') from exc
+
+    return _create(CCTFSerializer,
+                   {'tf': gene_id, 'strain': metadata.get('tf_strain')},
+                   user)
+
+
+def get_ccexperiment_id(cctf_id: int,
+                        batch: str,
+                        batch_replicate: int,
+                        lab: int,
+                        user) -> int:
+    """Get the id of the CCExperiment of a TF, batch, batch_replicate and
+    lab, creating it if it does not exist.
+
+    :param cctf_id: id of the CCTF record
+    :type cctf_id: int
+    :param batch: batch name
+    :type batch: str
+    :param batch_replicate: batch replicate number
+    :type batch_replicate: int
+    :param lab: id of the Lab record
+    :type lab: int
+    :param user: the user recorded as the uploader of a new record
+    :type user: User
+    :return: id of the CCExperiment record
+    :rtype: int
+
+    :raises ValueError: if the new record is not valid
+    """
+    try:
+        return CCExperiment.objects.get(tf=cctf_id,
+                                        batch=batch,
+                                        lab=lab,
+                                        batch_replicate=batch_replicate).id
+    except CCExperiment.DoesNotExist:
+        logger.info('No CCExperiment record exists for tf %s, batch %s, '
+                    'and batch_replicate %s. Creating new CCExperiment '
+                    'record.', cctf_id, batch, batch_replicate)
+
+    return _create(CCExperimentSerializer,
+                   {'tf': cctf_id,
+                    'batch': batch,
+                    'lab': lab,
+                    'batch_replicate': batch_replicate},
+                   user)
+
+
+def create_manual_review(experiment_id: int, user) -> int:
+    """Get the id of the QcManualReview of an experiment, creating it if it
+    does not exist.
+
+    :param experiment_id: id of the CCExperiment record
+    :type experiment_id: int
+    :param user: the user recorded as the uploader of a new record
+    :type user: User
+    :return: id of the QcManualReview record
+    :rtype: int
+
+    :raises ValueError: if the new record is not valid
+    """
+    try:
+        return QcManualReview.objects.get(experiment=experiment_id).id
+    except QcManualReview.DoesNotExist:
+        return _create(QcManualReviewSerializer,
+                       {'experiment': experiment_id},
+                       user)
+
+
+def resolve_experiment(metadata: dict, user) -> int:
+    """Get or create the CCExperiment, and its CCTF and QcManualReview, of a
+    qbed upload.
+
+    :param metadata: the upload's metadata, eg the request data or a row of
+        an ingest manifest. Either `experiment`, or `batch`,
+        `batch_replicate`, `lab` and one of `tf_gene` or `tf_locus_tag`,
+        must be set
+    :type metadata: dict
+    :param user: the user recorded as the uploader of any new records
+    :type user: User
+    :return: the id of the CCExperiment
+    :rtype: int
+
+    :raises ValueError: if the experiment, TF gene or lab do not exist, or
+        required metadata is missing
+    """
+    experiment_id = metadata.get('experiment')
+    if experiment_id:
+        if not CCExperiment.objects.filter(pk=experiment_id).exists():
+            raise ValueError(f'CCExperiment {experiment_id} does not exist')
+    else:
+        if not metadata.get('batch'):
+            raise ValueError('Batch name not provided.')
+        if not metadata.get('batch_replicate'):
+            raise ValueError('Batch replicate number not provided.')
+        if not metadata.get('lab') or \
+                not Lab.objects.filter(pk=metadata['lab']).exists():
+            raise ValueError('Lab name not provided. The lab must already '
+                             'exist in the DB. If it does not, talk to the '
+                             'admin.')
+        cctf_id = get_cctf_id(metadata, user)
+        experiment_id = get_ccexperiment_id(cctf_id,
+                                            metadata['batch'],
+                                            metadata['batch_replicate'],
+                                            metadata['lab'],
+                                            user)
+
+    manual_review_id = create_manual_review(experiment_id, user)
+    logger.info('Qc manual review ID: %s for experiment: %s',
+                manual_review_id, experiment_id)
+    return int(experiment_id)
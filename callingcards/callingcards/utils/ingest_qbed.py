@@ -0,0 +1,276 @@
+"""
+.. module:: ingest_qbed
+   :synopsis: Functions used to ingest many qbed files without the HTTP API
+
+This module provides the pieces used by the `ingest_qbed` management command
+to load a whole sequencing run of qbed files. The qbed checks, and the
+resolution of the TF, experiment and manual review records, are the same as
+those used by `Hops_s3ViewSet.create`
+(see :func:`~callingcards.utils.validate_qbed_upload.validate_qbed` and
+:func:`~callingcards.utils.hops_s3_records.resolve_experiment`), but are
+called directly rather than through the API.
+
+Ingestion is split into two steps so that the expensive, read-only step may be
+run in a process pool:
+
+1. :func:`validate_qbed_file` reads, validates and counts the hops in a file
+2. :func:`store_qbed_file` saves the file to storage and creates the
+   `Hops_s3` record
+
+Progress is recorded in an append-only, tab delimited status file, one line per
+attempt. The latest line for a given qbed wins, so a run which is interrupted
+may be restarted without re-doing the files which already succeeded.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-12
+"""
+import csv
+import logging
+import os
+import re
+from typing import Dict, Optional
+
+import pandas as pd
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.utils.timezone import now
+
+from ..models import Hops_s3
+from ..models.mixins.ContentAddressedFileMixin import file_sha256
+from ..serializers import Hops_s3Serializer
+from .validate_qbed_upload import read_qbed, validate_qbed
+from .count_hops import count_hops
+from .hops_s3_records import resolve_experiment
+
+logger = logging.getLogger(__name__)
+
+# columns which may be set in a manifest. `qbed` is required, the rest may be
+# set for all files from the command line
+MANIFEST_COLUMNS = ['qbed', 'chr_format', 'source', 'experiment', 'batch',
+                    'batch_replicate', 'lab', 'tf_gene', 'tf_locus_tag',
+                    'tf_strain', 'notes']
+
+STATUS_COLUMNS = ['qbed', 'status', 'experiment', 'hops_s3', 'error',
+                  'timestamp']
+
+QBED_EXTENSIONS = ('.qbed', '.qbed.gz', '.ccf', '.ccf.gz')
+
+# default pattern used to get metadata from the filenames in a directory, eg
+# INO2_2.qbed -> tf_gene=INO2, batch_replicate=2
+DEFAULT_FILENAME_PATTERN = \
+    r'^(?P<tf_gene>[^_.]+)(?:_(?P<batch_replicate>\d+))?'
+
+
+def manifest_from_directory(directory: str,
+                            pattern: str = DEFAULT_FILENAME_PATTERN
+                            ) -> pd.DataFrame:
+    """Create a manifest from the qbed files in a directory. Metadata is
+        extracted from the filenames with the named groups in `pattern`.
+
+    :param directory: path to a directory of qbed files
+    :type directory: str
+    :param pattern: a regex with named groups which are manifest columns
+    :type pattern: str
+    :return: a manifest with one row per qbed file
+    :rtype: pd.DataFrame
+
+    :raises ValueError: if a named group is not a manifest column, or if a
+        filename does not match the pattern
+    """
+    regex = re.compile(pattern)
+    unknown_groups = set(regex.groupindex) - set(MANIFEST_COLUMNS)
+    if unknown_groups:
+        raise ValueError(f'The following named groups in the filename '
+                         f'pattern are not manifest columns: '
+                         f'{unknown_groups}')
+    records = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(QBED_EXTENSIONS):
+            continue
+        match = regex.match(filename)
+        if not match:
+            raise ValueError(f'{filename} does not match the filename '
+                             f'pattern {pattern}')
+        record = {k: v for k, v in match.groupdict().items()
+                  if v is not None}
+        record['qbed'] = os.path.join(directory, filename)
+        records.append(record)
+
+    return pd.DataFrame.from_records(records, columns=MANIFEST_COLUMNS)
+
+
+def read_manifest(manifest: str) -> pd.DataFrame:
+    """Read a manifest of qbed files. The manifest may be comma or tab
+        delimited, and must have a `qbed` column. Relative qbed paths are
+        relative to the manifest.
+
+    :param manifest: path to the manifest
+    :type manifest: str
+    :return: the manifest
+    :rtype: pd.DataFrame
+
+    :raises ValueError: if the `qbed` column is missing, or if there are
+        columns which are not manifest columns
+    """
+    df = pd.read_csv(manifest, sep=None, engine='python', dtype=str)
+    if 'qbed' not in df.columns:
+        raise ValueError('The manifest must have a `qbed` column')
+    unknown_columns = set(df.columns) - set(MANIFEST_COLUMNS)
+    if unknown_columns:
+        raise ValueError(f'The following columns in the manifest are not '
+                         f'recognized: {unknown_columns}. Valid columns are '
+                         f'{MANIFEST_COLUMNS}')
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+    df['qbed'] = [x if os.path.isabs(x) else os.path.join(manifest_dir, x)
+                  for x in df['qbed']]
+
+    return df.reindex(columns=MANIFEST_COLUMNS)
+
+
+def read_status(status_file: str) -> Dict[str, dict]:
+    """Read the status file and return the latest status of each qbed.
+
+    :param status_file: path to the status file
+    :type status_file: str
+    :return: a dictionary of qbed path -> latest status record
+    :rtype: dict
+    """
+    if not os.path.exists(status_file):
+        return {}
+    with open(status_file, 'r', newline='', encoding='utf-8') as f:
+        return {row['qbed']: row
+                for row in csv.DictReader(f, delimiter='\t')}
+
+
+def append_status(status_file: str, record: dict) -> None:
+    """Append a record to the status file, writing the header if the file is
+        new. The line is flushed to disk before returning so that it survives
+        the process being killed.
+
+    :param status_file: path to the status file
+    :type status_file: str
+    :param record: a dictionary with keys in `STATUS_COLUMNS`
+    :type record: dict
+    """
+    write_header = not os.path.exists(status_file)
+    with open(status_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=STATUS_COLUMNS,
+                                delimiter='\t', extrasaction='ignore')
+        if write_header:
+            writer.writeheader()
+        writer.writerow({'timestamp': now().isoformat(), **record})
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def validate_qbed_file(qbed: str, chr_format: str) -> Dict[str, int]:
+    """Read, validate and count the hops in a qbed file. This does not write
+        to the database, and so may be run in a worker process.
+
+    :param qbed: path to the qbed file
+    :type qbed: str
+    :param chr_format: the ChrMap field in which the chromosomes are named
+    :type chr_format: str
+    :return: a dictionary of the genomic, mito and plasmid hop counts
+    :rtype: dict
+
+    :raises ValueError: if the file fails validation
+    """
+    df = read_qbed(qbed)
+    validate_qbed(df, chr_format)
+    try:
+        hops = count_hops(df, chr_format)
+    except RuntimeError as exc:
+        raise ValueError(str(exc)) from exc
+    return {k: int(v) for k, v in hops.items()}
+
+
+def store_qbed_file(qbed: str,
+                    metadata: dict,
+                    experiment_id: int,
+                    hops: Dict[str, int],
+                    user) -> int:
+    """Save a validated qbed file to storage and create its Hops_s3 record,
+        validated by the serializer of the API. If the experiment already has
+        a record of the file, from the same source, eg because a run was
+        interrupted after the record was created but before its status was
+        written, that record is returned rather than a duplicate created.
+
+    :param qbed: path to the qbed file
+    :type qbed: str
+    :param metadata: the manifest row for the qbed file
+    :type metadata: dict
+    :param experiment_id: the id of the CCExperiment
+    :type experiment_id: int
+    :param hops: the hop counts returned by `validate_qbed_file`
+    :type hops: dict
+    :param user: the user recorded as the uploader
+    :type user: User
+    :return: the id of the Hops_s3 record
+    :rtype: int
+
+    :raises ValueError: if the record is not valid, eg the hops source does
+        not exist
+    """
+    with open(qbed, 'rb') as f:
+        qbed_file = File(f, name=os.path.basename(qbed))
+        existing_id = Hops_s3.objects\
+            .filter(experiment_id=experiment_id,
+                    source_id=metadata.get('source'),
+                    sha256=file_sha256(qbed_file))\
+            .values_list('pk', flat=True)\
+            .first()
+        if existing_id is not None:
+            logger.info('%s is already stored as Hops_s3 %s', qbed,
+                        existing_id)
+            return existing_id
+
+        serializer = Hops_s3Serializer(data={
+            'chr_format': metadata.get('chr_format'),
+            'source': metadata.get('source'),
+            'experiment': experiment_id,
+            'genomic_hops': hops['genomic'],
+            'mito_hops': hops['mito'],
+            'plasmid_hops': hops['plasmid'],
+            **({'notes': metadata['notes']} if metadata.get('notes') else {}),
+            # the file is stored by content on save, see
+            # ContentAddressedFileMixin
+            'qbed': qbed_file})
+        if not serializer.is_valid():
+            raise ValueError(f'Failed to create Hops_s3: {serializer.errors}')
+        return serializer.save(uploader=user, modifiedBy=user).pk
+
+
+def ingest_qbed_file(metadata: dict,
+                     user,
+                     hops: Optional[Dict[str, int]] = None) -> dict:
+    """Validate, resolve the experiment for, and store a single qbed file.
+        The records of the file are created in a transaction, so that a file
+        which fails, eg on a database error, leaves no records, and the next
+        file is ingested.
+
+    :param metadata: the manifest row for the qbed file
+    :type metadata: dict
+    :param user: the user recorded as the uploader
+    :type user: User
+    :param hops: hop counts, if the file has already been validated by
+        `validate_qbed_file`
+    :type hops: dict, optional
+    :return: a status record, see `STATUS_COLUMNS`
+    :rtype: dict
+    """
+    qbed = metadata['qbed']
+    try:
+        if hops is None:
+            hops = validate_qbed_file(qbed, metadata['chr_format'])
+        with transaction.atomic():
+            experiment_id = resolve_experiment(metadata, user)
+            hops_s3_id = store_qbed_file(qbed, metadata, experiment_id,
+                                         hops, user)
+    except (ValueError, OSError, DatabaseError, ValidationError) as exc:
+        logger.error('Failed to ingest %s: %s', qbed, exc)
+        return {'qbed': qbed, 'status': 'failed', 'error': str(exc)}
+
+    return {'qbed': qbed, 'status': 'done', 'experiment': experiment_id,
+            'hops_s3': hops_s3_id}
@@ -0,0 +1,275 @@
+"""
+.. module:: load_genomic_coordinates
+   :synopsis: Bulk loader for models which inherit GenonomicCoordinatesMixin
+
+This module provides a loader for BED-like files (bed, qbed, ccf) into any
+model which inherits from
+:class:`~callingcards.models.mixins.GenomicCoordinatesMixin.GenonomicCoordinatesMixin`,
+eg `Background`, `Hops` and `PromoterRegions`. The chromosome names in the
+file may be in any of the `ChrMap` naming formats. Chromosome translation and
+the `start > 0` / `end <= seqlength` constraints are applied to the whole
+file at once with pandas. On PostgreSQL, the rows are streamed into a
+temporary staging table with COPY and then inserted into the target table with
+a single INSERT ... SELECT. On other backends, the rows are inserted with
+bulk_create.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-10
+"""
+import io
+import logging
+import uuid
+from typing import Union, IO
+
+import pandas as pd
+from django.db import connections, transaction, router
+from django.utils.timezone import now
+
+from ..models import ChrMap, Gene
+from ..models.TableVersion import notify_bulk_load
+from ..models.Gene import PLACEHOLDER_FIELDS
+from ..models.mixins.GenomicCoordinatesMixin import (GenonomicCoordinatesMixin,
+                                                     Strand)
+
+logger = logging.getLogger(__name__)
+
+# ChrMap fields which are not chromosome naming formats
+NON_FORMAT_CHRMAP_FIELDS = {'uploader', 'uploadDate', 'modified',
+                            'modifiedBy', 'seqlength', 'type'}
+
+COPY_CHUNKSIZE = 500000
+
+
+def read_bed(bed_file: Union[str, IO]) -> pd.DataFrame:
+    """Read a tab delimited BED-like file with a header into a dataframe. The
+    file may be gzipped or zipped.
+
+    :param bed_file: a path or file-like object. Uploaded files are
+        decompressed if the name ends with `.gz`, `.gzip` or `.zip`
+    :type bed_file: str or file-like
+    :return: a dataframe of the file
+    :rtype: pd.DataFrame
+    """
+    name = bed_file if isinstance(bed_file, str) \
+        else getattr(bed_file, 'name', '') or ''
+    # pandas infers the compression of a path, but not of a file-like object
+    if name.endswith(('.gz', '.gzip')):
+        compression = 'gzip'
+    elif name.endswith('.zip'):
+        compression = 'zip'
+    else:
+        compression = None
+    return pd.read_csv(bed_file,
+                       sep='\t',
+                       compression=compression,
+                       index_col=False)
+
+
+def translate_chromosomes(df: pd.DataFrame,
+                          chr_format: str) -> pd.DataFrame:
+    """Translate the `chr` column of the dataframe from `chr_format` to
+    `ChrMap` ids, and add a `seqlength` column.
+
+    :param df: a dataframe with a `chr` column
+    :type df: pd.DataFrame
+    :param chr_format: a chromosome naming field of ChrMap, eg `ucsc`
+    :type chr_format: str
+    :return: the dataframe with `chr` replaced by `chr_id`
+    :rtype: pd.DataFrame
+
+    :raises ValueError: if chr_format is not a naming field of ChrMap, or if
+        any chromosome in the file is not in that field of ChrMap
+    """
+    valid_formats = {field.name for field in ChrMap._meta.fields} \
+        - NON_FORMAT_CHRMAP_FIELDS
+    if chr_format not in valid_formats:
+        raise ValueError(f'{chr_format} is not a valid field in ChrMap')
+
+    chrmap_df = pd.DataFrame.from_records(
+        ChrMap.objects.values(chr_format, 'id', 'seqlength'))
+    # an empty ChrMap table means no chromosome can be translated
+    if chrmap_df.empty:
+        chrmap_df = pd.DataFrame(columns=[chr_format, 'id', 'seqlength'])
+    # compare as strings -- a numbered/id format read from file is an int
+    chrmap_df['chr'] = chrmap_df[chr_format].astype(str)
+    chrmap_df = chrmap_df[['chr', 'id', 'seqlength']]\
+        .drop_duplicates('chr')\
+        .rename(columns={'id': 'chr_id'})
+
+    df = df.assign(chr=df['chr'].astype(str))\
+        .merge(chrmap_df, on='chr', how='left')
+
+    invalid_chr_set = set(df.loc[df['chr_id'].isna(), 'chr'].unique())
+    if invalid_chr_set:
+        raise ValueError(f'The following chromosomes in the uploaded file '
+                         f'do not match any chromosomes in the database '
+                         f'for field {chr_format}: {invalid_chr_set}')
+
+    df['chr_id'] = df['chr_id'].astype(int)
+
+    return df.drop(columns='chr')
+
+
+def validate_coordinate_constraints(df: pd.DataFrame) -> None:
+    """Check the GenonomicCoordinatesMixin constraints on the whole
+    dataframe at once.
+
+    :param df: a dataframe with `start`, `end`, `strand` and `seqlength`
+        columns
+    :type df: pd.DataFrame
+
+    :raises ValueError: if any row has a start less than 1, an end greater
+        than the chromosome length, or an invalid strand. Up to the first 10
+        offending rows are reported
+    """
+    valid_strands = [x.value for x in Strand]
+    checks = {
+        'start must be greater than 0': df['start'] < 1,
+        'end must be less than or equal to the chromosome length':
+            df['end'] > df['seqlength'],
+        f'strand must be one of {valid_strands}':
+            ~df['strand'].isin(valid_strands),
+    }
+    errors = []
+    for msg, mask in checks.items():
+        if mask.any():
+            rows = (df.index[mask][:10] + 1).tolist()
+            errors.append(f'{msg} ({int(mask.sum())} row(s), '
+                          f'eg data rows {rows})')
+    if errors:
+        raise ValueError('; '.join(errors))
+
+
+def load_genomic_coordinates(model,
+                             bed_file: Union[str, IO, pd.DataFrame],
+                             chr_format: str,
+                             user,
+                             **extra_fields) -> int:
+    """Load a BED-like file into a model which inherits from
+    GenonomicCoordinatesMixin.
+
+    :param model: the target model, eg `Background`
+    :type model: django.db.models.Model
+    :param bed_file: a path, file-like object or dataframe. The file must be
+        tab delimited with a header. `chr`, `start` and `end` are required;
+        the remaining columns must be fields of the model. `strand` defaults
+        to `*` if it is not present
+    :type bed_file: str, file-like or pd.DataFrame
+    :param chr_format: the ChrMap field in which the chromosomes are named
+    :type chr_format: str
+    :param user: the user recorded as the uploader and modifiedBy
+    :type user: User
+    :param extra_fields: values applied to every row, eg `source='adh1'` for
+        Background or `experiment=1` for Hops. Foreign keys may be passed as
+        a model instance or a primary key
+    :return: the number of rows inserted
+    :rtype: int
+
+    :raises ValueError: if the model does not have genomic coordinates, the
+        columns do not match the model, or any row fails validation
+    """
+    if not issubclass(model, GenonomicCoordinatesMixin):
+        raise ValueError(f'{model.__name__} does not have genomic '
+                         f'coordinates')
+
+    df = bed_file.copy() if isinstance(bed_file, pd.DataFrame) \
+        else read_bed(bed_file)
+
+    missing = {'chr', 'start', 'end'} - set(df.columns)
+    if missing:
+        raise ValueError(f'Missing required column(s): {missing}')
+
+    # map the model field names to db columns, eg source -> source_id
+    auto_fields = {'id', 'uploader', 'uploadDate', 'modified', 'modifiedBy'}
+    model_fields = {f.name: f for f in model._meta.concrete_fields
+                    if f.name not in auto_fields}
+    unknown = (set(df.columns) | set(extra_fields)) \
+        - set(model_fields) - {'chr'}
+    if unknown:
+        raise ValueError(f'The following column(s) are not fields of '
+                         f'{model.__name__}: {unknown}')
+
+    if 'strand' not in df.columns:
+        df['strand'] = model_fields['strand'].default
+
+    df = translate_chromosomes(df, chr_format)
+    validate_coordinate_constraints(df)
+    df = df.drop(columns='seqlength')
+
+    for field_name, value in extra_fields.items():
+        df[field_name] = getattr(value, 'pk', value)
+
+    timestamp = now()
+    df['uploader'] = user.pk
+    df['modifiedBy'] = user.pk
+    df['uploadDate'] = timestamp.date()
+    df['modified'] = timestamp
+
+    df = df.rename(columns={'chr_id': 'chr'})
+    all_fields = {f.name: f for f in model._meta.concrete_fields}
+    missing_fields = [name for name, field in model_fields.items()
+                      if name not in df.columns
+                      and not field.has_default()]
+    if missing_fields:
+        raise ValueError(f'No value provided for required field(s): '
+                         f'{missing_fields}')
+    for name, field in model_fields.items():
+        if name not in df.columns:
+            df[name] = field.get_default()
+    df = df.rename(columns={name: all_fields[name].column
+                            for name in df.columns})
+
+    db_alias = router.db_for_write(model)
+    if connections[db_alias].vendor == 'postgresql':
+        if model is Gene:
+            # COPY bypasses GeneQuerySet.bulk_create, so assign the ids and
+            # unknown_<n> placeholders here
+            ids = pd.Series(Gene.objects.using(db_alias)
+                            .reserve_ids(df.shape[0]), index=df.index)
+            df['id'] = ids
+            for field in PLACEHOLDER_FIELDS:
+                df[field] = df[field].where(df[field] != 'unknown',
+                                            'unknown_' + ids.astype(str))
+        _copy_insert(model, df, db_alias)
+    else:
+        attnames = {f.column: f.attname for f in model._meta.concrete_fields}
+        model.objects.using(db_alias).bulk_create(
+            [model(**{attnames[k]: v for k, v in record.items()})
+             for record in df.to_dict('records')],
+            batch_size=10000)
+    # neither COPY nor bulk_create send signals
+    notify_bulk_load(model)
+
+    logger.info('Loaded %s rows into %s', df.shape[0],
+                model._meta.db_table)
+
+    return df.shape[0]
+
+
+def _copy_insert(model, df: pd.DataFrame, db_alias: str) -> None:
+    """Stream the dataframe into a temporary staging table with COPY, then
+    insert into the model table with a single set-based INSERT.
+    """
+    table = model._meta.db_table
+    # a temporary table ON COMMIT DROP lives until the outer transaction
+    # commits, so the name is unique to each load, eg of the loads of one
+    # `atomic` block. It is also dropped once it is inserted
+    staging = f'{table}_staging_{uuid.uuid4().hex[:12]}'
+    columns = ', '.join(f'"{col}"' for col in df.columns)
+
+    with transaction.atomic(using=db_alias), \
+            connections[db_alias].cursor() as cursor:
+        cursor.execute(f'CREATE TEMP TABLE "{staging}" '
+                       f'(LIKE "{table}" INCLUDING DEFAULTS) '
+                       f'ON COMMIT DROP')
+        for start in range(0, df.shape[0], COPY_CHUNKSIZE):
+            buffer = io.StringIO()
+            df.iloc[start:start + COPY_CHUNKSIZE]\
+                .to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY "{staging}" ({columns}) FROM STDIN WITH CSV',
+                buffer)
+        cursor.execute(f'INSERT INTO "{table}" ({columns}) '
+                       f'SELECT {columns} FROM "{staging}"')
+        cursor.execute(f'DROP TABLE "{staging}"')
@@ -0,0 +1,182 @@
+"""
+.. module:: matrix
+   :synopsis: Dense TF x target matrices of the binding and expression tables
+
+Functions used by :class:`~callingcards.views.mixins.MatrixMixin.MatrixMixin`
+to turn a table of (tf, target, value) records, eg `HarbisonChIP` or
+`McIsaacZEV`, into dense `numpy` arrays with one row per TF and one column per
+target, and to read and write them as `.npz` files.
+
+A matrix is a dict of arrays:
+
+- `row_id`, `row_locus_tag`, `row_gene`: the TF `Gene` records of the rows,
+  ordered by locus tag
+- `col_id`, `col_locus_tag`, `col_gene`: the same for the target columns
+- one float32 array of shape (rows, columns) per value field, eg `pval`.
+  Pairs without a record are NaN. If a pair has more than one record, the
+  value of the last record, by id, is used
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-22
+"""
+import io
+import logging
+from itertools import islice
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from ..models import Gene
+
+logger = logging.getLogger(__name__)
+
+MATRIX_CHUNK_SIZE = 100000
+
+# the arrays which index the rows and columns
+INDEX_ARRAYS = ('row_id', 'row_locus_tag', 'row_gene',
+                'col_id', 'col_locus_tag', 'col_gene')
+
+
+def _gene_index(ids: np.ndarray) -> Dict[str, np.ndarray]:
+    """The id, locus tag and gene of the genes, ordered by locus tag"""
+    genes = sorted(Gene.objects.filter(pk__in=ids.tolist())
+                   .values_list('locus_tag', 'id', 'gene'))
+    return {'id': np.array([x[1] for x in genes], dtype=np.int64),
+            'locus_tag': np.array([x[0] for x in genes], dtype=str),
+            'gene': np.array([x[2] for x in genes], dtype=str)}
+
+
+def build_matrix(queryset, row_field: str, col_field: str,
+                 value_fields: Iterable[str],
+                 chunk_size: int = MATRIX_CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """Build the dense matrices of a table.
+
+    :param queryset: the records, eg `HarbisonChIP.objects.all()`
+    :type queryset: django.db.models.QuerySet
+    :param row_field: the foreign key to the `Gene` of the rows, eg `tf`
+    :type row_field: str
+    :param col_field: the foreign key to the `Gene` of the columns, eg `gene`
+    :type col_field: str
+    :param value_fields: the fields to put in the matrices, eg ['pval']
+    :type value_fields: iterable
+    :param chunk_size: the number of records read at a time
+    :type chunk_size: int
+    :return: the matrix, see the module docstring
+    :rtype: dict
+    """
+    value_fields = list(value_fields)
+    rows = queryset.order_by('id').values_list(
+        f'{row_field}_id', f'{col_field}_id', *value_fields)\
+        .iterator(chunk_size=chunk_size)
+
+    chunks = []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        chunks.append((np.array([x[0] for x in chunk], dtype=np.int64),
+                       np.array([x[1] for x in chunk], dtype=np.int64),
+                       # decimals are converted to float, and None to NaN
+                       np.array([x[2:] for x in chunk], dtype=np.float64)
+                       .reshape(len(chunk), len(value_fields))))
+    if chunks:
+        row_ids, col_ids, values = (np.concatenate(x) for x in zip(*chunks))
+    else:
+        row_ids = col_ids = np.empty(0, dtype=np.int64)
+        values = np.empty((0, len(value_fields)))
+
+    row_index = _gene_index(np.unique(row_ids))
+    col_index = _gene_index(np.unique(col_ids))
+    # the position of each record's row and column in the matrix
+    row_position = np.argsort(row_index['id'])
+    row_position = row_position[np.searchsorted(row_index['id'],
+                                                row_ids,
+                                                sorter=row_position)]
+    col_position = np.argsort(col_index['id'])
+    col_position = col_position[np.searchsorted(col_index['id'],
+                                                col_ids,
+                                                sorter=col_position)]
+
+    matrix = {f'row_{k}': v for k, v in row_index.items()}
+    matrix.update({f'col_{k}': v for k, v in col_index.items()})
+    for i, field in enumerate(value_fields):
+        array = np.full((len(row_index['id']), len(col_index['id'])),
+                        np.nan, dtype=np.float32)
+        array[row_position, col_position] = values[:, i]
+        matrix[field] = array
+    return matrix
+
+
+def slice_matrix(matrix: Dict[str, np.ndarray],
+                 rows: List[str] = None,
+                 cols: List[str] = None,
+                 value_fields: List[str] = None) -> Dict[str, np.ndarray]:
+    """Select rows, columns and value fields of a matrix.
+
+    :param matrix: a matrix, see :func:`build_matrix`
+    :type matrix: dict
+    :param rows: the rows to keep, in order, by gene id, locus tag or gene
+        name. Defaults to all
+    :type rows: list, optional
+    :param cols: the same for the columns
+    :type cols: list, optional
+    :param value_fields: the value arrays to keep. Defaults to all
+    :type value_fields: list, optional
+    :return: the sliced matrix
+    :rtype: dict
+
+    :raises KeyError: if a row or column does not exist. The message is the
+        list of the missing labels
+    """
+    def positions(prefix, labels):
+        lookup = {}
+        # ids take precedence over locus tags, and locus tags over genes
+        for key in ('gene', 'locus_tag', 'id'):
+            lookup.update({str(label): i for i, label in
+                           enumerate(matrix[f'{prefix}_{key}'])})
+        missing = [x for x in labels if x not in lookup]
+        if missing:
+            raise KeyError(missing)
+        return np.array([lookup[x] for x in labels], dtype=np.int64)
+
+    row_positions = slice(None) if rows is None else positions('row', rows)
+    col_positions = slice(None) if cols is None else positions('col', cols)
+    value_fields = value_fields or \
+        [x for x in matrix if x not in INDEX_ARRAYS]
+
+    sliced = {key: matrix[key][row_positions]
+              for key in INDEX_ARRAYS if key.startswith('row_')}
+    sliced.update({key: matrix[key][col_positions]
+                   for key in INDEX_ARRAYS if key.startswith('col_')})
+    for field in value_fields:
+        sliced[field] = matrix[field][row_positions][:, col_positions]
+    return sliced
+
+
+def matrix_to_npz(matrix: Dict[str, np.ndarray],
+                  compressed: bool = True) -> bytes:
+    """
+    :param matrix: a matrix, see :func:`build_matrix`
+    :type matrix: dict
+    :param compressed: whether to compress the arrays
+    :type compressed: bool
+    :return: the matrix as the content of a `.npz` file
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    if compressed:
+        np.savez_compressed(buffer, **matrix)
+    else:
+        np.savez(buffer, **matrix)
+    return buffer.getvalue()
+
+
+def npz_to_matrix(content: bytes) -> Dict[str, np.ndarray]:
+    """
+    :param content: the content of a `.npz` file
+    :type content: bytes
+    :return: the matrix
+    :rtype: dict
+    """
+    with np.load(io.BytesIO(content), allow_pickle=False) as npz:
+        return {key: npz[key] for key in npz.files}
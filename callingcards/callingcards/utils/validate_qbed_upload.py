@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union, IO
 import pandas as pd
 
 from django.core.exceptions import FieldError
@@ -92,3 +92,65 @@ def validate_strand(df: pd.DataFrame) -> List[Tuple[str, str]]:
             invalid_strands.append(strand_level)
 
     return invalid_strands
+
+
+QBED_COLUMNS = ['chr', 'start', 'end', 'depth', 'strand']
+
+
+def read_qbed(qbed_file: Union[str, IO]) -> pd.DataFrame:
+    """Read a qbed file into a dataframe. Files with the extension `.gz`,
+        `.gzip` or `.zip` are read as gzipped files.
+
+    :param qbed_file: a path or file-like object with a `name` attribute
+    :type qbed_file: str or file-like
+    :return: a dataframe of the qbed file
+    :rtype: pd.DataFrame
+    """
+    name = qbed_file if isinstance(qbed_file, str) \
+        else getattr(qbed_file, 'name', '') or ''
+    if name.endswith(('.gz', '.gzip', '.zip')):
+        return pd.read_csv(qbed_file,
+                           sep='\t',
+                           compression='gzip',
+                           index_col=False)
+    return pd.read_csv(qbed_file,
+                       sep='\t',
+                       index_col=False)
+
+
+def validate_qbed(df: pd.DataFrame, chr_format: str) -> bool:
+    """Run all of the checks applied to a qbed upload: the column names,
+        the chromosome names, the coordinates and the strand.
+
+    :param df: a pandas dataframe of the qbed file
+    :type df: pd.DataFrame
+    :param chr_format: the format of the chromosome names in the file
+    :type chr_format: str
+    :return: True if the qbed passes validation
+    :rtype: bool
+
+    :raises ValueError: with a message describing the first failed check
+    """
+    if list(df.columns) != QBED_COLUMNS:
+        raise ValueError('Qbed must have the following columns, '
+                         'in order:'
+                         ' ["chr", "start", '
+                         '"end", "depth", "strand"]')
+
+    validate_chromosomes(df, chr_format)
+
+    validate_coordinates_list = validate_coordinates(df, chr_format)
+    if validate_coordinates_list:
+        raise ValueError('The following coordinates in the '
+                         'uploaded file do not match any '
+                         'coordinates in the database: '
+                         f'{validate_coordinates_list}')
+
+    validate_strand_list = validate_strand(df)
+    if validate_strand_list:
+        raise ValueError('The following strands in the '
+                         'uploaded file do not match any '
+                         'strands in the database: '
+                         f'{validate_strand_list}')
+
+    return True
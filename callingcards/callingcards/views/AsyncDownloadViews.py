@@ -0,0 +1,209 @@
+"""
+.. module:: AsyncDownloadViews
+   :synopsis: Async versions of the endpoints which mostly wait on storage
+
+The `promoterregions/callingcards` download reads one cached result file from
+storage per experiment, and a qbed file is read from storage as it is sent.
+Served by a sync view, each of these requests holds a worker, and its
+storage reads are made one after another. These views serve the same data
+asynchronously, when the API is served by the ASGI application,
+:mod:`callingcards.asgi`:
+
+- `GET /api/v1/async/promoterregions/callingcards/` takes the params of
+  `promoterregions/callingcards`. The cached results are read concurrently,
+  with `asyncio.gather`, and the results which are not cached are calculated
+  and cached as by the sync endpoint. The gzipped csv is streamed as it is
+  written
+- `GET /api/v1/async/hops_s3/<id>/qbed/` streams the qbed file of a Hops_s3
+  record, reading the next chunk from storage while the last one is sent
+
+The database and the storage are read on threads, with `sync_to_async`, so
+that while a request waits on the storage, the event loop serves the others.
+Both endpoints authenticate with a token or a session, as the API does.
+Under the WSGI application, they work, but a request holds a worker as the
+sync endpoints do.
+
+.. code-block:: bash
+
+    curl -H "Authorization: Token <token>" -o data.csv.gz \\
+         "https://<host>/api/v1/async/promoterregions/callingcards/?regulator_locus_tag=YJL056C&promoter_source=yiming"
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import asyncio
+import logging
+import mimetypes
+import os
+import zlib
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.authentication import (SessionAuthentication,
+                                           TokenAuthentication)
+from rest_framework.request import Request
+
+from ..models import Hops_s3
+from ..utils.callingcards_sig_cache import (calculate_sig,
+                                            find_cached_sigs,
+                                            read_sig)
+
+logger = logging.getLogger(__name__)
+
+# the number of bytes of a file which are read from storage at a time
+STREAM_CHUNK_SIZE = 1024 * 1024
+# the number of rows of a result which are written and compressed at a time
+STREAM_CHUNK_ROWS = 50000
+
+
+def authenticate(request):
+    """
+    :return: the user of a token or session, as the API authenticates them,
+        or None if the request is not authenticated
+    :rtype: User or None
+
+    :raises rest_framework.exceptions.AuthenticationFailed: if the token is
+        invalid
+    """
+    user = Request(request, authenticators=[SessionAuthentication(),
+                                            TokenAuthentication()]).user
+    return user if user.is_authenticated else None
+
+
+class AsyncDownloadView(View):
+    """
+    An async view which requires an authenticated user.
+    """
+    http_method_names = ['get', 'head']
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await sync_to_async(authenticate)(request)
+        except exceptions.AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        if user is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED)
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+async def gzip_csv_stream(df: pd.DataFrame):
+    """Write a dataframe as a gzipped csv, in chunks of rows.
+
+    :param df: the dataframe
+    :type df: pd.DataFrame
+    :return: the chunks of the gzipped csv
+    :rtype: async generator of bytes
+    """
+    # wbits=31 writes a gzip, rather than a zlib, header
+    compressor = zlib.compressobj(wbits=31)
+
+    def compress(start):
+        csv = df.iloc[start:start + STREAM_CHUNK_ROWS]\
+            .to_csv(index=False, header=start == 0)
+        return compressor.compress(csv.encode('utf-8'))
+
+    for start in range(0, max(len(df), 1), STREAM_CHUNK_ROWS):
+        chunk = await sync_to_async(compress, thread_sensitive=False)(start)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+async def file_stream(file):
+    """Read an open file in chunks, reading the next chunk while the last is
+    sent, and close it.
+
+    :param file: an open file of the storage
+    :type file: django.core.files.File
+    :return: the chunks of the file
+    :rtype: async generator of bytes
+    """
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        chunk = await read(STREAM_CHUNK_SIZE)
+        while chunk:
+            next_chunk = asyncio.ensure_future(read(STREAM_CHUNK_SIZE))
+            yield chunk
+            chunk = await next_chunk
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+class AsyncCallingCardsView(AsyncDownloadView):
+    """
+    Serve the `promoterregions/callingcards` results, reading the cached
+    results concurrently.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        experiment_ids, sources, cached_sigs = \
+            await sync_to_async(find_cached_sigs)(request.GET)
+        logger.debug('async callingcards experiment_ids: %s', experiment_ids)
+
+        reads = []
+        for experiment_id in experiment_ids:
+            if cached_sigs.get(experiment_id):
+                # the files are read on threads of their own, concurrently
+                reads.extend(
+                    sync_to_async(read_sig, thread_sensitive=False)(sig)
+                    for sig in cached_sigs[experiment_id])
+            else:
+                # the results are calculated and stored with the database
+                # connection of the request
+                reads.append(sync_to_async(calculate_sig)(
+                    experiment_id, sources, request.user))
+        df_list = [df for df in await asyncio.gather(*reads)
+                   if df is not None]
+
+        try:
+            df = await sync_to_async(pd.concat, thread_sensitive=False)(
+                df_list, ignore_index=True)
+        except ValueError as err:
+            logger.error('ValueError: %s', err)
+            return JsonResponse({'error': f'ValueError: {err}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(gzip_csv_stream(df),
+                                         content_type='application/gzip')
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Disposition'] = \
+            'attachment; filename="data.csv.gz"'
+        return response
+
+
+class AsyncQbedView(AsyncDownloadView):
+    """
+    Stream the qbed file of a Hops_s3 record.
+    """
+
+    async def get(self, request, pk, *args, **kwargs):
+        record = await sync_to_async(get_object_or_404)(Hops_s3, pk=pk)
+        if not record.qbed:
+            raise Http404(f'Hops_s3 {pk} has no qbed file')
+        try:
+            file = await sync_to_async(
+                record.qbed.storage.open, thread_sensitive=False)(
+                    record.qbed.name, 'rb')
+        except FileNotFoundError as exc:
+            raise Http404(f'the qbed file of Hops_s3 {pk} is missing') \
+                from exc
+
+        filename = os.path.basename(record.qbed.name)
+        content_type, encoding = mimetypes.guess_type(filename)
+        if encoding == 'gzip':
+            # the file is sent as it is stored, eg a .qbed.gz
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(
+            file_stream(file),
+            content_type=content_type or 'text/plain')
+        response['Content-Disposition'] = \
+            f'attachment; filename="{filename}"'
+        return response
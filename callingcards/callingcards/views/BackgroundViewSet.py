@@ -3,15 +3,30 @@ from rest_framework.permissions import AllowAny
 from .mixins import (ListModelFieldsMixin, CustomCreateMixin, 
                      UpdateModifiedMixin, PageSizeModelMixin, 
                      CountModelMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     UploadGenomicCoordinatesMixin,
+                     ChunkedUploadMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import Background
 from ..serializers import BackgroundSerializer
+from ..filters import BackgroundFilter
 
 
-class BackgroundViewSet(ListModelFieldsMixin,
+class BackgroundViewSet(ResponseCacheMixin,
+                        SparseFieldsetMixin,
+                        ConditionalListMixin,
+                        ExportMixin,
+                        FastListMixin,
+                        ListModelFieldsMixin,
                         CustomCreateMixin,
                         UpdateModifiedMixin,
                         CustomValidateMixin,
+                        UploadGenomicCoordinatesMixin,
+                        ChunkedUploadMixin,
                         PageSizeModelMixin,
                         viewsets.ModelViewSet,
                         CountModelMixin):
@@ -21,3 +36,4 @@ class BackgroundViewSet(ListModelFieldsMixin,
     queryset = Background.objects.all().order_by('pk')  # noqa
     serializer_class = BackgroundSerializer  # noqa
     permission_classes = (AllowAny,)
+    filterset_class = BackgroundFilter
@@ -0,0 +1,236 @@
+"""
+.. module:: BatchViewSet
+   :synopsis: Run many GET requests of the API in one request
+
+`POST /api/v1/batch/` takes a list of GET requests of the API, runs them
+and returns their responses together, so that a client which needs several
+endpoints, eg a notebook which reads the genes, the TFs and the experiments
+on start up, makes one round trip and is authenticated once:
+
+.. code-block:: bash
+
+    curl -X POST -H "Authorization: Token <token>" \\
+         -H "Content-Type: application/json" \\
+         -d '{"requests": ["genes/?page_size=10",
+                           {"id": "tfs", "path": "/api/v1/cctf/",
+                            "params": {"tf_locus_tag": "YJL056C,YBR289W"}},
+                           "qc_review/fields/"]}' \\
+         "https://<host>/api/v1/batch/"
+
+A request is a path, relative to `/api/v1/` or absolute, or an object with
+`path`, optionally `params`, which are added to the query string, and an
+`id` which is returned with the response. The body may also be the list of
+requests itself. The response is
+
+.. code-block:: json
+
+    {"responses": [{"id": null, "path": "/api/v1/genes/?page_size=10",
+                    "status": 200, "data": {"count": 1, "results": []}},
+                   ...]}
+
+in the order of the requests. A request which fails has the status and the
+error of its endpoint, and does not fail the batch. The requests are run as
+the user of the batch request, without authenticating them again, and are
+dispatched to the views through the URL resolver, rather than over HTTP.
+
+The batch only reads, so it is read from the read replica as a GET is, and
+does not pin the client to the primary, see
+:class:`~callingcards.callingcards.db_router.ReadReplicaMiddleware`.
+
+The requests are independent, and are run concurrently on up to
+`BATCH_MAX_WORKERS` threads, in copies of the context of the batch request,
+so that their reads are routed as its reads are. Since each thread reads
+with its own database connection, the requests are run one after another if the batch is run in
+a transaction, eg in the tests, whose data the other connections may not
+read. Endpoints which do not return JSON, eg file downloads, are not
+supported in a batch.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+import contextvars
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve, reverse
+from rest_framework import status, viewsets
+from rest_framework.authentication import (SessionAuthentication,
+                                           TokenAuthentication)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# headers of the batch request which are not passed to its requests, since
+# they describe the batch request itself
+BATCH_ONLY_META = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IF_MATCH',
+                   'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE',
+                   'HTTP_IF_UNMODIFIED_SINCE', 'HTTP_RANGE')
+
+
+class BatchViewSet(viewsets.ViewSet):
+    """
+    Run a list of GET requests of the API, and return their responses in
+    one response.
+    """
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # the requests of a batch are GETs, see db_router
+    read_replica_safe = True
+
+    def _parse_requests(self, data):
+        """
+        :param data: the request body
+        :type data: list or dict
+        :return: the list of (id, path, query string) of the requests
+        :rtype: list
+
+        :raises ValueError: if the body is not a valid list of requests
+        """
+        if isinstance(data, dict):
+            data = data.get('requests')
+        if not isinstance(data, list) or not data:
+            raise ValueError('the body must be a list of requests, or an '
+                             'object with a list of `requests`')
+        if len(data) > settings.BATCH_MAX_REQUESTS:
+            raise ValueError(f'a batch may have at most '
+                             f'{settings.BATCH_MAX_REQUESTS} requests')
+        api_root = reverse('api-root')
+        parsed = []
+        for item in data:
+            if isinstance(item, str):
+                item = {'path': item}
+            if not isinstance(item, dict) or \
+                    not isinstance(item.get('path'), str) or \
+                    not isinstance(item.get('params', {}), dict):
+                raise ValueError(f'{item} is not a request. A request is a '
+                                 'path, or an object with a `path` and '
+                                 'optionally `params` and an `id`')
+            url = urlsplit(item['path'])
+            path = url.path if url.path.startswith('/') \
+                else api_root + url.path
+            query = '&'.join(x for x in
+                             [url.query, urlencode(item.get('params', {}),
+                                                   doseq=True)] if x)
+            parsed.append((item.get('id'), path, query))
+        return parsed
+
+    def _resolve(self, path):
+        """
+        :return: the resolver match of an API path, and the path. The path
+            is tried with a trailing slash if it does not resolve without one
+        :rtype: tuple
+
+        :raises Resolver404: if the path is not an endpoint of the API
+        """
+        if not path.startswith(reverse('api-root')):
+            raise Resolver404(path)
+        try:
+            match = resolve(path)
+        except Resolver404:
+            if path.endswith('/'):
+                raise
+            path += '/'
+            match = resolve(path)
+        if getattr(match.func, 'cls', None) is type(self):
+            # a batch may not contain a batch
+            raise Resolver404(path)
+        return match, path
+
+    def _subrequest(self, request, path, query):
+        """
+        :return: a GET request of the path, as the user of the batch request
+        :rtype: django.http.HttpRequest
+        """
+        subrequest = HttpRequest()
+        subrequest.method = 'GET'
+        subrequest.path = subrequest.path_info = path
+        subrequest.META = {
+            key: value for key, value in request.META.items()
+            if key not in BATCH_ONLY_META and isinstance(value, str)}
+        subrequest.META.update({'REQUEST_METHOD': 'GET',
+                                'PATH_INFO': path,
+                                'QUERY_STRING': query,
+                                'HTTP_ACCEPT': 'application/json'})
+        subrequest.GET = QueryDict(query)
+        subrequest.COOKIES = request.COOKIES
+        # the user is not authenticated again, see rest_framework.Request
+        subrequest.user = request.user
+        subrequest._force_auth_user = request.user  # pylint: disable=protected-access # noqa
+        subrequest._force_auth_token = request.auth  # pylint: disable=protected-access # noqa
+        return subrequest
+
+    def run_request(self, request, request_id, path, query):
+        """Dispatch one request of the batch to its view.
+
+        :return: the response of the request, see the module docstring
+        :rtype: dict
+        """
+        result = {'id': request_id,
+                  'path': f'{path}?{query}' if query else path}
+        try:
+            match, path = self._resolve(path)
+        except Resolver404:
+            result.update(status=status.HTTP_404_NOT_FOUND,
+                          data={'error': f'{path} is not an endpoint of '
+                                f'the API'})
+            return result
+
+        subrequest = self._subrequest(request, path, query)
+        subrequest.resolver_match = match
+        try:
+            response = match.func(subrequest, *match.args, **match.kwargs)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception('batch request %s failed', result['path'])
+            result.update(status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                          data={'error': str(exc)})
+            return result
+
+        result['status'] = response.status_code
+        if isinstance(response, Response):
+            result['data'] = response.data
+        elif 'json' in response.get('Content-Type', '') and \
+                not response.streaming:
+            # eg a response from the response cache
+            result['data'] = json.loads(response.content)
+        else:
+            result['data'] = {'error': 'the response is not JSON. Request '
+                              f'{result["path"]} on its own'}
+        return result
+
+    def _run_in_thread(self, *args):
+        try:
+            return self.run_request(*args)
+        finally:
+            # the connections of this thread
+            connections.close_all()
+
+    def create(self, request, *args, **kwargs):
+        try:
+            requests = self._parse_requests(request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # other connections may not read the data of an open transaction
+        in_transaction = any(connection.in_atomic_block for connection in
+                             connections.all(initialized_only=True))
+        workers = min(settings.BATCH_MAX_WORKERS, len(requests))
+        if in_transaction or workers <= 1:
+            responses = [self.run_request(request, *x) for x in requests]
+        else:
+            # each request runs in a copy of this context, eg its
+            # read_replica state, since a context may only be entered by
+            # one thread at a time
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(contextvars.copy_context().run,
+                                           self._run_in_thread, request, *x)
+                           for x in requests]
+                responses = [future.result() for future in futures]
+
+        return Response({'responses': responses}, status=status.HTTP_200_OK)
@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import CCExperiment
 from ..serializers import CCExperimentSerializer
 from ..filters import CCExperimentFilter
 
 
-class CCExperimentViewSet(ListModelFieldsMixin,
+class CCExperimentViewSet(ResponseCacheMixin,
+                          SparseFieldsetMixin,
+                          ConditionalListMixin,
+                          ExportMixin,
+                          FastListMixin,
+                          ListModelFieldsMixin,
                           CustomCreateMixin,
                           CustomValidateMixin,
                           PageSizeModelMixin,
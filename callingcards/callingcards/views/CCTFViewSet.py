@@ -7,12 +7,22 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import CCTF
 from ..serializers import CCTFSerializer, CCTFListSerializer
 
 
-class CCTFViewSet(ListModelFieldsMixin,
+class CCTFViewSet(ResponseCacheMixin,
+                  SparseFieldsetMixin,
+                  ConditionalListMixin,
+                  ExportMixin,
+                  FastListMixin,
+                  ListModelFieldsMixin,
                   CustomCreateMixin,
                   CustomValidateMixin,
                   UpdateModifiedMixin,
@@ -5,13 +5,25 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     FileDownloadMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import CallingCardsSig
 from ..serializers import CallingCardsSigSerializer
 from ..filters import CallingCardsSigFilter
 
 
-class CallingCardsSigViewSet(ListModelFieldsMixin,
+class CallingCardsSigViewSet(ResponseCacheMixin,
+                             SparseFieldsetMixin,
+                             ConditionalListMixin,
+                             ExportMixin,
+                             FileDownloadMixin,
+                             FastListMixin,
+                             ListModelFieldsMixin,
                              CustomCreateMixin,
                              CustomValidateMixin,
                              PageSizeModelMixin,
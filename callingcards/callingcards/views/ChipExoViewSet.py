@@ -2,21 +2,32 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from .mixins import (ListModelFieldsMixin,
                      CustomCreateMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin,
+                     MatrixMixin)
 from ..models import ChipExo
 from ..serializers import (ChipExoSerializer,
                            ChipExoAnnotatedSerializer)
-from ..filters import ChipExoFilter
+from ..filters import ChipExoFilter, TrigramSearchFilter
 
 
-class ChipExoViewSet(ListModelFieldsMixin,
+class ChipExoViewSet(ResponseCacheMixin,
+                     SparseFieldsetMixin,
+                     ConditionalListMixin,
+                     ExportMixin,
+                     MatrixMixin,
+                     FastListMixin,
+                     ListModelFieldsMixin,
                      CustomCreateMixin,
                      CustomValidateMixin,
                      UpdateModifiedMixin,
@@ -28,10 +39,11 @@ class ChipExoViewSet(ListModelFieldsMixin,
     """
     queryset = ChipExo.objects.all().order_by('id')  # noqa
     serializer_class = ChipExoSerializer  # noqa
+    matrix_values = ['strength']
     permission_classes = (AllowAny,)
     filterset_class = ChipExoFilter
 
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['associated_feature__locus_tag',
                      'associated_feature__gene', 'source']
 
@@ -60,8 +72,7 @@ class ChipExoViewSet(ListModelFieldsMixin,
         annote_qs_fltr = ChipExoFilter(
             self.request.GET,
             queryset=annote_qs)
-        content = {'count': self.get_count(annote_qs_fltr.qs)}
-        return Response(content)
+        return self.count_response(annote_qs_fltr.qs)
 
     @action(detail=False, url_path='with_annote/pagination_info',
             url_name='with-annote-pagination-info')
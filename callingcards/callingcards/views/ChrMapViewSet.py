@@ -3,12 +3,22 @@ from rest_framework.permissions import AllowAny
 from .mixins import (ListModelFieldsMixin,
                      CustomCreateMixin,
                      PageSizeModelMixin,
-                     CountModelMixin)
+                     CountModelMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import ChrMap
 from ..serializers import ChrMapSerializer
 
 
-class ChrMapViewSet(ListModelFieldsMixin,
+class ChrMapViewSet(ResponseCacheMixin,
+                    SparseFieldsetMixin,
+                    ConditionalListMixin,
+                    ExportMixin,
+                    FastListMixin,
+                    ListModelFieldsMixin,
                     CustomCreateMixin,
                     PageSizeModelMixin,
                     viewsets.ModelViewSet,
@@ -7,11 +7,21 @@ from rest_framework.filters import OrderingFilter
 from .mixins import (ListModelFieldsMixin, CustomCreateMixin,
                      PageSizeModelMixin, CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..serializers import ExpressionViewSetSerializer
 from ..filters import McIsaacZevFilter, KemmerenTfkoFilter
 
-class ExpressionViewSet(ListModelFieldsMixin,
+class ExpressionViewSet(ResponseCacheMixin,
+                        SparseFieldsetMixin,
+                        ConditionalListMixin,
+                        ExportMixin,
+                        FastListMixin,
+                        ListModelFieldsMixin,
                         CustomCreateMixin,
                         CustomValidateMixin,
                         UpdateModifiedMixin,
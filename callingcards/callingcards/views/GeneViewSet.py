@@ -1,22 +1,35 @@
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
-from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from .mixins import (ListModelFieldsMixin,
                      CustomCreateMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     UploadGenomicCoordinatesMixin,
+                     ChunkedUploadMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import Gene
 from ..serializers import GeneSerializer
-from ..filters import GeneFilter
+from ..filters import GeneFilter, TrigramSearchFilter
 
 
-class GeneViewSet(ListModelFieldsMixin,
+class GeneViewSet(ResponseCacheMixin,
+                  SparseFieldsetMixin,
+                  ConditionalListMixin,
+                  ExportMixin,
+                  FastListMixin,
+                  ListModelFieldsMixin,
                   CustomCreateMixin,
                   CustomValidateMixin,
                   UpdateModifiedMixin,
+                  UploadGenomicCoordinatesMixin,
+                  ChunkedUploadMixin,
                   PageSizeModelMixin,
                   viewsets.ModelViewSet,
                   CountModelMixin):
@@ -28,5 +41,5 @@ class GeneViewSet(ListModelFieldsMixin,
     permission_classes = (AllowAny,)
 
     filterset_class = GeneFilter
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['locus_tag', 'gene']
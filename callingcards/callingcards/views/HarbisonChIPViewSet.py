@@ -2,20 +2,31 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from .mixins import (ListModelFieldsMixin,
                      CustomCreateMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin,
+                     MatrixMixin)
 from ..models import HarbisonChIP
 from ..serializers import (HarbisonChIPSerializer,
                            HarbisonChIPAnnotatedSerializer)
-from ..filters import HarbisonChIPFilter
+from ..filters import HarbisonChIPFilter, TrigramSearchFilter
 
-class HarbisonChIPViewSet(ListModelFieldsMixin,
+class HarbisonChIPViewSet(ResponseCacheMixin,
+                          SparseFieldsetMixin,
+                          ConditionalListMixin,
+                          ExportMixin,
+                          MatrixMixin,
+                          FastListMixin,
+                          ListModelFieldsMixin,
                           CustomCreateMixin,
                           CustomValidateMixin,
                           UpdateModifiedMixin,
@@ -27,10 +38,11 @@ class HarbisonChIPViewSet(ListModelFieldsMixin,
     """
     queryset = HarbisonChIP.objects.all().order_by('id')  # noqa
     serializer_class = HarbisonChIPSerializer  # noqa
+    matrix_values = ['pval']
     permission_classes = (AllowAny,)
     filterset_class = HarbisonChIPFilter
 
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['associated_feature__locus_tag',
                      'associated_feature__gene', 'source']
 
@@ -59,8 +71,7 @@ class HarbisonChIPViewSet(ListModelFieldsMixin,
         annote_qs_fltr = HarbisonChIPFilter(
             self.request.GET,
             queryset=annote_qs)
-        content = {'count': self.get_count(annote_qs_fltr.qs)}
-        return Response(content)
+        return self.count_response(annote_qs_fltr.qs)
 
     @action(detail=False, url_path='with_annote/pagination_info',
             url_name='with-annote-pagination-info')
@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import HopsSource
 from ..serializers import HopsSourceSerializer
 from ..filters import HopsSourceFilter
 
 
-class HopsSourceViewSet(ListModelFieldsMixin,
+class HopsSourceViewSet(ResponseCacheMixin,
+                        SparseFieldsetMixin,
+                        ConditionalListMixin,
+                        ExportMixin,
+                        FastListMixin,
+                        ListModelFieldsMixin,
                         CustomCreateMixin,
                         CustomValidateMixin,
                         UpdateModifiedMixin,
@@ -5,15 +5,30 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     UploadGenomicCoordinatesMixin,
+                     ChunkedUploadMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import Hops
 from ..serializers import HopsSerializer
+from ..filters import HopsFilter
 
 
-class HopsViewSet(ListModelFieldsMixin,
+class HopsViewSet(ResponseCacheMixin,
+                  SparseFieldsetMixin,
+                  ConditionalListMixin,
+                  ExportMixin,
+                  FastListMixin,
+                  ListModelFieldsMixin,
                   CustomCreateMixin,
                   CustomValidateMixin,
                   UpdateModifiedMixin,
+                  UploadGenomicCoordinatesMixin,
+                  ChunkedUploadMixin,
                   PageSizeModelMixin,
                   viewsets.ModelViewSet,
                   CountModelMixin):
@@ -23,3 +38,4 @@ class HopsViewSet(ListModelFieldsMixin,
     queryset = Hops.objects.all().order_by('id')  # noqa
     serializer_class = HopsSerializer  # noqa
     permission_classes = (AllowAny,)
+    filterset_class = HopsFilter
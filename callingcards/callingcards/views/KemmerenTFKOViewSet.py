@@ -1,5 +1,4 @@
 from rest_framework import viewsets
-from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny
 from django_filters import rest_framework as filters
 from .mixins import (ListModelFieldsMixin,
@@ -7,12 +6,24 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin,
+                     MatrixMixin)
 from ..models import KemmerenTFKO
 from ..serializers import KemmerenTFKOSerializer
-from ..filters import KemmerenTfkoFilter
+from ..filters import KemmerenTfkoFilter, TrigramSearchFilter
 
-class KemmerenTFKOViewSet(ListModelFieldsMixin,
+class KemmerenTFKOViewSet(ResponseCacheMixin,
+                          SparseFieldsetMixin,
+                          ConditionalListMixin,
+                          ExportMixin,
+                          MatrixMixin,
+                          FastListMixin,
+                          ListModelFieldsMixin,
                           CustomCreateMixin,
                           CustomValidateMixin,
                           UpdateModifiedMixin,
@@ -24,9 +35,10 @@ class KemmerenTFKOViewSet(ListModelFieldsMixin,
     """
     queryset = KemmerenTFKO.objects.all().order_by('id')  # noqa
     serializer_class = KemmerenTFKOSerializer  # noqa
+    matrix_values = ['effect', 'padj']
     permission_classes = (AllowAny,)
 
-    filter_backends = [filters.DjangoFilterBackend, SearchFilter]
+    filter_backends = [filters.DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['tf__locus_tag', 'tf__gene',
                      'gene__locus_tag', 'gene__gene']
 
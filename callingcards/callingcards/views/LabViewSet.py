@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import Lab
 from ..serializers import LabSerializer
 from ..filters import LabFilter
 
 
-class LabViewSet(ListModelFieldsMixin,
+class LabViewSet(ResponseCacheMixin,
+                 SparseFieldsetMixin,
+                 ConditionalListMixin,
+                 ExportMixin,
+                 FastListMixin,
+                 ListModelFieldsMixin,
                  CustomCreateMixin,
                  CustomValidateMixin,
                  UpdateModifiedMixin,
@@ -1,5 +1,4 @@
 from rest_framework import viewsets
-from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny
 from django_filters import rest_framework as filters
 from .mixins import (ListModelFieldsMixin,
@@ -7,12 +6,24 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin,
+                     MatrixMixin)
 from ..models import McIsaacZEV
 from ..serializers import McIsaacZEVSerializer
-from ..filters import McIsaacZevFilter
+from ..filters import McIsaacZevFilter, TrigramSearchFilter
 
-class McIsaacZEVViewSet(ListModelFieldsMixin,
+class McIsaacZEVViewSet(ResponseCacheMixin,
+                        SparseFieldsetMixin,
+                        ConditionalListMixin,
+                        ExportMixin,
+                        MatrixMixin,
+                        FastListMixin,
+                        ListModelFieldsMixin,
                         CustomCreateMixin,
                         CustomValidateMixin,
                         UpdateModifiedMixin,
@@ -24,9 +35,10 @@ class McIsaacZEVViewSet(ListModelFieldsMixin,
     """
     queryset = McIsaacZEV.objects.all().order_by('id')  # noqa
     serializer_class = McIsaacZEVSerializer  # noqa
+    matrix_values = ['effect', 'pval']
     permission_classes = (AllowAny,)
     filterset_class = McIsaacZevFilter
 
-    filter_backends = [filters.DjangoFilterBackend, SearchFilter]
+    filter_backends = [filters.DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['tf__locus_tag', 'tf__gene',
                      'gene__locus_tag', 'gene__gene']
@@ -0,0 +1,33 @@
+"""
+.. module:: MediaFileView
+   :synopsis: Serve the files under MEDIA_URL to authenticated users
+
+When the files are stored on the file system, eg in development, the urls of
+the file fields, eg `/media/analysis/...`, are served by this view, rather
+than by `django.conf.urls.static`, which serves them to anyone, and only
+with `DEBUG`. The file is served with
+:func:`~callingcards.utils.file_serving.serve_file`, so the front end server
+sends it if `FILE_SERVING_BACKEND` is `x-accel-redirect` or `x-sendfile`.
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+from django.core.files.storage import default_storage
+from rest_framework.authentication import (SessionAuthentication,
+                                           TokenAuthentication)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from ..utils.file_serving import serve_file
+
+
+class MediaFileView(APIView):
+    """
+    Serve a file of the default storage, by its path under MEDIA_URL.
+    """
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path, *args, **kwargs):
+        return serve_file(request._request,  # pylint: disable=protected-access # noqa
+                          default_storage, path)
@@ -2,21 +2,17 @@
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from concurrent.futures.process import BrokenProcessPool
 import logging
-import os
 import gzip
 import io
 import time
-import datetime
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
 from django_filters import rest_framework as filters
 from django.http import HttpResponse
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.urls import reverse
 
 import pandas as pd
 
@@ -25,16 +21,24 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
-from ..models import (PromoterRegions, CallingCardsSig,
-                      CCExperiment, HopsSource,
-                      BackgroundSource,
-                      PromoterRegionsSource)
+                     CustomValidateMixin,
+                     UploadGenomicCoordinatesMixin,
+                     ChunkedUploadMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
+from ..models import CallingCardsSig, PromoterRegions
 from ..serializers import (PromoterRegionsSerializer,
                            PromoterRegionsTargetsOnlySerializer)
-from ..filters import (PromoterRegionsFilter, CCExperimentFilter,
-                       CallingCardsSigFilter)
-from ..utils.callingcards_with_metrics import callingcards_with_metrics
+from ..filters import (PromoterRegionsFilter, CallingCardsSigFilter,
+                       TrigramSearchFilter)
+from ..utils.callingcards_sig_cache import (calculate_sig,
+                                            fill_sig_stats,
+                                            find_cached_sigs,
+                                            read_sig)
+from ..utils.file_serving import file_url
 # from ..utils.process_experiment import process_experiment
 
 logger = logging.getLogger(__name__)
@@ -45,10 +49,17 @@ logger = logging.getLogger(__name__)
 # the levels of indentation.
 
 
-class PromoterRegionsViewSet(ListModelFieldsMixin,
+class PromoterRegionsViewSet(ResponseCacheMixin,
+                             SparseFieldsetMixin,
+                             ConditionalListMixin,
+                             ExportMixin,
+                             FastListMixin,
+                             ListModelFieldsMixin,
                              CustomCreateMixin,
                              CustomValidateMixin,
                              UpdateModifiedMixin,
+                             UploadGenomicCoordinatesMixin,
+                             ChunkedUploadMixin,
                              PageSizeModelMixin,
                              viewsets.ModelViewSet,
                              CountModelMixin):
@@ -57,9 +68,13 @@ class PromoterRegionsViewSet(ListModelFieldsMixin,
     permission_classes = (AllowAny,)
     filterset_class = PromoterRegionsFilter
 
-    filter_backends = [filters.DjangoFilterBackend, SearchFilter]
+    filter_backends = [filters.DjangoFilterBackend, TrigramSearchFilter]
     search_fields = ['associated_feature__locus_tag',
                      'associated_feature__gene', 'source']
+    # the manifest has urls which expire, and new results are cached when
+    # it is listed, so it is not served from the response cache
+    response_cache_skip_params = ('export', 'manifest')
+    manifest_query_param = 'manifest'
 
     @action(detail=False, methods=['get'], url_path='targets',
             url_name='targets')
@@ -87,8 +102,7 @@ class PromoterRegionsViewSet(ListModelFieldsMixin,
         annote_qs_fltr = PromoterRegionsFilter(
             self.request.GET,
             queryset=annote_qs)
-        content = {'count': self.get_count(annote_qs_fltr.qs)}
-        return Response(content)
+        return self.count_response(annote_qs_fltr.qs)
 
     @action(detail=False, url_path='targets/pagination_info',
             url_name='targets-pagination-info')
@@ -113,6 +127,65 @@ class PromoterRegionsViewSet(ListModelFieldsMixin,
                          "filter": filter_columns},
                         status=status.HTTP_200_OK)
 
+    def callingcards_manifest(self, experiment_id_list, sources,
+                              cached_sigs, user):
+        """List the result files of the experiments, with a url from which
+        each may be downloaded, rather than reading them. Results which are
+        not cached are calculated and cached first.
+
+        :param experiment_id_list: the experiment ids
+        :type experiment_id_list: list
+        :param sources: the `hops_source`, `background_source` and
+            `promoter_source`
+        :type sources: dict
+        :param cached_sigs: the cached results, by experiment id
+        :type cached_sigs: dict
+        :param user: the user who is recorded as the uploader of new results
+        :type user: User
+        :return: the manifest, eg `{"count": 1, "files": [{"experiment_id":
+            75, "hops_source": 1, "background_source": 1,
+            "promoter_source": 1, "url": "https://...", "size": 2048,
+            "sha256": "...", "row_count": 6708}], "failed": []}`. `failed`
+            lists the experiments whose results could not be calculated
+        :rtype: Response
+        """
+        missing = [experiment for experiment in experiment_id_list
+                   if not cached_sigs.get(experiment)]
+        calculated = [experiment for experiment in missing
+                      if calculate_sig(experiment, sources, user)
+                      is not None]
+        if calculated:
+            for sig in CallingCardsSigFilter(
+                    {'experiment_id': calculated, **sources},
+                    queryset=CallingCardsSig.objects.all()).qs:
+                cached_sigs.setdefault(sig.experiment_id, []).append(sig)
+        sigs = [sig for experiment in experiment_id_list
+                for sig in cached_sigs.get(experiment, [])]
+        fill_sig_stats(sigs)
+
+        files = []
+        for sig in sigs:
+            filename = (f'ccexperiment_{sig.experiment_id}_'
+                        f'{sig.hops_source_id}_{sig.background_source_id}_'
+                        f'{sig.promoter_source_id}.csv.gz')
+            files.append({
+                'experiment_id': sig.experiment_id,
+                'hops_source': sig.hops_source_id,
+                'background_source': sig.background_source_id,
+                'promoter_source': sig.promoter_source_id,
+                'url': file_url(self.request, sig.file.storage,
+                                sig.file.name,
+                                reverse('callingcardssig-download',
+                                        kwargs={'pk': sig.pk}),
+                                filename),
+                'size': sig.file_size,
+                'sha256': sig.sha256 or None,
+                'row_count': sig.row_count})
+        return Response({'count': len(files),
+                         'files': files,
+                         'failed': sorted(set(missing) - set(calculated))},
+                        status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='callingcards',
             url_name='callingcards')
     def callingcards(self, request, *args, **kwargs):
@@ -136,148 +209,45 @@ class PromoterRegionsViewSet(ListModelFieldsMixin,
         logger.debug('promoterregions/callingcards queryparams: '
                      '{}'.format(user))
 
-        # first, get all associated experiment_ids
-        experiment_id_qs = CCExperimentFilter(
-            self.request.query_params,
-            queryset=CCExperiment.objects.all())\
-            .qs\
-            .values_list('id', flat=True)\
-            .distinct()
-        experiment_id_list = list(experiment_id_qs)
+        # first, get all associated experiment_ids, and their cached
+        # results. cached results whose input qbed/background/promoter data
+        # has changed are deleted and recalculated
+        experiment_id_list, sources, cached_sigs = \
+            find_cached_sigs(self.request.query_params)
         logger.debug('promoterregions/callingcards experiment_id_list: '
                      '{}'.format(experiment_id_list))
 
+        # with ?manifest=true, list the result files rather than sending them
+        if self.request.query_params.get(self.manifest_query_param, '')\
+                .lower() in ('true', '1'):
+            return self.callingcards_manifest(experiment_id_list, sources,
+                                              cached_sigs, user)
+
         # iterate over the experiment ids and either get the cached file
         # or calculate the dataframe
-        # Create a pool of worker processes
         df_list = []
-        # Use a process pool executor to parallelize the tasks
-        # with ProcessPoolExecutor(max_workers=max(1, os.cpu_count() - 1)) \
-        #         as executor:
-        # future_to_experiment = {}
         for experiment in experiment_id_list:
             # check if the file exists in the cache
             logger.debug('working on experiment: {}'.format(experiment))
-            cached_sig = CallingCardsSigFilter(
-                {'experiment_id': experiment,
-                    'hops_source': self.request.query_params.get(
-                        'hops_source', None),
-                    'background_source': self.request.query_params.get(
-                        'background_source', None),
-                    'promoter_source': self.request.query_params.get(
-                        'promoter_source', None)},
-                queryset=CallingCardsSig.objects.all()).qs
+            cached_sig = cached_sigs.get(experiment, [])
             # log the length of the cached file
             logger.debug('cached_sig len: {}'.format(len(cached_sig)))
 
             # if there are no cached files, calculate the metrics by replicate
+            # (or reuse a result with identical inputs from another
+            # experiment), and cache them
             if len(cached_sig) == 0:
-                # # Submit the experiment to the worker pool
-                # future = executor.submit(
-                #     process_experiment, experiment, user.id, **self.request.query_params
-                # )
-                # # Keep track of the future and the experiment it's associated with
-                # future_to_experiment[future] = experiment
-                # if not, calculate
-                try:
-                    result_df = callingcards_with_metrics(
-                        {'experiment_id': experiment,
-                         'hops_source': self.request.query_params
-                            .get('hops_source', None),
-                         'background_source': self.request.query_params
-                            .get('background_source', None),
-                         'promoter_source': self.request.query_params
-                            .get('promoter_source', None)})
-                except ValueError as err:
-                    # log the info and continue on to the next item in
-                    # the experiment_id_list
-                    logger.error('callingcards_with_metrics failed: '
-                                 '{}'.format(err))
-                    # do not continue with the rest of the curren iteration
-                    # TODO refactor to remove continue
-                    continue
-                # cache the result in the database
-                grouped = result_df.groupby(['experiment_id',
-                                             'hops_source',
-                                             'background_source',
-                                             'promoter_source'])
-                for name, group in grouped:
-                    logger.debug('processing group: {}'.format(name))
-                    (experiment_id, hops_source,
-                     background_source, promoter_source) = name
-
-                    # Compress the dataframe and write it to the buffer
-                    compressed_buffer = io.BytesIO()
-                    with gzip.GzipFile(fileobj=compressed_buffer,
-                                       mode='wb') as gz:
-                        group.to_csv(gz, index=False, encoding='utf-8')
-
-                    # Reset the buffer's position to the beginning
-                    compressed_buffer.seek(0)
-
-                    # Save the file to Django's default storage
-                    filepath = os.path.join(
-                        'analysis',
-                        CCExperiment.objects.get(pk=experiment_id).batch,
-                        f'ccexperiment_{experiment_id}',
-                        f'{hops_source}'
-                        f'_{background_source}'
-                        f'_{promoter_source}.csv.gz')
-
-                    logger.debug("filepath: %s", filepath)
-
-                    default_storage.save(
-                        filepath,
-                        ContentFile(compressed_buffer.read()))
-
-                    # Close the buffer
-                    compressed_buffer.close()
-
-                    # create the record in the database
-                    CallingCardsSig.objects.create(
-                        uploader=user,
-                        uploadDate=datetime.date.today(),
-                        modified=datetime.datetime.now(),
-                        modifiedBy=user,
-                        experiment=CCExperiment.objects.get(pk=experiment_id),
-                        hops_source=HopsSource.objects.get(pk=hops_source),
-                        background_source=BackgroundSource.objects.get(pk=background_source),  # noqa
-                        promoter_source=PromoterRegionsSource.objects.get(pk=promoter_source),  # noqa
-                        file=filepath)
-
-                df_list.append(result_df)
+                result_df = calculate_sig(experiment, sources, user)
+                if result_df is not None:
+                    df_list.append(result_df)
             # if there are records already in the database, get them, read
             # them in and append them to the list
             else:
                 start = time.time()
                 for significance_file in cached_sig:
-                    # Get the file field from the queryset
-                    file_field = significance_file.file
-                    # Open the file using the storage backend
-                    with default_storage.open(file_field.name, 'rb') as f:
-                        # Read the file content into a BytesIO buffer
-                        file_content = io.BytesIO(f.read())
-                    # Read the file content with pandas
-                    df = pd.read_csv(file_content, compression='gzip')
-                    # append it to the list
-                    df_list.append(df)
+                    df_list.append(read_sig(significance_file))
                 logger.info('cached_sig time: {}'.format(
                     time.time() - start))
-                # Now retrieve the actual results from the async calls
-
-            # for future in as_completed(future_to_experiment):
-            #     experiment = future_to_experiment[future]
-            #     try:
-            #         result_df = future.result()
-            #         if result_df is not None:
-            #             df_list.append(result_df)
-            #         else:
-            #             logger.error(
-            #                 'callingcards_with_metrics async failed '
-            #                 'to return a result for experiment %s', experiment)
-            #     except BrokenProcessPool as err:
-            #         logger.error("Error processing experiment %s: %s",
-            #                      experiment, err)
 
         start = time.time()
         # save the dataframe to file (compressed)
@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import QcManualReview
 from ..serializers import QcManualReviewSerializer
 from ..filters import QcManualReviewFilter
 
 
-class QcManualReviewViewSet(ListModelFieldsMixin,
+class QcManualReviewViewSet(ResponseCacheMixin,
+                            SparseFieldsetMixin,
+                            ConditionalListMixin,
+                            ExportMixin,
+                            FastListMixin,
+                            ListModelFieldsMixin,
                             CustomCreateMixin,
                             CustomValidateMixin,
                             UpdateModifiedMixin,
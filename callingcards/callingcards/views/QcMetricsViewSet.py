@@ -5,12 +5,22 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import QcMetrics
 from ..serializers import QcMetricsSerializer
 from ..filters import QcMetricsFilter
 
-class QcMetricsViewSet(ListModelFieldsMixin,
+class QcMetricsViewSet(ResponseCacheMixin,
+                       SparseFieldsetMixin,
+                       ConditionalListMixin,
+                       ExportMixin,
+                       FastListMixin,
+                       ListModelFieldsMixin,
                        CustomCreateMixin,
                        CustomValidateMixin,
                        UpdateModifiedMixin,
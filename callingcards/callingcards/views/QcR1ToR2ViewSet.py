@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import QcR1ToR2Tf
 from ..serializers import QcR1ToR2TfSerializer
 from ..filters import QcR1ToR2TfFilter
 
 
-class QcR1ToR2ViewSet(ListModelFieldsMixin,
+class QcR1ToR2ViewSet(ResponseCacheMixin,
+                      SparseFieldsetMixin,
+                      ConditionalListMixin,
+                      ExportMixin,
+                      FastListMixin,
+                      ListModelFieldsMixin,
                       CustomCreateMixin,
                       CustomValidateMixin,
                       UpdateModifiedMixin,
@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import QcR2ToR1Tf
 from ..serializers import QcR2ToR1TfSerializer
 from ..filters import QcR2ToR1TfFilter
 
 
-class QcR2ToR1ViewSet(ListModelFieldsMixin,
+class QcR2ToR1ViewSet(ResponseCacheMixin,
+                      SparseFieldsetMixin,
+                      ConditionalListMixin,
+                      ExportMixin,
+                      FastListMixin,
+                      ListModelFieldsMixin,
                       CustomCreateMixin,
                       CustomValidateMixin,
                       UpdateModifiedMixin,
@@ -1,7 +1,5 @@
 import logging
-from django.db.models import (Case, When, F, Value,
-                              CharField, OuterRef, Subquery)
-from django.db.models.functions import Coalesce, NullIf
+from django.db.models import F
 from django_filters import rest_framework as filters
 from rest_framework import viewsets
 from rest_framework.response import Response
@@ -10,16 +8,26 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from .constants import UNDETERMINED_LOCUS_TAG
-from ..models import Hops_s3, QcR1ToR2Tf, QcR2ToR1Tf, Gene, QcManualReview
+from ..models import ExperimentQcSummary, QcManualReview
 from ..serializers import QcReviewSerializer, QcManualReviewSerializer
 from ..filters import CCExperimentFilter
 
 logger = logging.getLogger(__name__)
 
 
-class QcReviewViewSet(ListModelFieldsMixin,
+class QcReviewViewSet(ResponseCacheMixin,
+                      SparseFieldsetMixin,
+                      ConditionalListMixin,
+                      ExportMixin,
+                      FastListMixin,
+                      ListModelFieldsMixin,
                       CustomCreateMixin,
                       CustomValidateMixin,
                       UpdateModifiedMixin,
@@ -35,60 +43,37 @@ class QcReviewViewSet(ListModelFieldsMixin,
 
     def get_queryset(self):
 
-        genomic_hops_subquery = Hops_s3.objects\
-            .filter(experiment_id=OuterRef('pk'))\
-            .values('genomic_hops')[:1]
-
-        mito_hops_subquery = Hops_s3.objects\
-            .filter(experiment_id=OuterRef('pk'))\
-            .values('mito_hops')[:1]
-
-        plasmid_hops_subquery = Hops_s3.objects\
-            .filter(experiment_id=OuterRef('pk'))\
-            .values('plasmid_hops')[:1]
-
-        r1_r2_max_tally_edit_dist_subquery = QcR1ToR2Tf.objects.filter(
-            experiment_id=OuterRef('pk')
-        ).order_by('-tally').values('edit_dist')[:1]
-
-        r2_r1_max_tally_edit_dist_subquery = QcR2ToR1Tf.objects.filter(
-            experiment_id=OuterRef('pk')
-        ).order_by('-tally').values('edit_dist')[:1]
-
-        unknown_feature_id = Gene.objects\
-            .get(locus_tag=UNDETERMINED_LOCUS_TAG).id
+        # the values are read from the summary table, which is maintained by
+        # signals. See callingcards.models.ExperimentQcSummary. The rows of
+        # experiments which were loaded without the signals are created
+        # first, and the join is an outer join, so that no experiment is
+        # hidden
+        ExperimentQcSummary.objects.refresh_missing()
 
         ccexperiment_fltr = CCExperimentFilter(self.request.GET)
 
-        # TODO add select/prefetch related to reduce the number of queries
-        # note when teh qc_metrics unmapped is 0, set to 0 to avoid divide by
-        # 0 error
         query = (
             ccexperiment_fltr.qs
-            .exclude(tf_id=unknown_feature_id)
+            .exclude(qc_summary__tf_locus_tag=UNDETERMINED_LOCUS_TAG)
             .annotate(
                 experiment_id=F('id'),
-                tf_alias=Case(
-                    When(tf__tf__gene__istartswith='unknown',
-                            then=F('tf__tf__locus_tag')),
-                    default=F('tf__tf__gene'),
-                    output_field=CharField()),
-                r1_r2_max_tally_edit_dist=Subquery(r1_r2_max_tally_edit_dist_subquery),  # noqa
-                r2_r1_max_tally_edit_dist=Subquery(r2_r1_max_tally_edit_dist_subquery),  # noqa
-                map_unmap_ratio=Coalesce(
-                    F('qcmetrics__genome_mapped') / NullIf(
-                        F('qcmetrics__unmapped'), 0), Value(0)
-                ),
-                genomic_hops=Subquery(genomic_hops_subquery),
-                mito_hops=Subquery(mito_hops_subquery),
-                plasmid_hops=Subquery(plasmid_hops_subquery),
-                rank_recall=F('qcmanualreview__rank_recall'),
-                chip_better=F('qcmanualreview__chip_better'),
-                data_usable=F('qcmanualreview__data_usable'),
-                passing_replicate=F('qcmanualreview__passing_replicate'),
-                note=F('qcmanualreview__note')
+                tf_alias=F('qc_summary__tf_alias'),
+                r1_r2_max_tally_edit_dist=F(
+                    'qc_summary__r1_r2_max_tally_edit_dist'),
+                r2_r1_max_tally_edit_dist=F(
+                    'qc_summary__r2_r1_max_tally_edit_dist'),
+                map_unmap_ratio=F('qc_summary__map_unmap_ratio'),
+                genomic_hops=F('qc_summary__genomic_hops'),
+                mito_hops=F('qc_summary__mito_hops'),
+                plasmid_hops=F('qc_summary__plasmid_hops'),
+                rank_recall=F('qc_summary__rank_recall'),
+                chip_better=F('qc_summary__chip_better'),
+                data_usable=F('qc_summary__data_usable'),
+                passing_replicate=F('qc_summary__passing_replicate'),
+                note=F('qc_summary__note')
             )
-            .order_by('tf_alias', 'batch', 'batch_replicate')
+            .order_by('qc_summary__tf_alias', 'qc_summary__batch',
+                      'qc_summary__batch_replicate')
             .values('experiment_id', 'tf_alias', 'batch', 'batch_replicate',
                     'r1_r2_max_tally_edit_dist', 'r2_r1_max_tally_edit_dist',
                     'map_unmap_ratio', 'genomic_hops', 'mito_hops',
@@ -96,14 +81,26 @@ class QcReviewViewSet(ListModelFieldsMixin,
                     'data_usable', 'passing_replicate', 'note')
         )
 
-        # for item in query:
-        #     item['r1_r2_status'] = 'pass' if item['r1_r2_status'] == 0 \
-        #         else 'fail'
-        #     item['r2_r1_status'] = 'pass' if item['r2_r1_status'] == 0 \
-        #         else 'fail'
-
         return query
 
+    # a bulk update is a list of QcManualReview fields by experiment_id
+    bulk_update_id_field = 'experiment_id'
+    bulk_update_lookup = 'experiment_id'
+
+    def get_bulk_update_queryset(self):
+        return QcManualReview.objects.all()
+
+    def get_bulk_update_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return QcManualReviewSerializer(*args, **kwargs)
+
+    def get_bulk_update_response(self, instances):
+        # the summary is refreshed by the bulk load signal, so the rows are
+        # read after the update
+        queryset = self.get_queryset().filter(
+            experiment_id__in=[x.experiment_id for x in instances])
+        return Response(QcReviewSerializer(queryset, many=True).data)
+
     def update(self, request, pk=None):
 
         manual_review = QcManualReview.objects.get(experiment__id=pk)
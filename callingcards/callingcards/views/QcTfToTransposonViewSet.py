@@ -5,13 +5,23 @@ from .mixins import (ListModelFieldsMixin,
                      PageSizeModelMixin,
                      CountModelMixin,
                      UpdateModifiedMixin,
-                     CustomValidateMixin)
+                     CustomValidateMixin,
+                     ExportMixin,
+                     ConditionalListMixin,
+                     ResponseCacheMixin,
+                     FastListMixin,
+                     SparseFieldsetMixin)
 from ..models import QcTfToTransposon
 from ..serializers import QcTfToTransposonSerializer
 from ..filters import QcTfToTransposonFilter
 
 
-class QcTfToTransposonViewSet(ListModelFieldsMixin,
+class QcTfToTransposonViewSet(ResponseCacheMixin,
+                              SparseFieldsetMixin,
+                              ConditionalListMixin,
+                              ExportMixin,
+                              FastListMixin,
+                              ListModelFieldsMixin,
                               CustomCreateMixin,
                               CustomValidateMixin,
                               UpdateModifiedMixin,
@@ -1,7 +1,9 @@
 # flake8: noqa
 """Import callingcards Views into this namespace."""
 
+from .AsyncDownloadViews import AsyncCallingCardsView, AsyncQbedView
 from .BackgroundViewSet import BackgroundViewSet
+from .BatchViewSet import BatchViewSet
 from .CCExperimentViewSet import CCExperimentViewSet
 from .CCTFViewSet import CCTFViewSet
 from .CallingCardsSigViewSet import CallingCardsSigViewSet
@@ -17,6 +19,7 @@ from .HopsViewSet import HopsViewSet
 from .KemmerenTFKOViewSet import KemmerenTFKOViewSet
 from .LabViewSet import LabViewSet
 from .McIsaacZEVViewSet import McIsaacZEVViewSet
+from .MediaFileView import MediaFileView
 from .PromoterRegionViewSet import PromoterRegionsViewSet
 from .QcManualReviewViewSet import QcManualReviewViewSet
 from .QcMetricsViewSet import QcMetricsViewSet
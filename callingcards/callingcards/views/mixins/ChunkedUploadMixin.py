@@ -0,0 +1,314 @@
+"""
+ChunkedUploadMixin
+~~~~~~~~~~~~~~~~~~
+
+This module contains the ChunkedUploadMixin, which allows a file for any of
+a viewset's upload endpoints to be sent in chunks rather than in a single
+multipart request. The protocol is:
+
+1. `POST <endpoint>/chunked-upload` with `filename`, `size` and optionally
+   `sha256`, which is otherwise required by finalize. The response includes
+   the `upload_id`.
+2. `PUT <endpoint>/chunked-upload/<upload_id>?offset=<byte offset>` with the
+   raw bytes of the chunk as the body. Chunks may be sent in any order and in
+   parallel. Each chunk is written directly to storage. Re-sending a chunk
+   replaces it. An upload which receives no chunk for
+   `CHUNKED_UPLOAD_EXPIRE_SECONDS` expires.
+3. `GET <endpoint>/chunked-upload/<upload_id>` returns the byte ranges which
+   have been `received` and which are `missing`, so that a client may resume
+   after a dropped connection.
+4. `POST <endpoint>/chunked-upload/<upload_id>/finalize` with `target` (eg
+   `upload-csv`), `sha256` if it was not sent at initialization, and any
+   other fields the target endpoint needs. The chunks are assembled, the
+   SHA-256 is verified, and the assembled file is passed to the target
+   endpoint as though it had been uploaded in one request.
+
+Example usage:
+
+.. code-block:: python
+
+    class Hops_s3ViewSet(ChunkedUploadMixin, viewsets.ModelViewSet):
+        # map the `target` names to the handler and its file field
+        chunked_upload_targets = {'create': ('create', 'qbed')}
+
+.. code-block:: bash
+
+    curl -H "Authorization: Token <token>" -X PUT \\
+         -H "Content-Type: application/octet-stream" \\
+         --data-binary @chunk_0 \\
+         "https://<host>/api/v1/hops_s3/chunked-upload/<upload_id>?offset=0"
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from ...models import ChunkedUpload
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = r'(?P<upload_id>[0-9a-fA-F-]+)'
+
+
+class ChunkedUploadMixin:
+    """
+    Add `chunked-upload` actions to a viewset. `chunked_upload_targets` maps
+    the `target` names accepted by finalize to a tuple of (viewset method,
+    file field). Targets for which the viewset does not have the method are
+    ignored.
+    """
+
+    chunked_upload_targets = {
+        'upload-csv': ('upload_csv', 'csv_file'),
+        'upload-csv-postgres': ('upload_csv_postgres', 'csv_file'),
+        'upload-bed': ('upload_bed', 'bed_file'),
+    }
+
+    def get_chunked_upload_targets(self) -> dict:
+        """
+        :return: the targets whose handler exists on this viewset
+        :rtype: dict
+        """
+        return {target: handler
+                for target, handler in self.chunked_upload_targets.items()
+                if hasattr(self, handler[0])}
+
+    def get_chunked_upload(self, request, upload_id):
+        """Get the pending ChunkedUpload owned by the request user.
+
+        :return: a tuple of (upload, error response). One of the two is None
+        :rtype: tuple
+        """
+        if not request.user.is_authenticated:
+            return None, Response(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            upload = ChunkedUpload.objects.get(upload_id=upload_id,
+                                               uploader=request.user)
+        except (ChunkedUpload.DoesNotExist, ValidationError):
+            return None, Response(
+                {"error": f"Upload {upload_id} not found."},
+                status=status.HTTP_404_NOT_FOUND)
+        if upload.is_expired:
+            # the chunks are removed with the record
+            upload.delete()
+            return None, Response(
+                {"error": f"Upload {upload_id} has expired."},
+                status=status.HTTP_404_NOT_FOUND)
+        if upload.status != ChunkedUpload.PENDING:
+            return None, Response(
+                {"error": f"Upload {upload_id} is already "
+                          f"{upload.status}."},
+                status=status.HTTP_400_BAD_REQUEST)
+        return upload, None
+
+    @staticmethod
+    def chunked_upload_progress(upload) -> dict:
+        """Summarize the byte ranges of an upload which have been received.
+        Ranges are half open, ie [start, end).
+
+        :param upload: a ChunkedUpload
+        :type upload: ChunkedUpload
+        :return: a dictionary with `received` and `missing` byte ranges
+        :rtype: dict
+        """
+        received = []
+        for offset, size, _ in upload.chunks():
+            end = offset + size
+            if received and offset <= received[-1][1]:
+                received[-1][1] = max(received[-1][1], end)
+            else:
+                received.append([offset, end])
+        missing = []
+        position = 0
+        for start, end in received:
+            if start > position:
+                missing.append([position, start])
+            position = max(position, end)
+        if position < upload.size:
+            missing.append([position, upload.size])
+
+        return {'upload_id': str(upload.upload_id),
+                'filename': upload.filename,
+                'size': upload.size,
+                'received': received,
+                'missing': missing}
+
+    @action(detail=False, methods=['post'], url_path='chunked-upload',
+            url_name='chunked-upload')
+    def chunked_upload_init(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return Response(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED)
+
+        key_check_diff = {'filename', 'size'} - set(request.data.keys())
+        if key_check_diff:
+            return Response({'error': 'Missing required field(s): {}'
+                             .format(', '.join(sorted(key_check_diff)))},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data['size'])
+            if size < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be a positive integer.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        upload = ChunkedUpload.objects.create(
+            filename=request.data['filename'],
+            size=size,
+            sha256=str(request.data.get('sha256', '')).lower(),
+            uploader=request.user,
+            modifiedBy=request.user)
+
+        return Response(
+            {**self.chunked_upload_progress(upload),
+             'max_chunk_size': settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE,
+             'targets': list(self.get_chunked_upload_targets())},
+            status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'put'],
+            url_path=f'chunked-upload/{UPLOAD_ID_PATTERN}',
+            url_name='chunked-upload-chunk')
+    def chunked_upload_chunk(self, request, upload_id, *args, **kwargs):
+        upload, error_response = self.get_chunked_upload(request, upload_id)
+        if error_response:
+            return error_response
+
+        if request.method == 'GET':
+            return Response(self.chunked_upload_progress(upload))
+
+        try:
+            offset = int(request.query_params.get('offset'))
+            if offset < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'error': 'offset must be a non-negative '
+                                      'integer.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # read the raw body rather than request.data so that the chunk is
+        # not run through a parser
+        max_chunk_size = settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+        content = request.stream.read(max_chunk_size + 1) \
+            if request.stream else b''
+        if not content:
+            return Response({'error': 'Empty chunk.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(content) > max_chunk_size:
+            return Response({'error': f'Chunks may be at most '
+                                      f'{max_chunk_size} bytes.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if offset + len(content) > upload.size:
+            return Response({'error': f'Chunk at offset {offset} of '
+                                      f'{len(content)} bytes extends past '
+                                      f'the file size {upload.size}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # a re-sent chunk is saved as a new version, which replaces the
+        # previous one, see ChunkedUpload
+        chunk_path = default_storage.save(upload.chunk_path(offset),
+                                          ContentFile(content))
+        upload.remove_older_chunks(offset, chunk_path)
+        # the upload does not expire while it receives chunks
+        ChunkedUpload.objects.filter(pk=upload.pk)\
+            .update(modified=timezone.now())
+
+        return Response(self.chunked_upload_progress(upload))
+
+    @action(detail=False, methods=['post'],
+            url_path=f'chunked-upload/{UPLOAD_ID_PATTERN}/finalize',
+            url_name='chunked-upload-finalize')
+    def chunked_upload_finalize(self, request, upload_id, *args, **kwargs):
+        upload, error_response = self.get_chunked_upload(request, upload_id)
+        if error_response:
+            return error_response
+
+        targets = self.get_chunked_upload_targets()
+        target = request.data.get('target') or next(iter(targets), None)
+        if target not in targets:
+            return Response({'error': f'target must be one of '
+                                      f'{list(targets)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        handler_name, file_field = targets[target]
+
+        progress = self.chunked_upload_progress(upload)
+        if progress['missing']:
+            return Response({'error': 'The upload is incomplete.',
+                             **progress},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        expected_sha256 = str(request.data.get('sha256', '')).lower() \
+            or upload.sha256
+        if not expected_sha256:
+            return Response({'error': 'sha256 is required, at '
+                                      'initialization or at finalize.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # assemble the chunks into a temporary file, which is what django
+        # would have handed the target endpoint for a large multipart upload
+        assembled = TemporaryUploadedFile(upload.filename,
+                                          'application/octet-stream',
+                                          upload.size,
+                                          None)
+        sha256 = hashlib.sha256()
+        position = 0
+        for offset, size, chunk_path in upload.chunks():
+            # overlapping re-sent chunks are trimmed to the bytes not yet
+            # written
+            if offset + size <= position:
+                continue
+            with default_storage.open(chunk_path, 'rb') as f:
+                f.seek(position - offset)
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    assembled.write(block)
+                    sha256.update(block)
+            position = offset + size
+        assembled.seek(0)
+
+        if sha256.hexdigest() != expected_sha256:
+            assembled.close()
+            return Response({'error': f'Checksum mismatch: expected '
+                                      f'{expected_sha256}, assembled file '
+                                      f'has {sha256.hexdigest()}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # hand the assembled file to the target as though it were uploaded
+        # in a single multipart request
+        data = QueryDict(mutable=True)
+        for key, value in request.data.items():
+            if key not in {'target', 'sha256'}:
+                data[key] = value
+        data[file_field] = assembled
+        request._full_data = data  # pylint: disable=protected-access
+        request._files = MultiValueDict(  # pylint: disable=protected-access
+            {file_field: [assembled]})
+
+        try:
+            response = getattr(self, handler_name)(request, *args, **kwargs)
+        finally:
+            assembled.close()
+
+        if response.status_code < 400:
+            upload.status = ChunkedUpload.COMPLETE
+            upload.sha256 = sha256.hexdigest()
+            upload.modifiedBy = request.user
+            upload.save()
+            upload.delete_chunks()
+        else:
+            logger.debug('chunked upload %s finalize to %s failed: %s',
+                         upload_id, target, response.data)
+
+        return response
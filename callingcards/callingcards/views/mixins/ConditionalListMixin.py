@@ -0,0 +1,94 @@
+"""
+ConditionalListMixin
+~~~~~~~~~~~~~~~~~~~~
+
+This module contains the ConditionalListMixin, which adds `ETag` and
+`Last-Modified` headers to the list endpoint of a viewset, including exports
+(see :class:`~callingcards.views.mixins.ExportMixin.ExportMixin`), and
+answers `If-None-Match` and `If-Modified-Since` with `304 Not Modified`.
+
+The validators are calculated from the
+:class:`~callingcards.models.TableVersion` stamps of the tables which the
+filtered queryset reads, and not from the records, so a 304 costs one small
+query. This is intended for the reference tables, eg `Gene` and `ChrMap`,
+which rarely change but are downloaded on every run of an analysis.
+
+Example usage:
+
+.. code-block:: python
+
+    class GeneViewSet(ConditionalListMixin,
+                      ExportMixin,
+                      viewsets.ModelViewSet):
+        queryset = Gene.objects.all()
+        serializer_class = GeneSerializer
+
+.. code-block:: bash
+
+    curl -i "https://<host>/api/v1/genes?export=tsv" -o genes.tsv.gz
+    # ETag: "2f6c..."
+    curl -i -H 'If-None-Match: "2f6c..."' \\
+         "https://<host>/api/v1/genes?export=tsv"
+    # HTTP/1.1 304 Not Modified
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from ...models import TableVersion
+from ...utils.cached_count import query_tables
+
+
+class ConditionalListMixin:
+    """
+    Add strong `ETag` and `Last-Modified` validators to the list endpoint
+    and answer conditional requests from them.
+    """
+
+    def get_list_validators(self, request, queryset):
+        """
+        :param request: the request
+        :type request: rest_framework.request.Request
+        :param queryset: the filtered queryset of the list endpoint
+        :type queryset: django.db.models.QuerySet
+        :return: a tuple of (etag, last_modified). last_modified is a unix
+            timestamp, or None if the tables have not been changed since
+            they were first stamped
+        :rtype: tuple
+        """
+        stamps = TableVersion.objects.stamps(query_tables(queryset))
+        renderer = getattr(request, 'accepted_renderer', None)
+        key_material = json.dumps(
+            [request.path,
+             sorted(request.query_params.lists()),
+             getattr(renderer, 'media_type', None),
+             [(table, version) for table, (version, _) in stamps.items()]],
+            sort_keys=True)
+        etag = f'"{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}"'
+
+        modified = [x for _, x in stamps.values() if x is not None]
+        last_modified = int(max(modified).timestamp()) if modified else None
+        return etag, last_modified
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, last_modified = self.get_list_validators(request, queryset)
+
+        # a 304 Not Modified (or 412 Precondition Failed), or None
+        response = get_conditional_response(
+            request._request,  # pylint: disable=protected-access
+            etag=etag,
+            last_modified=last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # clients may store the response, but must revalidate it
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -1,17 +1,54 @@
+from django.conf import settings
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from ...utils.cached_count import cached_count, estimate_count
+
+
 class CountModelMixin(object):
     """
     Count a mocel viewset queryset.
     Cite: https://stackoverflow.com/a/49709157/9708266
+
+    Counts are cached until a table which the queryset reads is changed, see
+    :func:`~callingcards.utils.cached_count.cached_count`. With
+    `?approximate=true`, large tables are counted from the PostgreSQL
+    planner statistics rather than with `COUNT(*)`.
     """
+    approximate_query_param = 'approximate'
+
+    def count_is_approximate(self):
+        """
+        :return: whether the request asks for an approximate count
+        :rtype: bool
+        """
+        return self.request.query_params\
+            .get(self.approximate_query_param, '').lower() in ('true', '1')
 
     def get_count(self, queryset):
-        return queryset.count()
+        if self.count_is_approximate():
+            estimate = estimate_count(queryset)
+            # small tables are counted exactly -- it is cheap, and the
+            # estimate of a small table is often far off
+            if estimate is not None and \
+                    estimate >= settings.APPROXIMATE_COUNT_THRESHOLD:
+                self.approximated = True
+                return estimate
+        self.approximated = False
+        return cached_count(queryset)
+
+    def count_response(self, queryset):
+        """
+        :return: a response with the count of the queryset, and whether the
+            count is an estimate if an approximate count was requested
+        :rtype: Response
+        """
+        content = {'count': self.get_count(queryset)}
+        if self.count_is_approximate():
+            content['approximate'] = self.approximated
+        return Response(content)
 
     @action(detail=False, methods=['get'])
     def count(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        content = {'count': queryset.count()}
-        return Response(content)
+        return self.count_response(queryset)
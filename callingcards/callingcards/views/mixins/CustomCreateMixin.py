@@ -10,6 +10,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from callingcards.callingcards.tasks import (process_upload,
                                              upload_csv_postgres_task)
+from ...models.TableVersion import notify_bulk_load
 
 logger = logging.getLogger(__name__)
 
@@ -173,6 +174,8 @@ class CustomCreateMixin:
         try:
             objs = [self.queryset.model(**row_dict) for row_dict in rows]
             self.queryset.model.objects.bulk_create(objs)
+            # bulk_create does not send signals
+            notify_bulk_load(self.queryset.model, objs)
         except (DatabaseError, ValueError) as err:
             # Extract the relevant information from the error
             error_message = str(err)
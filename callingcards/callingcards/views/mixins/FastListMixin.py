@@ -0,0 +1,142 @@
+"""
+FastListMixin
+~~~~~~~~~~~~~
+
+This module contains the FastListMixin, which serves the list endpoint of a
+viewset from a `.values()` projection of the queryset rather than from model
+instances and a ModelSerializer.
+
+The projection is derived from the viewset's serializer, so the JSON has the
+same keys and values as before:
+
+- a field with a dotted source, eg
+  `ReadOnlyField(source='uploader.username')`, is selected as
+  `uploader__username`, so the user is joined in the same query rather than
+  being looked up once per row
+- a foreign key is selected as its primary key
+- dates, datetimes, decimals, UUIDs and choices are formatted with the
+  serializer field's `to_representation`, so they respect the REST_FRAMEWORK
+  settings. Every other value is passed through
+
+If the serializer has a field which cannot be projected, eg a
+`SerializerMethodField`, a `FileField` or a nested serializer, or the queryset
+is already a `.values()` queryset, the list endpoint is served as usual.
+
+Example usage:
+
+.. code-block:: python
+
+    class BackgroundViewSet(FastListMixin,
+                            viewsets.ModelViewSet):
+        queryset = Background.objects.all()
+        serializer_class = BackgroundSerializer
+"""
+import logging
+
+from django.db.models.query import ModelIterable
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# fields whose value is the value selected from the database
+PASSTHROUGH_FIELDS = (serializers.ReadOnlyField,
+                      serializers.IntegerField,
+                      serializers.FloatField,
+                      serializers.BooleanField)
+
+# fields whose value is formatted with the field's to_representation
+FORMATTED_FIELDS = (serializers.DateTimeField,
+                    serializers.DateField,
+                    serializers.DecimalField,
+                    serializers.UUIDField,
+                    serializers.ChoiceField)
+
+
+def _as_str(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def values_projection(serializer):
+    """Get the `.values()` projection which reproduces the serializer's
+    representation.
+
+    :param serializer: a serializer instance
+    :type serializer: rest_framework.serializers.Serializer
+    :return: a list of (key, lookup, converter) tuples, where converter is
+        None for values which are passed through, or None if a field cannot
+        be projected
+    :rtype: list or None
+    """
+    projection = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or \
+                isinstance(field, serializers.FileField):
+            return None
+        # MultipleChoiceField is a ChoiceField, so is excluded first
+        if isinstance(field, serializers.MultipleChoiceField):
+            return None
+        lookup = field.source.replace('.', '__')
+        if isinstance(field, FORMATTED_FIELDS):
+            converter = field.to_representation
+        elif isinstance(field, PrimaryKeyRelatedField) and \
+                field.pk_field is None:
+            converter = None
+        elif isinstance(field, (serializers.CharField,
+                                serializers.SlugField,
+                                serializers.EmailField,
+                                serializers.URLField)):
+            converter = _as_str
+        elif isinstance(field, PASSTHROUGH_FIELDS):
+            converter = None
+        else:
+            return None
+        projection.append((name, lookup, converter))
+    return projection
+
+
+class FastListMixin:
+    """
+    Serve the list endpoint from a `.values()` projection of the queryset.
+    """
+    fast_list = True
+
+    def get_values_projection(self):
+        """
+        :return: the projection of the viewset's serializer, or None
+        :rtype: list or None
+        """
+        if not self.fast_list:
+            return None
+        return values_projection(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        projection = self.get_values_projection()
+        queryset = self.filter_queryset(self.get_queryset())
+        # a values() queryset is already projected
+        if projection is None or \
+                queryset._iterable_class is not ModelIterable:  # pylint: disable=protected-access # noqa
+            return super().list(request, *args, **kwargs)
+
+        queryset = queryset.values(
+            *dict.fromkeys(lookup for _, lookup, _ in projection))
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+
+        data = []
+        for row in rows:
+            record = {}
+            for name, lookup, converter in projection:
+                value = row[lookup]
+                if converter is not None and value is not None:
+                    value = converter(value)
+                record[name] = value
+            data.append(record)
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,64 @@
+"""
+FileDownloadMixin
+~~~~~~~~~~~~~~~~~
+
+This module contains the FileDownloadMixin, which adds a `download` detail
+action to a viewset whose model has a file field. The record is looked up
+with `get_object()`, so the permissions and the filters of the viewset apply,
+and the file is then served by
+:func:`~callingcards.utils.file_serving.serve_file`: by the front end server,
+from a pre-signed S3 url, or by Django with `Range` support, depending on
+`FILE_SERVING_BACKEND`.
+
+Example usage:
+
+.. code-block:: python
+
+    class Hops_s3ViewSet(FileDownloadMixin,
+                         viewsets.ModelViewSet):
+        queryset = Hops_s3.objects.all()
+        download_file_field = 'qbed'
+
+.. code-block:: bash
+
+    curl -H "Authorization: Token <token>" -L -O -J \\
+         -H "Range: bytes=0-1048575" \\
+         "https://<host>/api/v1/hops_s3/1/download/"
+
+.. author:: Chase Mateusiak
+.. date:: 2023-07-24
+"""
+from django.http import Http404
+from rest_framework.decorators import action
+
+from ...utils.file_serving import serve_file
+
+
+class FileDownloadMixin:
+    """
+    Serve the file of a record at `<basename>/<pk>/download/`.
+    """
+    # the name of the file field which is served
+    download_file_field = 'file'
+    # the name of a field with the sha256 of the file, which is the ETag of
+    # the download, see ContentAddressedFileMixin
+    download_checksum_field = 'sha256'
+
+    def get_download_etag(self, instance):
+        """
+        :return: the quoted ETag of the file of the record, or None
+        :rtype: str or None
+        """
+        checksum = getattr(instance, self.download_checksum_field, None)
+        return f'"{checksum}"' if checksum else None
+
+    @action(detail=True, methods=['get'], url_path='download',
+            url_name='download')
+    def download(self, request, *args, **kwargs):
+        instance = self.get_object()
+        field_file = getattr(instance, self.download_file_field)
+        if not field_file:
+            raise Http404(f'{self.basename} {instance.pk} has no file')
+        return serve_file(request._request,  # pylint: disable=protected-access # noqa
+                          field_file.storage, field_file.name,
+                          etag=self.get_download_etag(instance))
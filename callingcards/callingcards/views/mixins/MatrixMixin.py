@@ -0,0 +1,157 @@
+"""
+MatrixMixin
+~~~~~~~~~~~
+
+This module contains the MatrixMixin, which adds a `matrix` endpoint to the
+viewset of a TF x target table, eg HarbisonChIP or McIsaacZEV. Rather than one
+JSON object per (TF, target) pair, the endpoint returns a `.npz` file of dense
+arrays with one row per TF and one column per target. See
+:mod:`~callingcards.utils.matrix` for the arrays.
+
+The matrix of the whole table is built once per
+:class:`~callingcards.models.TableVersion` of the table and of the gene table,
+and is stored in the response cache. Requests are sliced from it:
+
+.. code-block:: bash
+
+    # all TFs and targets
+    curl -o harbison.npz "https://<host>/api/v1/harbisonchip/matrix"
+    # some TFs, by locus tag, gene name or id, and the effect only
+    curl -o mcisaac.npz \\
+         "https://<host>/api/v1/mcisaaczev/matrix?tfs=YJL056C,GAL4&values=effect"
+
+.. code-block:: python
+
+    import numpy as np
+    matrix = np.load('harbison.npz')
+    matrix['pval'][list(matrix['row_gene']).index('GAL4')]
+
+The `tfs` and `targets` params are comma separated, and may be repeated. The
+filters of the list endpoint are not applied.
+
+Example usage:
+
+.. code-block:: python
+
+    class HarbisonChIPViewSet(MatrixMixin,
+                              viewsets.ModelViewSet):
+        queryset = HarbisonChIP.objects.all()
+        matrix_values = ['pval']
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from ...models import Gene, TableVersion
+from ...utils.matrix import (build_matrix, slice_matrix, matrix_to_npz,
+                             npz_to_matrix)
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixMixin:
+    """
+    Add a `matrix` endpoint which returns the table as dense TF x target
+    arrays in a `.npz` file.
+    """
+    # the foreign keys to Gene of the rows and the columns
+    matrix_row_field = 'tf'
+    matrix_col_field = 'gene'
+    # the fields of the value arrays, set on the viewset
+    matrix_values = []
+
+    def get_matrix_queryset(self):
+        """
+        :return: the records of the matrix
+        :rtype: django.db.models.QuerySet
+        """
+        return self.get_queryset().model.objects.all()
+
+    def _split_list_param(self, request, param):
+        values = [x.strip() for value in request.query_params.getlist(param)
+                  for x in value.split(',') if x.strip()]
+        return values or None
+
+    def get_matrix_key(self):
+        """
+        :return: the cache key of the matrix of the whole table, which
+            identifies its version, from the versions of the table and of the
+            gene table
+        :rtype: str
+        """
+        stamps = TableVersion.objects.stamps(
+            [self.get_matrix_queryset().model._meta.db_table,
+             Gene._meta.db_table])
+        key_material = json.dumps(
+            [self.matrix_row_field, self.matrix_col_field,
+             list(self.matrix_values), stamps],
+            default=str, sort_keys=True)
+        return (f'matrix:{self.basename}:'
+                f'{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}')
+
+    def get_matrix(self, key):
+        """Get the matrix of the whole table from the cache, or build it.
+
+        :param key: the cache key of the matrix, see :meth:`get_matrix_key`
+        :type key: str
+        :return: the matrix
+        :rtype: dict
+        """
+        cache = caches[settings.RESPONSE_CACHE_ALIAS]
+        content = cache.get(key)
+        if content is not None:
+            return npz_to_matrix(content)
+
+        matrix = build_matrix(self.get_matrix_queryset(),
+                              self.matrix_row_field, self.matrix_col_field,
+                              self.matrix_values)
+        # uncompressed, since the cached matrix is read on every request
+        cache.set(key, matrix_to_npz(matrix, compressed=False),
+                  settings.RESPONSE_CACHE_TIMEOUT)
+        return matrix
+
+    @action(detail=False, methods=['get'], url_path='matrix',
+            url_name='matrix')
+    def matrix(self, request, *args, **kwargs):
+        values = self._split_list_param(request, 'values')
+        unknown = [x for x in values or [] if x not in self.matrix_values]
+        if unknown:
+            return Response({'error': f'unknown values {unknown}. Valid '
+                             f'values are {self.matrix_values}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the ETag is checked before the matrix is loaded, so that a 304
+        # does not read the matrix from the cache
+        key = self.get_matrix_key()
+        etag = hashlib.sha256(json.dumps(
+            [key, sorted(request.query_params.lists())]).encode('utf-8'))\
+            .hexdigest()
+        etag = f'"{etag}"'
+        response = get_conditional_response(
+            request._request,  # pylint: disable=protected-access
+            etag=etag)
+        if response is None:
+            try:
+                matrix = slice_matrix(
+                    self.get_matrix(key),
+                    rows=self._split_list_param(request, 'tfs'),
+                    cols=self._split_list_param(request, 'targets'),
+                    value_fields=values)
+            except KeyError as exc:
+                return Response({'error': f'not in the matrix: {exc.args[0]}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            response = HttpResponse(matrix_to_npz(matrix),
+                                    content_type='application/octet-stream')
+            response['Content-Disposition'] = \
+                f'attachment; filename="{self.basename}_matrix.npz"'
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
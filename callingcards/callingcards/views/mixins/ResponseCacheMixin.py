@@ -0,0 +1,147 @@
+"""
+ResponseCacheMixin
+~~~~~~~~~~~~~~~~~~
+
+This module contains the ResponseCacheMixin, which stores the rendered
+responses of the read actions of a viewset -- `list`, `retrieve` and custom
+`GET` actions such as `targets` and `with_annote` -- in the Django cache.
+
+The cache key is made of:
+
+- the path and the query params, sorted
+- the negotiated media type
+- the user, if the response is user specific (see `response_cache_per_user`)
+  or is rendered by the browsable API, and otherwise a shared scope
+- the :class:`~callingcards.models.TableVersion` stamps of the tables which
+  the response is read from. For `list` and `retrieve` these are the tables
+  of the filtered queryset. For custom actions, which build their own
+  querysets, these are the stamps of every table
+
+The stamps are bumped by the model signals and bulk loaders, so a change to a
+table drops every cached response which was read from it. Dropped entries are
+not deleted; they are never requested again, and expire after
+`settings.RESPONSE_CACHE_TIMEOUT`.
+
+Authentication, permissions and throttling run as usual before the cache is
+read. Exports (see :class:`~callingcards.views.mixins.ExportMixin.ExportMixin`)
+are streamed, and are not cached.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from ...models import TableVersion
+from ...utils.cached_count import query_tables
+
+logger = logging.getLogger(__name__)
+
+# headers which are stored with, and restored to, a cached response
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Vary', 'Allow')
+
+
+class ResponseCacheMixin:
+    """
+    Cache the rendered responses of `GET` actions, keyed by the request and
+    the versions of the tables the response is read from.
+    """
+    # set to True on viewsets whose responses depend on the user
+    response_cache_per_user = False
+    # query params which disable the cache, eg streamed exports
+    response_cache_skip_params = ('export',)
+
+    _response_cache_key = None
+
+    def get_response_cache_tables(self):
+        """
+        :return: the tables which the response is read from, or None if they
+            are not known, in which case every table is used
+        :rtype: set or None
+        """
+        if self.action in ('list', 'retrieve'):
+            return query_tables(self.filter_queryset(self.get_queryset()))
+        return None
+
+    def get_response_cache_key(self, request):
+        """
+        :return: the cache key of the response to the request, or None if
+            the response should not be cached
+        :rtype: str or None
+        """
+        if request.method != 'GET' or \
+                any(param in request.query_params
+                    for param in self.response_cache_skip_params):
+            return None
+        tables = self.get_response_cache_tables()
+        if tables is None:
+            stamps = {table: (version, modified)
+                      for table, version, modified in
+                      TableVersion.objects.order_by('table')
+                      .values_list('table', 'version', 'modified')}
+        else:
+            stamps = TableVersion.objects.stamps(tables)
+
+        media_type = request.accepted_renderer.media_type
+        if self.response_cache_per_user or 'html' in media_type:
+            scope = f'user:{request.user.pk}'
+        else:
+            scope = 'shared'
+
+        key_material = json.dumps(
+            [request.path, sorted(request.query_params.lists()),
+             media_type, scope, stamps],
+            default=str, sort_keys=True)
+        return (f'response:{self.basename}:'
+                f'{hashlib.sha256(key_material.encode("utf-8")).hexdigest()}')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._response_cache_key = self.get_response_cache_key(request)
+        if self._response_cache_key is None:
+            return
+        cached = caches[settings.RESPONSE_CACHE_ALIAS]\
+            .get(self._response_cache_key)
+        if cached is None:
+            return
+
+        def cached_response(*args, **kwargs):  # pylint: disable=unused-argument # noqa
+            last_modified = cached['headers'].get('Last-Modified')
+            response = get_conditional_response(
+                request._request,  # pylint: disable=protected-access
+                etag=cached['headers'].get('ETag'),
+                last_modified=last_modified and
+                parse_http_date_safe(last_modified))
+            if response is None:
+                response = HttpResponse(cached['content'],
+                                        content_type=cached['content_type'])
+            for header, value in cached['headers'].items():
+                response[header] = value
+            return response
+
+        # dispatch() looks up the handler after initial(), so this replaces
+        # the action for this request only
+        self._response_cache_key = None
+        setattr(self, request.method.lower(), cached_response)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        if self._response_cache_key is not None and \
+                isinstance(response, Response) and \
+                response.status_code == 200:
+            response.render()
+            caches[settings.RESPONSE_CACHE_ALIAS].set(
+                self._response_cache_key,
+                {'content': response.content,
+                 'content_type': response['Content-Type'],
+                 'headers': {header: response[header]
+                             for header in CACHED_HEADERS
+                             if header in response}},
+                settings.RESPONSE_CACHE_TIMEOUT)
+        return response
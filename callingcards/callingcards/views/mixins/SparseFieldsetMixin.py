@@ -0,0 +1,144 @@
+"""
+SparseFieldsetMixin
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the SparseFieldsetMixin, which lets a client limit the
+fields of a read request with `?fields=` or `?omit=`, each a comma separated
+list of serializer field names:
+
+.. code-block:: bash
+
+    curl "https://<host>/api/v1/background?fields=chr,start,end,strand"
+    curl "https://<host>/api/v1/harbisonchip?omit=uploader,modifiedBy"
+
+The fields are removed from the serializer, and so from the `.values()`
+projection of :class:`~callingcards.views.mixins.FastListMixin.FastListMixin`
+and from exports, and joins which only served the removed fields, eg the
+join to the user table for `uploader`, are dropped. When the list is
+served by the serializer, the queryset is limited with `.only()`, and the
+relations of kept fields, eg `uploader.username`, are joined with
+`.select_related()`. An export has the same values as the JSON, eg the
+username of the `uploader`.
+
+Write requests are not affected.
+"""
+import logging
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.query import ModelIterable
+from rest_framework.exceptions import ValidationError
+
+from ...utils.export import lookup_field
+
+logger = logging.getLogger(__name__)
+
+
+class SparseFieldsetMixin:
+    """
+    Limit the serializer fields, and the columns selected, to `?fields=`, or
+    to all but `?omit=`.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def _split_param(self, param):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        return [x.strip() for x in value.split(',') if x.strip()]
+
+    def get_sparse_fields(self, field_names):
+        """
+        :param field_names: the names of all the serializer fields
+        :type field_names: iterable
+        :return: the names of the fields to keep, in serializer order, or
+            None if the request does not limit the fields
+        :rtype: list or None
+
+        :raises ValidationError: if a field does not exist
+        """
+        if not self.is_sparse_request():
+            return None
+        fields = self._split_param(self.fields_query_param)
+        omit = self._split_param(self.omit_query_param)
+
+        field_names = list(field_names)
+        unknown = [x for x in (fields or []) + (omit or [])
+                   if x not in field_names]
+        if unknown:
+            raise ValidationError(
+                {self.fields_query_param:
+                 f'unknown field(s) {unknown}. Valid fields are '
+                 f'{field_names}'})
+        keep = set(fields) if fields is not None else set(field_names)
+        keep -= set(omit or [])
+        return [x for x in field_names if x in keep]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        # a list serializer holds the field serializer as its child
+        child = getattr(serializer, 'child', serializer)
+        keep = self.get_sparse_fields(child.fields)
+        if keep is not None:
+            for name in list(child.fields):
+                if name not in keep:
+                    child.fields.pop(name)
+        return serializer
+
+    def is_sparse_request(self):
+        """
+        :return: whether the request limits the fields
+        :rtype: bool
+        """
+        request = getattr(self, 'request', None)
+        return request is not None and \
+            request.method in ('GET', 'HEAD') and \
+            (self.fields_query_param in request.query_params or
+             self.omit_query_param in request.query_params)
+
+    def get_sparse_lookups(self, model):
+        """
+        :param model: the model of the queryset
+        :type model: django.db.models.Model
+        :return: a dict of the kept serializer field names to the lookups of
+            their sources, eg `{'uploader': 'uploader__username'}`, or None
+            if a source is not a concrete field of the model or of a related
+            model, eg a method field
+        :rtype: dict or None
+        """
+        lookups = {}
+        for name, field in self.get_serializer().fields.items():
+            lookup = field.source.replace('.', '__')
+            try:
+                model_field = lookup_field(model, lookup)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.many_to_many:
+                return None
+            lookups[name] = lookup
+        return lookups
+
+    def get_export_fields(self):
+        if not self.is_sparse_request():
+            return super().get_export_fields()
+        # the columns have the values of the serializer fields
+        lookups = self.get_sparse_lookups(self.get_queryset().model)
+        if lookups is None:
+            return list(self.get_serializer().fields)
+        return lookups
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.is_sparse_request() or \
+                not issubclass(queryset._iterable_class, ModelIterable):  # pylint: disable=protected-access # noqa
+            return queryset
+        # limit the columns to those of the kept fields, if they are all
+        # columns of the model or of related models, which are joined
+        lookups = self.get_sparse_lookups(queryset.model)
+        if lookups is None:
+            return queryset
+        related = {lookup.rsplit('__', 1)[0] for lookup in lookups.values()
+                   if '__' in lookup}
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        return queryset.only(*lookups.values())
@@ -22,9 +22,30 @@ Example usage:
 This will ensure that the `modifiedBy` field is updated with the current user
 and the `modified` field is updated with the current date and time whenever an update
 operation is performed on a YourModel instance.
+
+The mixin also adds a bulk partial update. A `PATCH` to the list endpoint with
+a list of records, each with the `id` of the record to update and the fields
+to change, validates every record, and then writes them with a single
+`bulk_update` in a transaction:
+
+.. code-block:: bash
+
+    curl -X PATCH -H "Content-Type: application/json" \\
+         -d '[{"id": 1, "note": "ok"}, {"id": 2, "note": "bad"}]' \\
+         "https://<host>/api/v1/qcmanualreview"
+
+Nothing is written if any record is invalid. The response is the records
+which were changed. Note that `bulk_update` does not call the model's
+`save()` or send signals; the tables are instead marked as bulk loaded with
+:func:`~callingcards.models.TableVersion.notify_bulk_load`.
 """
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils import timezone
-from rest_framework import mixins
+from rest_framework import mixins, status
+from rest_framework.response import Response
+
+from ...models.TableVersion import notify_bulk_load
 
 
 class UpdateModifiedMixin(mixins.UpdateModelMixin):    
@@ -48,6 +69,139 @@ class UpdateModifiedMixin(mixins.UpdateModelMixin):
             serializer_class = YourModelSerializer
     """
 
+    bulk_update_id_field = 'id'
+    bulk_update_lookup = 'pk'
+    bulk_update_max_records = 5000
+    bulk_update_batch_size = 500
+
+    def get_bulk_update_queryset(self):
+        """
+        :return: the queryset of the records which may be bulk updated
+        :rtype: django.db.models.QuerySet
+        """
+        return self.get_queryset()
+
+    def get_bulk_update_serializer(self, *args, **kwargs):
+        """
+        :return: the serializer which validates a record of a bulk update
+        :rtype: rest_framework.serializers.Serializer
+        """
+        return self.get_serializer(*args, **kwargs)
+
+    def get_bulk_update_response(self, instances):
+        """
+        :param instances: the updated records
+        :type instances: list
+        :return: the response to a bulk update
+        :rtype: rest_framework.response.Response
+        """
+        serializer = self.get_bulk_update_serializer(instances, many=True)
+        return Response(serializer.data)
+
+    def bulk_partial_update(self, request, *args, **kwargs):  # pylint: disable=unused-argument # noqa
+        """Update a list of records, each a dict with `bulk_update_id_field`
+        and the fields to change. The router maps `PATCH` on the list
+        endpoint to this action."""
+        data = request.data
+        if not isinstance(data, list) or \
+                not all(isinstance(x, dict) for x in data):
+            return Response({'error': 'Expected a list of records'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > self.bulk_update_max_records:
+            return Response({'error': f'At most '
+                             f'{self.bulk_update_max_records} records may '
+                             f'be updated in one request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [x[self.bulk_update_id_field] for x in data]
+        except KeyError:
+            return Response({'error': f'Every record requires '
+                             f'`{self.bulk_update_id_field}`'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_bulk_update_queryset()
+        # the ids are converted by the lookup's field before they are queried,
+        # so that an invalid id, eg a string or a dict for an integer key, is
+        # a 400 rather than an error of the database
+        lookup_field = queryset.model._meta.pk \
+            if self.bulk_update_lookup == 'pk' \
+            else queryset.model._meta.get_field(self.bulk_update_lookup)
+        try:
+            if any(isinstance(x, (dict, list, bool)) or x is None
+                   for x in ids):
+                raise ValidationError('invalid id')
+            ids = [lookup_field.to_python(x) for x in ids]
+        except ValidationError:
+            return Response({'error': f'Invalid '
+                             f'`{self.bulk_update_id_field}`'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(set(ids)) != len(ids):
+            return Response({'error': f'Duplicate '
+                             f'`{self.bulk_update_id_field}`'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        instances = {getattr(x, self.bulk_update_lookup): x
+                     for x in queryset.filter(
+                         **{f'{self.bulk_update_lookup}__in': ids})}
+        missing = [x for x in ids if x not in instances]
+        if missing:
+            return Response({'error': 'Records not found',
+                             self.bulk_update_id_field: missing},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        # validate every record before anything is written
+        serializers = []
+        errors = []
+        for record_id, record in zip(ids, data):
+            instance = instances[record_id]
+            self.check_object_permissions(request, instance)
+            update_data = {k: v for k, v in record.items()
+                           if k != self.bulk_update_id_field}
+            serializer = self.get_bulk_update_serializer(
+                instance, data=update_data, partial=True)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+            serializers.append(serializer)
+        if any(errors):
+            return Response({'error': 'Invalid data',
+                             'errors': errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        model = queryset.model
+        changed = []
+        changed_fields = set()
+        for serializer in serializers:
+            instance = serializer.instance
+            instance_changed = False
+            for name, value in serializer.validated_data.items():
+                # nested values, eg from a dotted source, are not written,
+                # as in ModelSerializer.update()
+                if isinstance(value, dict):
+                    continue
+                field = model._meta.get_field(name)
+                if field.many_to_many:
+                    continue
+                before = getattr(instance, field.attname)
+                setattr(instance, name, value)
+                if getattr(instance, field.attname) != before:
+                    changed_fields.add(name)
+                    instance_changed = True
+            if instance_changed:
+                changed.append(instance)
+
+        if changed:
+            now = timezone.now()
+            for instance in changed:
+                instance.modifiedBy = request.user
+                instance.modified = now
+            with transaction.atomic():
+                model.objects.bulk_update(
+                    changed,
+                    [*changed_fields, 'modifiedBy', 'modified'],
+                    batch_size=self.bulk_update_batch_size)
+            notify_bulk_load(model, changed)
+
+        return self.get_bulk_update_response(changed)
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.modifiedBy = self.request.user
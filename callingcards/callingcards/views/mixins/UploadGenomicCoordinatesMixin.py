@@ -0,0 +1,84 @@
+"""
+UploadGenomicCoordinatesMixin
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the UploadGenomicCoordinatesMixin, which adds an
+`upload-bed` action to viewsets of models which inherit
+GenonomicCoordinatesMixin, eg Background, Hops and PromoterRegions.
+
+Example usage:
+
+.. code-block:: python
+
+    class BackgroundViewSet(UploadGenomicCoordinatesMixin,
+                            viewsets.ModelViewSet):
+        queryset = Background.objects.all()
+        serializer_class = BackgroundSerializer
+
+A client may then upload a tab delimited, optionally gzipped, BED-like file
+with a header and any fields which apply to every row, eg:
+
+.. code-block:: bash
+
+    curl -H "Authorization: Token <token>" \\
+         -F bed_file=@adh1_background.qbed.gz \\
+         -F chr_format=mitra \\
+         -F source=adh1 \\
+         https://<host>/api/v1/background/upload-bed
+"""
+import logging
+
+from django.db import DatabaseError
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from ...utils.load_genomic_coordinates import load_genomic_coordinates
+
+logger = logging.getLogger(__name__)
+
+
+class UploadGenomicCoordinatesMixin:
+    """
+    Add an `upload-bed` action which loads a BED-like file into the
+    viewset's model with
+    :func:`~callingcards.utils.load_genomic_coordinates.load_genomic_coordinates`.
+
+    Required form fields are `bed_file` and `chr_format`. All other form
+    fields are applied to every row.
+    """
+
+    @action(detail=False, methods=['post'], url_path='upload-bed')
+    def upload_bed(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return Response(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED)
+
+        bed_file = request.FILES.get('bed_file')
+        if not bed_file:
+            return Response({"error": "No bed_file provided."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        chr_format = request.data.get('chr_format')
+        if not chr_format:
+            return Response({"error": "No chr_format provided."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        extra_fields = {key: value for key, value in request.data.items()
+                        if key not in {'bed_file', 'chr_format'}}
+
+        try:
+            row_count = load_genomic_coordinates(self.queryset.model,
+                                                 bed_file,
+                                                 chr_format,
+                                                 request.user,
+                                                 **extra_fields)
+        except (ValueError, DatabaseError) as exc:
+            logger.debug('upload-bed failed: %s', exc)
+            return Response({"error": str(exc)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"status": f"{row_count} records uploaded "
+                                   "successfully."},
+                        status=status.HTTP_201_CREATED)
@@ -3,4 +3,13 @@ from .CustomCreateMixin import CustomCreateMixin
 from .ListModelFieldsMixin import ListModelFieldsMixin
 from .PageSizeModelMixin import PageSizeModelMixin
 from .UpdateModifiedMixin import UpdateModifiedMixin
-from .CustomValidateMixin import CustomValidateMixin
\ No newline at end of file
+from .CustomValidateMixin import CustomValidateMixin
+from .UploadGenomicCoordinatesMixin import UploadGenomicCoordinatesMixin
+from .ChunkedUploadMixin import ChunkedUploadMixin
+from .ExportMixin import ExportMixin
+from .ConditionalListMixin import ConditionalListMixin
+from .ResponseCacheMixin import ResponseCacheMixin
+from .FastListMixin import FastListMixin
+from .SparseFieldsetMixin import SparseFieldsetMixin
+from .MatrixMixin import MatrixMixin
+from .FileDownloadMixin import FileDownloadMixin
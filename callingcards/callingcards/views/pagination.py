@@ -0,0 +1,203 @@
+"""
+.. module:: pagination
+   :synopsis: Limit/offset pagination with an optional keyset (cursor) mode
+
+By default, list endpoints are paginated with limit/offset, as before. For
+large tables, eg `/background` or `/hops`, a request may instead ask for
+keyset pagination with `?pagination=cursor`. Each page is then selected with
+a range condition on the ordering key, eg `WHERE (chr_id, start, id) >
+(1, 1000, 52)`, rather than with `OFFSET`, and the total count is not
+calculated. The cost of a page is therefore the same at the end of a table as
+at the start.
+
+Orderings:
+
+- `id` (default): order by the primary key
+- `genomic`: order by `(chr, start, id)`, for models with genomic coordinates
+
+Example usage:
+
+.. code-block:: bash
+
+    # the first page
+    curl "https://<host>/api/v1/background?pagination=cursor&cursor_ordering=genomic&limit=5000"
+    # the response has `next` and `previous` urls which include an opaque
+    # `cursor`. Follow `next` until it is null
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination, unless the request has `?pagination=cursor` or a
+    `cursor`, in which case the queryset is paged by keyset on one of
+    `orderings`. The cursor encodes the ordering, the direction and the key
+    of the last (or first) record on the current page.
+    """
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'cursor_ordering'
+
+    # ordering name -> model fields. `pk` is replaced by the primary key
+    orderings = {'id': ('pk',),
+                 'genomic': ('chr', 'start', 'pk')}
+    default_ordering = 'id'
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params or \
+            request.query_params.get(self.mode_query_param) == 'cursor'
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            self.limit = self.default_limit
+
+        ordering, reverse, position = self.decode_cursor(request)
+        fields = self.get_ordering_fields(queryset.model, ordering)
+        self.ordering = ordering
+
+        columns = [field.column for field in fields]
+        # a .values() queryset, eg with ?fields=, must select the key
+        selected = queryset._fields  # pylint: disable=protected-access
+        if selected:
+            missing = [field.attname for field in fields
+                       if field.attname not in selected
+                       and field.name not in selected]
+            if missing:
+                queryset = queryset.values(*selected, *missing)
+        order_by = [('-' if reverse else '') + field.attname
+                    for field in fields]
+        queryset = queryset.order_by(*order_by)
+
+        if position is not None:
+            if len(position) != len(fields):
+                raise NotFound('Invalid cursor')
+            # a row value comparison, eg (chr_id, start, id) > (%s, %s, %s),
+            # so that the database can use a composite index range scan
+            table = queryset.model._meta.db_table
+            operator = '<' if reverse else '>'
+            lhs = ', '.join(f'"{table}"."{column}"' for column in columns)
+            rhs = ', '.join(['%s'] * len(columns))
+            queryset = queryset.extra(
+                where=[f'({lhs}) {operator} ({rhs})'], params=position)
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+
+        attnames = [field.attname for field in fields]
+
+        def key(obj):
+            # a .values() row has the foreign key under the field name
+            if isinstance(obj, dict):
+                return [obj[field.attname] if field.attname in obj
+                        else obj[field.name] for field in fields]
+            return [getattr(obj, attname) for attname in attnames]
+
+        # the next page exists if there are more records in the forward
+        # direction, or if this page was reached by going backward
+        self.next_position = key(results[-1]) \
+            if results and (has_more or reverse) else None
+        self.previous_position = key(results[0]) \
+            if results and position is not None and (has_more or
+                                                     not reverse) \
+            else None
+
+        return results
+
+    def get_ordering_fields(self, model, ordering):
+        """
+        :return: the model fields of the ordering
+        :rtype: list
+
+        :raises ValidationError: if the ordering is not valid for the model
+        """
+        if ordering not in self.orderings:
+            raise ValidationError(
+                {self.ordering_query_param:
+                 f'must be one of {list(self.orderings)}'})
+        field_names = [model._meta.pk.name if name == 'pk' else name
+                       for name in self.orderings[ordering]]
+        try:
+            return [model._meta.get_field(name) for name in field_names]
+        except FieldDoesNotExist as exc:
+            raise ValidationError(
+                {self.ordering_query_param:
+                 f'{ordering} ordering is not available for this '
+                 f'endpoint'}) from exc
+
+    def decode_cursor(self, request):
+        """
+        :return: a tuple of (ordering, reverse, position). position is None
+            on the first page
+        :rtype: tuple
+
+        :raises NotFound: if the cursor cannot be decoded
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return (request.query_params.get(self.ordering_query_param,
+                                             self.default_ordering),
+                    False, None)
+        try:
+            cursor = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return cursor['o'], bool(cursor['r']), list(cursor['p'])
+        except (TypeError, ValueError, KeyError) as exc:
+            raise NotFound('Invalid cursor') from exc
+
+    def encode_cursor(self, reverse, position):
+        """
+        :return: the url of the page in the given direction from position
+        :rtype: str
+        """
+        cursor = json.dumps({'o': self.ordering,
+                             'r': int(reverse),
+                             'p': position},
+                            default=str,
+                            separators=(',', ':'))
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_query_param)
+        url = remove_query_param(url, self.mode_query_param)
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii'))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(False, self.next_position)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(True, self.previous_position)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        # no count -- it would require a scan of the whole table
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
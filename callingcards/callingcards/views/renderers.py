@@ -0,0 +1,46 @@
+"""
+.. module:: renderers
+   :synopsis: A JSON renderer which encodes with orjson
+
+`FastJSONRenderer` produces the same JSON as DRF's `JSONRenderer` -- compact,
+UTF-8, with datetimes and decimals encoded by DRF's encoder -- but encodes
+with `orjson`, which is several times faster on large pages. When the client
+asks for indented or ASCII JSON, or the data has a type which orjson cannot
+encode, the response is rendered by `JSONRenderer`.
+"""
+import logging
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Render JSON with orjson, falling back to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            # datetimes are passed to DRF's encoder so that they are
+            # formatted as they are by JSONRenderer
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (TypeError, orjson.JSONEncodeError) as exc:
+            logger.debug('orjson could not encode the response, rendering '
+                         'with JSONRenderer: %s', exc)
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # escaped by JSONRenderer, for compatibility with javascript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028')\
+            .replace(b'\xe2\x80\xa9', b'\\u2029')
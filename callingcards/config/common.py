@@ -37,11 +37,14 @@ class Common(Configuration):
 
     # https://docs.djangoproject.com/en/2.0/topics/http/middleware/
     MIDDLEWARE = (
+        # first, so that it sees the streamed content as it is sent
+        'callingcards.callingcards.async_streaming.AsyncStreamingMiddleware',
         'django.middleware.security.SecurityMiddleware',
         'django.contrib.sessions.middleware.SessionMiddleware',
         'django.middleware.common.CommonMiddleware',
         'django.middleware.csrf.CsrfViewMiddleware',
         'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'callingcards.callingcards.db_router.ReadReplicaMiddleware',
         'django.contrib.messages.middleware.MessageMiddleware',
         'django.middleware.clickjacking.XFrameOptionsMiddleware',
     )
@@ -50,6 +53,9 @@ class Common(Configuration):
     ROOT_URLCONF = 'callingcards.urls'
     SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
     WSGI_APPLICATION = 'callingcards.wsgi.application'
+    # served by an ASGI server, the async views do not hold a worker while
+    # they wait on the storage, see callingcards/asgi.py
+    ASGI_APPLICATION = 'callingcards.asgi.application'
 
     # Email
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -84,6 +90,13 @@ class Common(Configuration):
     # Media files
     MEDIA_ROOT = join(os.path.dirname(BASE_DIR), 'media')
     MEDIA_URL = '/media/'
+    # largest chunk accepted by the chunked-upload endpoints, in bytes
+    CHUNKED_UPLOAD_MAX_CHUNK_SIZE = int(
+        os.getenv('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 1024 * 1024 * 64))
+    # a pending chunked upload which has not received a chunk for this many
+    # seconds is expired, and its chunks removed, see expire_chunked_uploads
+    CHUNKED_UPLOAD_EXPIRE_SECONDS = int(
+        os.getenv('CHUNKED_UPLOAD_EXPIRE_SECONDS', 60 * 60 * 24))
 
     TEMPLATES = [
         {
@@ -122,6 +135,63 @@ class Common(Configuration):
         },
     ]
 
+    # Cache
+    # local memory by default, which is per process. Set DJANGO_REDIS_URL, eg
+    # redis://localhost:6379/1, to share the cache between processes
+    if os.getenv('DJANGO_REDIS_URL'):
+        CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': os.getenv('DJANGO_REDIS_URL'),
+            }
+        }
+    else:
+        CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }
+        }
+    # cached responses are keyed by table versions, see ResponseCacheMixin
+    RESPONSE_CACHE_ALIAS = 'default'
+    RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 60))
+
+    # Counts
+    # cached counts, and other aggregates such as the longest feature of a
+    # table for the region filter, are keyed by the versions of the tables
+    # they are calculated from, so the timeout only limits the lifetime of
+    # old entries
+    COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 60 * 60 * 24))
+    # with ?approximate=true, an estimate below this is replaced by an exact
+    # count, which is cheap at that size
+    APPROXIMATE_COUNT_THRESHOLD = int(
+        os.getenv('APPROXIMATE_COUNT_THRESHOLD', 100000))
+
+    # Batch requests, see BatchViewSet
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 50))
+    # the sub requests of a batch are run on this many threads, each of
+    # which opens its own database connection
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 8))
+
+    # Read replica, see db_router. If DATABASES has this alias, the reads of
+    # GET requests are sent to it. The pins below are kept in the cache, so
+    # the Production configuration requires DJANGO_REDIS_URL with a replica
+    DATABASE_ROUTERS = ['callingcards.callingcards.db_router.ReadReplicaRouter']
+    READ_REPLICA_ALIAS = 'replica'
+    # after a client writes, its reads are sent to the primary for this many
+    # seconds, which should exceed the replication lag
+    READ_REPLICA_PIN_SECONDS = int(os.getenv('READ_REPLICA_PIN_SECONDS', 5))
+
+    # File serving, see utils/file_serving. `django` sends the files from
+    # Django, `x-accel-redirect` (nginx) and `x-sendfile` (apache, lighttpd)
+    # hand them to the front end server, and `presigned` redirects to a
+    # pre-signed url of the S3 storage
+    FILE_SERVING_BACKEND = os.getenv('FILE_SERVING_BACKEND', 'django')
+    # the internal location of MEDIA_ROOT in nginx, for x-accel-redirect
+    FILE_SERVING_ACCEL_PREFIX = os.getenv('FILE_SERVING_ACCEL_PREFIX',
+                                          '/protected-media/')
+    # the number of seconds for which a pre-signed url is valid
+    FILE_SERVING_URL_EXPIRE = int(os.getenv('FILE_SERVING_URL_EXPIRE', 3600))
+
     # Celery
     CELERY_BROKER_URL = 'redis://localhost:6379'
     CELERY_RESULT_BACKEND = 'redis://localhost:6379'
@@ -219,11 +289,12 @@ class Common(Configuration):
     # Django Rest Framework
     REST_FRAMEWORK = {
         'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-        'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+        # limit/offset by default. ?pagination=cursor for keyset pagination
+        'DEFAULT_PAGINATION_CLASS': 'callingcards.callingcards.views.pagination.KeysetPagination',
         'PAGE_SIZE': int(os.getenv('DJANGO_PAGINATION_LIMIT', '1000')),
         'DATETIME_FORMAT': '%Y-%m-%dT%H:%M:%S%z',
         'DEFAULT_RENDERER_CLASSES': (
-            'rest_framework.renderers.JSONRenderer',
+            'callingcards.callingcards.views.renderers.FastJSONRenderer',
             'rest_framework.renderers.BrowsableAPIRenderer',
         ),
         'DEFAULT_PERMISSION_CLASSES': [
@@ -31,7 +31,14 @@ class Local(Common):
         'default': {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR + "/test.sqlite",
-        }
+        },
+        # the same database, so that the read replica routing is run locally
+        # and in the tests
+        'replica': {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR + "/test.sqlite",
+            'TEST': {'MIRROR': 'default'},
+        },
     }
 
     # Static files (CSS, JavaScript, Images)
@@ -1,4 +1,7 @@
 import os
+
+from django.core.exceptions import ImproperlyConfigured
+
 from .common import Common
 
 
@@ -31,6 +34,8 @@ class Production(Common):
     AWS_AUTO_CREATE_BUCKET = True
     AWS_QUERYSTRING_AUTH = False
     MEDIA_URL = f'https://s3.amazonaws.com/{AWS_STORAGE_BUCKET_NAME}/'
+    # downloads are redirected to pre-signed urls, rather than proxied
+    FILE_SERVING_BACKEND = os.getenv('FILE_SERVING_BACKEND', 'presigned')
 
     # https://developers.google.com/web/fundamentals/performance/optimizing-content-efficiency/http-caching#cache-control
     # Response can be cached by browser and any intermediary caches (i.e. it is "public") for up to 1 day
@@ -50,5 +55,46 @@ class Production(Common):
             'PASSWORD': os.getenv('DJANGO_DB_PASSWORD'),
             'HOST': os.getenv('DJANGO_DB_HOST'),
             'PORT': os.getenv('DJANGO_DB_PORT'),
+            # connections are kept open between requests and tasks for this
+            # many seconds, and checked before they are reused, rather than
+            # opened for each request
+            'CONN_MAX_AGE': int(os.getenv('DJANGO_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
         },
     }
+    # an optional read only replica of the primary, see db_router
+    if os.getenv('DJANGO_DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.getenv('DJANGO_DB_REPLICA_NAME',
+                              DATABASES['default']['NAME']),
+            'USER': os.getenv('DJANGO_DB_REPLICA_USER',
+                              DATABASES['default']['USER']),
+            'PASSWORD': os.getenv('DJANGO_DB_REPLICA_PASSWORD',
+                                  DATABASES['default']['PASSWORD']),
+            'HOST': os.getenv('DJANGO_DB_REPLICA_HOST'),
+            'PORT': os.getenv('DJANGO_DB_REPLICA_PORT',
+                              DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+    # the cache backends which are not shared between processes
+    PER_PROCESS_CACHE_BACKENDS = (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    )
+
+    @classmethod
+    def post_setup(cls):
+        super().post_setup()
+        # the pins of the clients which wrote to the primary are kept in the
+        # cache. In a per process cache, the next request of a client, which
+        # is likely served by another worker, does not see the pin, and reads
+        # the replica before its writes are replicated
+        if cls.READ_REPLICA_ALIAS in cls.DATABASES and \
+                cls.CACHES['default']['BACKEND'] in \
+                cls.PER_PROCESS_CACHE_BACKENDS:
+            raise ImproperlyConfigured(
+                'The read replica requires a cache which is shared between '
+                'the processes. Set DJANGO_REDIS_URL with '
+                'DJANGO_DB_REPLICA_HOST')
@@ -1,6 +1,8 @@
+import copy
+import re
+
 from django.conf import settings
 from django.urls import path, re_path, include, reverse_lazy
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.views.generic.base import RedirectView
 from rest_framework.routers import DefaultRouter
@@ -33,10 +35,22 @@ from .callingcards.views import (ChrMapViewSet,
                                  QcR1ToR2TfSummaryViewSet,
                                  QcReviewViewSet,
                                  ExpressionViewSet,
-                                 TaskStatusViewSet)
+                                 TaskStatusViewSet,
+                                 BatchViewSet,
+                                 AsyncCallingCardsView,
+                                 AsyncQbedView,
+                                 MediaFileView)
+
 
+class Router(DefaultRouter):
+    """DefaultRouter which also maps `PATCH` on a list endpoint to the
+    viewset's `bulk_partial_update`, if it has one. See
+    :class:`~callingcards.callingcards.views.mixins.UpdateModifiedMixin`"""
+    routes = copy.deepcopy(DefaultRouter.routes)
+    routes[0].mapping['patch'] = 'bulk_partial_update'
 
-router = DefaultRouter()
+
+router = Router()
 router.register(r'users',
                 UserViewSet)
 router.register(r'users',
@@ -113,11 +127,21 @@ router.register(r'expression',
 router.register(r'check_task_status',
                 TaskStatusViewSet,
                 basename='checktaskstatus')
+router.register(r'batch',
+                BatchViewSet,
+                basename='batch')
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include(router.urls)),
+    # async versions of the downloads, see AsyncDownloadViews
+    path('api/v1/async/promoterregions/callingcards/',
+         AsyncCallingCardsView.as_view(),
+         name='async-promoterregions-callingcards'),
+    path('api/v1/async/hops_s3/<int:pk>/qbed/',
+         AsyncQbedView.as_view(),
+         name='async-hopss3-qbed'),
     path('api-token-auth/', views.obtain_auth_token),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     # the 'api-root' from django rest-frameworks default router
@@ -129,4 +153,11 @@ urlpatterns = [
          SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# files stored on the file system are served to authenticated users. On S3,
+# MEDIA_URL is the url of the bucket
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns.append(
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$',
+                MediaFileView.as_view(), name='media'))